@@ -0,0 +1,130 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from services.content_service import UnsafeContentError
+from services.job_queue import Job
+from utils.errors import InvalidRequestError, ProviderError
+from utils.quota_store import QuotaExceededError
+
+
+class ContentAPIClient:
+    """
+    Thin HTTP client for api.server with the same surface as ContentService
+    and the submit/get/wait surface of JobQueue.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 180.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        if response.status_code == 200:
+            return response.json()
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        if response.status_code == 422 and isinstance(detail, str):
+            raise UnsafeContentError(detail)
+        if response.status_code == 429:
+            raise QuotaExceededError(detail)
+        if response.status_code == 400:
+            raise InvalidRequestError(detail)
+        if response.status_code in (502, 503):
+            raise ProviderError(detail, retryable=response.status_code == 503)
+        raise RuntimeError(f"API error {response.status_code}: {detail}")
+
+    def generate(self, platform: str, theme: str, audience: str, tone: str,
+                 profile: Optional[str] = None, model: Optional[str] = None, news: bool = False) -> Dict[str, Any]:
+        return self._request("POST", "/v1/content", json={
+            "platform": platform, "theme": theme, "audience": audience,
+            "tone": tone, "profile": profile, "model": model, "news": news
+        })
+
+    def generate_structured(self, platform: str, theme: str, audience: str, tone: str,
+                            profile: Optional[str] = None, model: Optional[str] = None,
+                            news: bool = False) -> Dict[str, Any]:
+        return self._request("POST", "/v1/content", json={
+            "platform": platform, "theme": theme, "audience": audience,
+            "tone": tone, "profile": profile, "model": model, "structured": True, "news": news
+        })
+
+    def generate_sections(self, platform: str, theme: str, audience: str, tone: str,
+                          profile: Optional[str] = None, model: Optional[str] = None,
+                          refresh: bool = False) -> Dict[str, Any]:
+        return self._request("POST", "/v1/content", json={
+            "platform": platform, "theme": theme, "audience": audience,
+            "tone": tone, "profile": profile, "model": model, "sectioned": True, "refresh": refresh
+        })
+
+    def generate_variants(self, platform: str, theme: str, audience: str, tones: List[str],
+                          profile: Optional[str] = None, model: Optional[str] = None,
+                          news: bool = False) -> Dict[str, Any]:
+        return self._request("POST", "/v1/content/variants", json={
+            "platform": platform, "theme": theme, "audience": audience,
+            "tones": tones, "profile": profile, "model": model, "news": news
+        })
+
+    def generate_image(self, prompt: str, dimensions: Tuple[int, int] = (512, 512),
+                       negative_prompt: str = "") -> Optional[str]:
+        return self._request("POST", "/v1/image", json={
+            "prompt": prompt, "width": dimensions[0], "height": dimensions[1],
+            "negative_prompt": negative_prompt
+        })["image_base64"]
+
+    def translate_content(self, content: str, target_language: str) -> str:
+        return self._request("POST", "/v1/translate", json={
+            "content": content, "target_language": target_language
+        })["content"]
+
+    def scientific(self, query: str, max_papers: int = 5, retrieval: Optional[str] = None,
+                   k: Optional[int] = None) -> Dict[str, str]:
+        return self._request("POST", "/v1/scientific", json={
+            "query": query, "max_papers": max_papers, "retrieval": retrieval, "k": k
+        })
+
+    def market_news(self) -> Dict[str, Any]:
+        return self._request("GET", "/v1/financial/news")
+
+    def market_sentiment(self, query: str = "") -> Dict[str, Any]:
+        return self._request("GET", "/v1/financial/sentiment", params={"query": query})
+
+    def get_all_profiles(self) -> List[str]:
+        return self._request("GET", "/v1/profiles")["profiles"]
+
+    def submit(self, kind: str, params: Dict[str, Any], idempotency_key: Optional[str] = None,
+               regenerate: bool = False) -> Job:
+        return Job(**self._request("POST", "/v1/jobs", json={
+            "kind": kind, "params": params, "idempotency_key": idempotency_key, "regenerate": regenerate
+        }))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        try:
+            return Job(**self._request("GET", f"/v1/jobs/{job_id}"))
+        except RuntimeError:
+            return None
+
+    def export(self, job_ids: List[str], path: str) -> int:
+        """Downloads a ZIP export of finished jobs to `path` and returns its size"""
+        response = self.session.get(f"{self.base_url}/v1/export", params={"job_id": job_ids},
+                                    timeout=self.timeout, stream=True)
+        if response.status_code != 200:
+            raise RuntimeError(f"API error {response.status_code}: {response.text}")
+        written = 0
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+                written += len(chunk)
+        return written
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll_interval: float = 0.5) -> Optional[Job]:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            job = self.get(job_id)
+            if job is None or job.done or (deadline is not None and time.monotonic() >= deadline):
+                return job
+            time.sleep(poll_interval)
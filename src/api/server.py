@@ -0,0 +1,427 @@
+"""
+HTTP API for content generation, separate from the Streamlit UI.
+
+Run from `src/` with:
+    uvicorn api.server:app --host 0.0.0.0 --port 8000
+Several server processes can run behind a load balancer; each one drains its
+own bounded worker pool.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from services.content_service import (UnsafeContentError, NON_RETRYABLE_ERRORS, content_job_handlers,
+                                      content_service_from_env)
+from services.job_queue import JobWorker, job_queue_from_env
+from trackers.metrics import configure_from_env, registry, tracer
+from utils.errors import InvalidRequestError, ProviderError
+from utils.quota_store import QuotaExceededError
+from utils.singleflight import AsyncSingleFlight, flight_key
+from utils.zip_export import export_jobs
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """
+    Bounded thread pool for blocking generation calls.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more wait;
+    beyond that requests are rejected immediately instead of piling up. A
+    slot is held until the job's thread actually finishes, also after the
+    request timed out, so timeouts cannot unbound the pool. Jobs run in a
+    copy of the caller's context, so their spans nest under the request span.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 16, timeout: float = 120.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api-worker")
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self._accepting = True
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if not self._accepting:
+            raise HTTPException(status_code=503, detail="Server is shutting down")
+        if self._slots.locked():
+            registry.inc("api_rejected_total", 1, {"reason": "queue_full"}, help="Requests rejected by the API")
+            raise HTTPException(status_code=503, detail="Too many pending requests, retry later")
+        await self._slots.acquire()
+        self._inflight += 1
+        self._idle.clear()
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        try:
+            job = self._executor.submit(context.run, partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        job.add_done_callback(lambda _: self._release_from_thread(loop))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job), self.timeout)
+        except asyncio.TimeoutError:
+            registry.inc("api_rejected_total", 1, {"reason": "timeout"}, help="Requests rejected by the API")
+            raise HTTPException(status_code=504, detail="Generation timed out")
+
+    def _release_from_thread(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass  # event loop already closed at shutdown
+
+    def _release(self):
+        self._slots.release()
+        self._inflight -= 1
+        if self._inflight == 0:
+            self._idle.set()
+
+    async def shutdown(self, grace_period: float = 30.0):
+        """Stops accepting work and waits for in-flight jobs before closing the pool"""
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._idle.wait(), grace_period)
+        except asyncio.TimeoutError:
+            logger.warning(f"Shutting down with {self._inflight} requests still running")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ContentRequest(BaseModel):
+    platform: str
+    theme: str
+    audience: str
+    tone: str = "Professional"
+    profile: Optional[str] = None
+    model: Optional[str] = None
+    structured: bool = False
+    sectioned: bool = False
+    news: bool = False
+    refresh: bool = False  # sectioned only: write every part again instead of reusing cached ones
+
+
+class VariantsRequest(BaseModel):
+    platform: str
+    theme: str
+    audience: str
+    tones: List[str]
+    profile: Optional[str] = None
+    model: Optional[str] = None
+    news: bool = False
+
+
+class ImageRequest(BaseModel):
+    prompt: str
+    width: int = 512
+    height: int = 512
+    negative_prompt: str = ""
+    cached: bool = False  # reuse a recent image for the same parameters instead of generating a new one
+
+
+class TranslationRequest(BaseModel):
+    content: str
+    target_language: str
+
+
+class ScientificRequest(BaseModel):
+    query: str
+    max_papers: int = 5
+    retrieval: Optional[str] = None  # hybrid, lexical, dense or auto
+    k: Optional[int] = None
+
+
+class JobRequest(BaseModel):
+    kind: str = "content"
+    params: Dict[str, Any]
+    idempotency_key: Optional[str] = None
+    regenerate: bool = False  # run again even if a finished job has the same key
+
+
+class Services:
+    """Lazily built, process-wide service instances"""
+
+    def __init__(self):
+        self.content = content_service_from_env()
+        # Profile or template edits start a new job instead of returning the old post
+        self.jobs = job_queue_from_env(versioner=self.content.job_version)
+        self._language = None
+        self._scientific = None
+        self._financial = None
+
+    @property
+    def image(self):
+        if self.content.image_generator is None:
+            raise HTTPException(status_code=503, detail="Image generation is not configured")
+        return self.content.image_generator
+
+    @property
+    def language(self):
+        if self._language is None:
+            from services.language_service import LanguageService
+            self._language = LanguageService()
+        return self._language
+
+    @property
+    def scientific(self):
+        if self._scientific is None:
+            from services.scientific_content_service import ScientificContentService
+            self._scientific = ScientificContentService(api_token=os.getenv("HUGGINGFACEHUB_API_TOKEN"))
+        return self._scientific
+
+    @property
+    def financial(self):
+        if self._financial is None:
+            api_key = os.getenv("ALPHA_VANTAGE_API_KEY")
+            if not api_key:
+                raise HTTPException(status_code=503, detail="Financial news is not configured")
+            from services.financial_news_service import FinancialNewsService
+            self._financial = FinancialNewsService(alpha_vantage_key=api_key)
+        return self._financial
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_from_env()
+    app.state.services = Services()
+    app.state.pool = WorkerPool(
+        max_workers=int(os.getenv("API_WORKERS", "4")),
+        max_queue=int(os.getenv("API_MAX_QUEUE", "16")),
+        timeout=float(os.getenv("API_TIMEOUT", "120"))
+    )
+    # Job workers drain the durable queue; more can run as separate processes
+    stop_workers = threading.Event()
+    for _ in range(int(os.getenv("API_JOB_WORKERS", "2"))):
+        worker = JobWorker(app.state.services.jobs, content_job_handlers(app.state.services.content),
+                           non_retryable=NON_RETRYABLE_ERRORS)
+        threading.Thread(target=worker.run_forever, args=(stop_workers,), daemon=True).start()
+    yield
+    stop_workers.set()
+    await app.state.pool.shutdown(float(os.getenv("API_SHUTDOWN_GRACE", "30")))
+
+
+app = FastAPI(title="Digital Content Generator API", lifespan=lifespan)
+
+# Identical requests arriving together take one worker slot and one upstream call
+content_flight = AsyncSingleFlight("api.content")
+image_flight = AsyncSingleFlight("api.image")
+
+
+def _context(request: Request) -> Tuple[Services, WorkerPool]:
+    return request.app.state.services, request.app.state.pool
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return registry.render_prometheus()
+
+
+def _request_error(e: Exception) -> HTTPException:
+    """
+    400 for invalid requests; provider failures get 503 (retry later) or 502,
+    as does any other ValueError, which comes from an unusable upstream answer
+    """
+    if isinstance(e, InvalidRequestError):
+        return HTTPException(status_code=400, detail=str(e))
+    logger.warning(f"Upstream failure: {e}")
+    return HTTPException(status_code=getattr(e, "status_code", 502), detail=str(e))
+
+
+@app.get("/v1/platforms")
+async def platforms(request: Request):
+    services, _ = _context(request)
+    return {"platforms": services.content.prompt_manager.get_all_platforms()}
+
+
+@app.get("/v1/profiles")
+async def profiles(request: Request):
+    services, _ = _context(request)
+    return {"profiles": services.content.profile_manager.get_all_profiles()}
+
+
+@app.post("/v1/content")
+async def generate_content(body: ContentRequest, request: Request):
+    services, pool = _context(request)
+    with tracer.span("api.content", platform=body.platform):
+        if body.structured and body.sectioned:
+            raise HTTPException(status_code=400,
+                                detail="Choose either structured output or section-by-section generation")
+        key = flight_key(body.platform, body.theme, body.audience, body.tone, body.profile, body.model,
+                         body.structured, body.sectioned, body.news, body.refresh)
+        if body.sectioned and not body.news:
+            generate = partial(services.content.generate_sections, refresh=body.refresh)
+        elif body.structured:
+            generate = partial(services.content.generate_structured, news=body.news)
+        else:
+            generate = partial(services.content.generate, news=body.news)
+        try:
+            result, _ = await content_flight.do(key, pool.run, generate, body.platform,
+                                                body.theme, body.audience, body.tone, body.profile, body.model)
+            return result
+        except UnsafeContentError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except QuotaExceededError as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        except (ValueError, ProviderError) as e:
+            raise _request_error(e)
+
+
+@app.post("/v1/content/variants")
+async def generate_variants(body: VariantsRequest, request: Request):
+    services, pool = _context(request)
+    with tracer.span("api.content.variants", platform=body.platform, variants=len(body.tones)):
+        try:
+            return await pool.run(services.content.generate_variants, body.platform, body.theme,
+                                  body.audience, body.tones, body.profile, body.model, body.news)
+        except UnsafeContentError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except QuotaExceededError as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        except (ValueError, ProviderError) as e:
+            raise _request_error(e)
+
+
+@app.post("/v1/image")
+async def generate_image(body: ImageRequest, request: Request):
+    services, pool = _context(request)
+    image_gen = services.image
+    key = flight_key(body.prompt, body.width, body.height, body.negative_prompt, body.cached)
+    try:
+        image_base64, _ = await image_flight.do(key, pool.run, image_gen.generate_image, body.prompt,
+                                                (body.width, body.height), body.negative_prompt, body.cached)
+    except (ValueError, ProviderError) as e:
+        raise _request_error(e)
+    if not image_base64:
+        raise HTTPException(status_code=502, detail="Could not generate image")
+    return {"image_base64": image_base64}
+
+
+@app.post("/v1/translate")
+async def translate(body: TranslationRequest, request: Request):
+    services, pool = _context(request)
+    try:
+        content = await pool.run(services.language.translate_content, body.content, body.target_language)
+    except (ValueError, ProviderError) as e:
+        raise _request_error(e)
+    return {"content": content, "target_language": body.target_language}
+
+
+@app.post("/v1/scientific")
+async def scientific(body: ScientificRequest, request: Request):
+    services, pool = _context(request)
+
+    def run():
+        service = services.scientific
+        documents = service.fetch_arxiv_papers(body.query, body.max_papers)
+        index = service.process_documents(documents)
+        response = service.generate_content(body.query, index, mode=body.retrieval, k=body.k)
+        return {"answer": response.get("answer", ""), "sources": response.get("sources", "")}
+
+    try:
+        return await pool.run(run)
+    except (ValueError, ProviderError) as e:
+        raise _request_error(e)
+
+
+@app.get("/v1/financial/news")
+async def financial_news(request: Request):
+    services, pool = _context(request)
+    financial = services.financial
+    return await pool.run(financial.get_market_news)
+
+
+@app.get("/v1/financial/sentiment")
+async def financial_sentiment(request: Request, query: str = ""):
+    services, pool = _context(request)
+    pipeline = services.content.news_pipeline
+    if pipeline is None:
+        raise HTTPException(status_code=503, detail="Financial news is not configured")
+
+    def run():
+        context = pipeline.context_block(query)
+        return {"snapshot": pipeline.snapshot().to_dict(), "context": context}
+
+    return await pool.run(run)
+
+
+@app.post("/v1/jobs")
+async def submit_job(body: JobRequest, request: Request):
+    services, _ = _context(request)
+    kinds = content_job_handlers(services.content)
+    if body.kind not in kinds:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind '{body.kind}'; use one of {', '.join(kinds)}")
+    # SQLite calls run in the default executor: cheap, and they must not take generation slots
+    job = await asyncio.to_thread(services.jobs.submit, body.kind, body.params, body.idempotency_key,
+                                  body.regenerate)
+    return job.to_dict()
+
+
+@app.get("/v1/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    services, _ = _context(request)
+    job = await asyncio.to_thread(services.jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/v1/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, poll_interval: float = 0.5):
+    """Streams job state changes as server-sent events until the job finishes"""
+    services, _ = _context(request)
+    if await asyncio.to_thread(services.jobs.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_seen = None
+        while not await request.is_disconnected():
+            job = await asyncio.to_thread(services.jobs.get, job_id)
+            if job is None:
+                yield f"event: deleted\ndata: {json.dumps({'id': job_id})}\n\n"
+                return
+            if (job.state, job.updated_at) != last_seen:
+                last_seen = (job.state, job.updated_at)
+                yield f"event: {job.state}\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+            if job.done:
+                return
+            await asyncio.sleep(poll_interval)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/v1/export")
+async def export(request: Request, job_ids: List[str] = Query(..., alias="job_id")):
+    """Streams a ZIP with the content and images of finished jobs"""
+    services, _ = _context(request)
+    # One thread for all the SQLite lookups, off the event loop
+    jobs = await asyncio.to_thread(lambda: [services.jobs.get(job_id) for job_id in job_ids])
+    missing = [job_id for job_id, job in zip(job_ids, jobs) if job is None or not job.done]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Jobs not found or not finished: {', '.join(missing)}")
+    # Iterated in the threadpool, so entries are encoded without blocking the loop
+    return StreamingResponse(iter(export_jobs(jobs)), media_type="application/zip",
+                             headers={"Content-Disposition": 'attachment; filename="content_export.zip"'})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "8000")),
+                timeout_graceful_shutdown=int(os.getenv("API_SHUTDOWN_GRACE", "30")))
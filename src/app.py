@@ -1,14 +1,20 @@
 import streamlit as st
-from generators.image_generator import ImageGenerator
 from utils.company_profile import ProfileManager, CompanyProfile
 from utils.prompt_manager import PromptManager
 import os
 from dotenv import load_dotenv
 import base64
-from io import BytesIO
-import zipfile
-from generators.llm_handler import LLMManager, GroqProvider
-from utils.content_safety import safety_check_middleware
+import json
+import tempfile
+import threading
+from services.content_service import ContentService, NON_RETRYABLE_ERRORS, content_job_handlers, content_service_from_env
+from services.job_queue import JobWorker, FAILED, job_queue_from_env
+from api.client import ContentAPIClient
+from trackers.metrics import configure_from_env
+from utils.zip_export import ZipStream
+from utils.artifact_store import Artifact, ArtifactStore
+from services.content_calendar import ContentCalendar, READY, scheduler_from_env
+from datetime import datetime, time as dt_time
 
 
 # Page configuration
@@ -19,28 +25,91 @@ st.set_page_config(
 )
 
 # Initialize session state if not exists
-if 'generated_content' not in st.session_state:
-    st.session_state.generated_content = None
-if 'generated_image' not in st.session_state:
-    st.session_state.generated_image = None
+if 'current_result' not in st.session_state:
+    # Handles to the artifacts of the last finished job, not the content itself
+    st.session_state.current_result = None
 if 'profile_saved' not in st.session_state:
     st.session_state.profile_saved = False
+if 'current_job' not in st.session_state:
+    st.session_state.current_job = None
+if 'last_request' not in st.session_state:
+    # (kind, params) of the last submitted job, for "Regenerate"
+    st.session_state.last_request = None
 
 # Load environment variables
 load_dotenv()
 
+# Metrics endpoint and trace exporters (no-op unless configured)
+configure_from_env()
+
 # Initialize managers
-llm_manager = LLMManager()
-groq_provider = llm_manager.get_provider("Groq-Mixtral-8x7b-32768")
-generator = groq_provider.get_llm()
+@st.cache_resource
+def get_profile_manager() -> ProfileManager:
+    # Shared across reruns and sessions so the profile cache stays warm
+    return ProfileManager()
+
+profile_manager = get_profile_manager()
+
+@st.cache_resource
+def get_prompt_manager() -> PromptManager:
+    # Compiled templates and rendered prefixes are reused across reruns
+    return PromptManager()
 
-profile_manager = ProfileManager()
-prompt_manager = PromptManager()
+prompt_manager = get_prompt_manager()
 
 # Stability AI configuration
 stability_api_key = os.getenv("STABILITY_API_KEY")
 st.sidebar.write("STABILITY_API_KEY present:", "Yes" if stability_api_key else "No")
-image_gen = ImageGenerator(api_key=stability_api_key) if stability_api_key else None
+
+# Seconds a rerun waits for its job before showing it as still running
+JOB_WAIT_TIMEOUT = float(os.getenv("JOB_WAIT_TIMEOUT", "120"))
+
+@st.cache_resource
+def get_content_service() -> ContentService:
+    # Configured like the API and the job workers (quota, images, semantic cache, news)
+    return content_service_from_env(prompt_manager=prompt_manager, profile_manager=profile_manager)
+
+@st.cache_resource
+def get_job_backend():
+    # With CONTENT_API_URL set, jobs run on the API server (api/server.py)
+    api_url = os.getenv("CONTENT_API_URL")
+    if api_url:
+        return ContentAPIClient(api_url)
+    content_service = get_content_service()
+    # Profile or template edits start a new job instead of returning the old post
+    job_queue = job_queue_from_env(versioner=content_service.job_version)
+    # JOB_WORKERS=0 leaves the queue to external `python -m services.job_queue` workers
+    for _ in range(int(os.getenv("JOB_WORKERS", "2"))):
+        worker = JobWorker(job_queue, content_job_handlers(content_service), non_retryable=NON_RETRYABLE_ERRORS)
+        threading.Thread(target=worker.run_forever, daemon=True).start()
+    return job_queue
+
+job_backend = get_job_backend()
+
+@st.cache_resource
+def get_artifact_store() -> ArtifactStore:
+    # Generated text and images live on disk; sessions only keep handles
+    return ArtifactStore(os.getenv("ARTIFACT_DIR", "artifacts"),
+                         max_bytes=int(os.getenv("ARTIFACT_CACHE_MB", "512")) * 1024 * 1024)
+
+artifact_store = get_artifact_store()
+
+@st.cache_resource
+def get_calendar_scheduler():
+    # Pre-generates calendar entries off-peak (CALENDAR_WINDOW); only with local generation
+    if isinstance(job_backend, ContentAPIClient):
+        return None
+    from services.language_service import LanguageService
+    scheduler = scheduler_from_env(get_content_service(), artifact_store, LanguageService(),
+                                   non_retryable=NON_RETRYABLE_ERRORS)
+    # CALENDAR_SCHEDULER=0 leaves pre-generation to `python -m services.content_calendar`
+    if os.getenv("CALENDAR_SCHEDULER", "1") != "0":
+        threading.Thread(target=scheduler.run_forever, daemon=True).start()
+    return scheduler
+
+calendar_scheduler = get_calendar_scheduler()
+image_available = bool(stability_api_key) or isinstance(job_backend, ContentAPIClient)
+news_available = bool(os.getenv("ALPHA_VANTAGE_API_KEY")) or isinstance(job_backend, ContentAPIClient)
 
 # Title and description
 st.title("🚀 Digital Content Generator")
@@ -123,10 +192,22 @@ with col1:
         help="Describe the main topic of your content"
     )
     
+    tone_options = ["Professional", "Casual", "Educational", "Inspiring", "Humorous"]
     tone = st.selectbox(
         "Communication Tone",
-        ["Professional", "Casual", "Educational", "Inspiring", "Humorous"]
+        tone_options
+    )
+
+    generate_variants = st.checkbox(
+        "Generate A/B tone variants",
+        help="Generate one variant per tone in a single request"
     )
+    if generate_variants:
+        variant_tones = st.multiselect(
+            "Variant Tones",
+            tone_options,
+            default=[tone]
+        )
 
 with col2:
     audience = st.text_input(
@@ -139,6 +220,25 @@ with col2:
         help="Generate an image related to the content"
     )
 
+    structured_output = st.checkbox(
+        "Structured output (JSON)",
+        help="Generate the post as validated JSON fields (tweets, sections, hashtags...)"
+    )
+
+    news_grounding = news_available and st.checkbox(
+        "Ground in recent market news",
+        help="Adds aggregated ticker and topic sentiment from recent financial news to the prompt"
+    )
+
+    # Structured output validates the whole article at once, so it turns section generation off
+    sectioned_output = platform == "Blog" and st.checkbox(
+        "Section-by-section generation",
+        value=False,
+        disabled=structured_output,
+        help="Write the article part by part; later edits only regenerate the parts they affect. "
+             "Not available with structured output."
+    ) and not structured_output
+
 # Additional configuration for image generation
 if generate_image:
     image_dimensions = st.selectbox(
@@ -158,171 +258,293 @@ if generate_image:
     }
     dimensions = dimensions_map[image_dimensions]
 
-    if not stability_api_key:
+    if not image_available:
         st.warning("⚠️ Stability AI API key not configured. Image generation will not be available.")
             
+def find_precomputed(profile, platform, theme, audience, tone, model, with_image: bool):
+    # A calendar entry for the same request and model that is still current and has what was asked for
+    if calendar_scheduler is None:
+        return None
+    entry = calendar_scheduler.calendar.find_ready(profile, platform, theme, audience, tone, model)
+    if entry is None or not calendar_scheduler.is_current(entry):
+        return None
+    if with_image and "image" not in entry.result:
+        return None
+    return entry
+
+# Content calendar: posts planned ahead are generated off-peak
+if calendar_scheduler is not None:
+    with st.expander("📅 Content Calendar"):
+        with st.form("calendar_entry"):
+            entry_theme = st.text_input("Theme")
+            entry_audience = st.text_input("Audience")
+            entry_col1, entry_col2 = st.columns(2)
+            with entry_col1:
+                entry_tone = st.selectbox("Tone", tone_options)
+                entry_date = st.date_input("Publish Date")
+                entry_time = st.time_input("Publish Time", dt_time(9, 0))
+            with entry_col2:
+                entry_language = st.selectbox("Translate To", ["None", "es", "en", "fr", "it"])
+                entry_image = st.checkbox("Generate image")
+            if st.form_submit_button("Add to Calendar"):
+                if entry_theme and entry_audience:
+                    calendar_scheduler.calendar.add(
+                        platform=platform,
+                        theme=entry_theme,
+                        audience=entry_audience,
+                        tone=entry_tone,
+                        publish_at=datetime.combine(entry_date, entry_time).timestamp(),
+                        profile=selected_profile if selected_profile != "None" else None,
+                        target_language=entry_language if entry_language != "None" else None,
+                        image_prompt=(f"Create a professional and modern image that represents: {entry_theme}"
+                                      if entry_image else None),
+                        model=model
+                    )
+                else:
+                    st.error("Please complete all required fields")
+
+        for entry in calendar_scheduler.calendar.upcoming():
+            entry_col1, entry_col2 = st.columns([4, 1])
+            with entry_col1:
+                publish_date = datetime.fromtimestamp(entry.publish_at).strftime("%Y-%m-%d %H:%M")
+                state = entry.state
+                if state == READY and not calendar_scheduler.is_current(entry):
+                    state = "outdated"
+                st.markdown(f"**{publish_date}** · {entry.platform} · {entry.theme} · _{state}_")
+                if entry.error:
+                    st.caption(f"❌ {entry.error}")
+            with entry_col2:
+                if state == READY and st.button("Open", key=f"calendar_{entry.id}"):
+                    st.session_state.current_result = entry.result
+                    st.session_state.current_job = None
+
 # Generation button
 if st.button("🎯 Generate Content", type="primary"):
     if theme and audience:
-        
-        with st.spinner("✨ Generating personalized content..."):
-            try:
-                # FIRST SAFETY CHECK - Before any content generation
-                initial_safety_check = safety_check_middleware(theme, platform, "")
-                if not initial_safety_check['is_safe']:
-                    st.error(initial_safety_check['message'])
-                    st.stop()
-
-                # Update generator model
-                generator.model = model
-                
-                # Get template for selected platform
-                platform_template = prompt_manager.get_template(platform)
-                
-                if not platform_template:
-                    st.error(f"No template found for platform {platform}")
-                    st.stop()
-                
-                # Prepare template parameters
-                template_params = {
-                    "tema": theme,
-                    "audiencia": audience,
-                    "tono": tone
-                }
-                
-                # Validate required parameters
-                if generator.validate_params(platform_template["params"], template_params):
-                    # Get template and add profile context if exists
-                    prompt_template = platform_template["template"]
-                    
-                    if selected_profile != "None":
-                        profile = profile_manager.load_profile(selected_profile)
-                        if profile:
-                            prompt_template += f"\n\nCompany Context:\n{profile.get_prompt_context()}"
-                    
-
-                    # Generate content
-                    result = generator.generate_content(
-                        prompt_template,
-                        template_params
-                    )
-
-                    # SECOND SAFETY CHECK - After content generation
-                    final_safety_check = safety_check_middleware(theme, platform, result)
-                    if not final_safety_check['is_safe']:
-                        st.error(final_safety_check['message'])
-                        st.stop()
-                    
-                    if result:
-                        st.success("Content generated successfully! 🎉")
-                        st.header(f"📊 Content for {platform}")
-                        # Save content in session_state
-                        st.session_state.generated_content = result
-                        st.markdown(result)
-                
-                    # Generate image if selected and configured
-                    if generate_image and image_gen:
-                        try:
-                            with st.spinner("🎨 Generating image..."):
-                                image_prompt = f"Create a professional and modern image that represents: {theme}"
-                                st.info("🔍 Image prompt: " + image_prompt)
-                                
-                                image_base64 = image_gen.generate_image(
-                                    prompt=image_prompt.strip(),
-                                    dimensions=dimensions,
-                                    negative_prompt=negative_prompt
-                                )
-                                
-                                if image_base64:
-                                    st.success("✨ Image generated successfully!")
-                                    # Decode base64 image
-                                    try:
-                                        image_data = base64.b64decode(image_base64)
-                                        # Save image in session_state
-                                        st.session_state.generated_image = image_data
-                                        st.image(BytesIO(image_data))
-                                        
-                                        # Create ZIP file with content and image
-                                        zip_buffer = BytesIO()
-                                        with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-                                            # Add text content
-                                            zip_file.writestr(
-                                                f"content_{platform.lower()}.txt",
-                                                st.session_state.generated_content
-                                            )
-                                            # Add image
-                                            zip_file.writestr(
-                                                f"image_{platform.lower()}.png",
-                                                st.session_state.generated_image
-                                            )
-                                        
-                                        # Download ZIP button
-                                        st.download_button(
-                                            label="📥 Download Content and Image",
-                                            data=zip_buffer.getvalue(),
-                                            file_name=f"content_{platform.lower()}_complete.zip",
-                                            mime="application/zip"
-                                        )
-                                        
-                                        # Individual download buttons
-                                        col1, col2 = st.columns(2)
-                                        with col1:
-                                            st.download_button(
-                                                label="📝 Download Text Only",
-                                                data=st.session_state.generated_content,
-                                                file_name=f"content_{platform.lower()}.txt",
-                                                mime="text/plain"
-                                            )
-                                        with col2:
-                                            st.download_button(
-                                                label="🖼️ Download Image Only",
-                                                data=st.session_state.generated_image,
-                                                file_name=f"image_{platform.lower()}.png",
-                                                mime="image/png"
-                                            )
-                                            
-                                    except Exception as e:
-                                        st.error(f"❌ Error processing image: {str(e)}")
-                                else:
-                                    st.error("❌ Could not generate image.")
-                                    # Show text download button if image failed
-                                    st.download_button(
-                                        label="📥 Download Content",
-                                        data=st.session_state.generated_content,
-                                        file_name=f"content_{platform.lower()}.txt",
-                                        mime="text/plain"
-                                    )
-                        except Exception as e:
-                            st.error(f"🚨 Image generation error: {str(e)}")
-                            # Show text download button if error occurred
-                            st.download_button(
-                                label="📥 Download Content",
-                                data=st.session_state.generated_content,
-                                file_name=f"content_{platform.lower()}.txt",
-                                mime="text/plain"
-                            )
-                    else:
-                        # If image not requested, show text download button
-                        st.download_button(
-                            label="📥 Download Content",
-                            data=st.session_state.generated_content,
-                            file_name=f"content_{platform.lower()}.txt",
-                            mime="text/plain"
-                        )
-                else:
-                    st.error("Missing required parameters for content generation")
-                    
-            except Exception as e:
-                st.error(f"Error generating content: {str(e)}")
+        image_request = None
+        if generate_image and image_available:
+            image_request = {
+                "prompt": f"Create a professional and modern image that represents: {theme}",
+                "dimensions": list(dimensions),
+                "negative_prompt": negative_prompt
+            }
+        precomputed = find_precomputed(
+            selected_profile if selected_profile != "None" else None, platform, theme, audience, tone, model,
+            with_image=image_request is not None
+        ) if not structured_output and not sectioned_output and not news_grounding else None
+        if generate_variants:
+            # All variants come from one model call; images are not generated for variants
+            request = ("variants", {
+                "platform": platform,
+                "theme": theme,
+                "audience": audience,
+                "tones": variant_tones or [tone],
+                "profile": selected_profile if selected_profile != "None" else None,
+                "model": model,
+                "news": news_grounding
+            })
+            st.session_state.current_job = job_backend.submit(*request).id
+            st.session_state.last_request = request
+        elif precomputed is not None:
+            # Pre-generated off-peak by the content calendar
+            st.session_state.current_result = precomputed.result
+            st.session_state.current_job = None
+            st.session_state.last_request = None
+        else:
+            # Identical requests attach to the existing job instead of generating again
+            request = ("content", {
+                "platform": platform,
+                "theme": theme,
+                "audience": audience,
+                "tone": tone,
+                "profile": selected_profile if selected_profile != "None" else None,
+                "model": model,
+                "image": image_request,
+                "structured": structured_output,
+                "sectioned": sectioned_output,
+                "news": news_grounding
+            })
+            st.session_state.current_job = job_backend.submit(*request).id
+            st.session_state.last_request = request
     else:
         st.warning("⚠️ Please complete all required fields.")
 
-# Display persistent content and image
-# if st.session_state.generated_content:
-#     st.markdown(st.session_state.generated_content)
-    
-# if st.session_state.generated_image:
-#     st.image(BytesIO(st.session_state.generated_image))        
+def store_job_result(job) -> dict:
+    """
+    Offloads a finished job's text, JSON and image to the artifact store.
+    Returns handles (plain dicts) small enough to keep in session state.
+    """
+    result = job.result
+    stored = {
+        "kind": job.kind,
+        "platform": job.params["platform"],
+        "image_prompt": (job.params.get("image") or {}).get("prompt"),
+        "image_error": result.get("image_error"),
+        "errors": result.get("errors", []),
+    }
+    if job.kind == "variants":
+        stored["variants"] = [
+            {"tone": variant["tone"], "content": artifact_store.put(variant["content"], ".txt").to_dict()}
+            if "content" in variant else variant
+            for variant in result["variants"]
+        ]
+        return stored
+    stored["content"] = artifact_store.put(result["content"] or "", ".txt").to_dict()
+    if "data" in result:
+        stored["data"] = artifact_store.put(json.dumps(result["data"], ensure_ascii=False, indent=2), ".json").to_dict()
+    if result.get("image_base64"):
+        stored["image"] = artifact_store.put(base64.b64decode(result["image_base64"]), ".png").to_dict()
+    return stored
+
+def result_expired(stored: dict) -> bool:
+    if "content" in stored:
+        handles = [stored["content"]]
+    else:
+        handles = [variant["content"] for variant in stored["variants"] if "content" in variant]
+    return any(artifact_store.path(Artifact(**handle)) is None for handle in handles)
+
+def render_artifact_download(label: str, handle: dict, file_name: str, mime: str, key: str = None):
+    # Served from disk; the file is only read when the page renders
+    artifact_file = artifact_store.open(Artifact(**handle))
+    if artifact_file is None:
+        return
+    with artifact_file:
+        st.download_button(label=label, data=artifact_file, file_name=file_name, mime=mime, key=key)
+
+def render_variants_result(stored: dict):
+    job_platform = stored["platform"]
+    st.success("Variants generated successfully! 🎉")
+    st.header(f"📊 Variants for {job_platform}")
+    tabs = st.tabs([variant["tone"] for variant in stored["variants"]])
+    for tab, variant in zip(tabs, stored["variants"]):
+        with tab:
+            if "content" not in variant:
+                st.error(f"❌ {variant['error']}")
+                continue
+            st.markdown(artifact_store.read_text(Artifact(**variant["content"])))
+            render_artifact_download(
+                "📥 Download Variant", variant["content"],
+                f"content_{job_platform.lower()}_{variant['tone'].lower()}.txt", "text/plain",
+                key=f"variant_{variant['tone']}"
+            )
+
+def render_job_result(stored: dict):
+    job_platform = stored["platform"]
+    content = artifact_store.read_text(Artifact(**stored["content"]))
+
+    if content:
+        st.success("Content generated successfully! 🎉")
+        st.header(f"📊 Content for {job_platform}")
+        st.markdown(content)
+
+    if "data" in stored:
+        for error in stored["errors"]:
+            st.warning(f"⚠️ Field still invalid after repairs: {error}")
+        with st.expander("🧩 Structured output"):
+            data_path = artifact_store.path(Artifact(**stored["data"]))
+            if data_path:
+                with open(data_path, "r", encoding="utf-8") as f:
+                    st.json(json.load(f))
+            render_artifact_download("📥 Download JSON", stored["data"],
+                                     f"content_{job_platform.lower()}.json", "application/json")
+
+    if "translation" in stored:
+        translation = artifact_store.read_text(Artifact(**stored["translation"]))
+        if translation:
+            with st.expander(f"🌐 Translation ({stored['target_language']})"):
+                st.markdown(translation)
+                render_artifact_download("📥 Download Translation", stored["translation"],
+                                         f"content_{job_platform.lower()}_{stored['target_language']}.txt",
+                                         "text/plain")
+
+    text_download = ("📥 Download Content", stored["content"], f"content_{job_platform.lower()}.txt", "text/plain")
+    if not stored["image_prompt"]:
+        # If image not requested, show text download button
+        render_artifact_download(*text_download)
+        return
+
+    st.info("🔍 Image prompt: " + stored["image_prompt"])
+    if "image" not in stored:
+        st.error(f"❌ Could not generate image: {stored['image_error'] or 'unknown error'}")
+        # Show text download button if image failed
+        render_artifact_download(*text_download)
+        return
+
+    image_path = artifact_store.path(Artifact(**stored["image"]))
+    content_path = artifact_store.path(Artifact(**stored["content"]))
+    if image_path is None or content_path is None:
+        st.warning("⚠️ The image has expired from the cache. Please generate it again.")
+        render_artifact_download(*text_download)
+        return
+
+    st.success("✨ Image generated successfully!")
+    st.image(image_path)
+
+    # The ZIP is only built on request; download buttons load their data on every rerun
+    zip_key = f"zip_ready_{stored['content']['id']}_{stored['image']['id']}"
+    if not st.session_state.get(zip_key):
+        if st.button("📦 Prepare Content and Image ZIP", key=f"prepare_{zip_key}"):
+            st.session_state[zip_key] = True
+            st.experimental_rerun()
+    else:
+        # Stream the ZIP from the stored files to a temporary file
+        archive = ZipStream()
+        archive.add_file(f"content_{job_platform.lower()}.txt", content_path)
+        archive.add_file(f"image_{job_platform.lower()}.png", image_path)
+        with tempfile.TemporaryFile() as zip_file:
+            archive.write_to(zip_file)
+            zip_file.seek(0)
+
+            # Download ZIP button
+            st.download_button(
+                label="📥 Download Content and Image",
+                data=zip_file,
+                file_name=f"content_{job_platform.lower()}_complete.zip",
+                mime="application/zip"
+            )
+
+    # Individual download buttons
+    col1, col2 = st.columns(2)
+    with col1:
+        render_artifact_download("📝 Download Text Only", stored["content"],
+                                 f"content_{job_platform.lower()}.txt", "text/plain")
+    with col2:
+        render_artifact_download("🖼️ Download Image Only", stored["image"],
+                                 f"image_{job_platform.lower()}.png", "image/png")
+
+# Attach to this session's job; it keeps running across reruns and disconnects
+if st.session_state.current_job:
+    with st.spinner("✨ Generating personalized content..."):
+        job = job_backend.wait(st.session_state.current_job, timeout=JOB_WAIT_TIMEOUT)
+    if job is None:
+        st.session_state.current_job = None
+    elif not job.done:
+        st.info("⏳ Still generating. The job keeps running in the background.")
+        st.button("🔄 Check again")
+    elif job.state == FAILED:
+        st.session_state.current_job = None
+        st.error(f"Error generating content: {job.error}")
+    else:
+        # From here on the session only keeps handles to the stored artifacts
+        st.session_state.current_result = store_job_result(job)
+        st.session_state.current_job = None
+
+stored_result = st.session_state.current_result
+if stored_result and not st.session_state.current_job:
+    if result_expired(stored_result):
+        st.warning("⚠️ This result has expired from the cache. Please generate it again.")
+        st.session_state.current_result = None
+    elif stored_result["kind"] == "variants":
+        render_variants_result(stored_result)
+    else:
+        render_job_result(stored_result)
+    if st.session_state.last_request and st.button("🔄 Regenerate"):
+        # Same request, but skip the stored result of the previous job and the cached Blog sections
+        kind, params = st.session_state.last_request
+        if kind == "content":
+            params = dict(params, refresh=True)
+        st.session_state.current_job = job_backend.submit(kind, params, regenerate=True).id
+        st.experimental_rerun()
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,219 @@
+"""
+Offline evaluation of providers and models on a fixed suite of cases.
+
+Replays every case of the suite against each target, recording latency,
+tokens per second and cost, and runs cheap checks: the platform
+constraints stated in the prompt templates and the safety check.
+
+From `src/`:
+    python -m evaluation.runner --targets groq:mixtral-8x7b-32768 ollama:mistral
+    python -m evaluation.runner --stub --targets groq:gemma-7b-it groq:mixtral-8x7b-32768 ollama:mistral
+`--stub` starts a local StubLLMServer and points every target at it.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.content_safety import safety_check_middleware
+from utils.prompt_manager import PromptManager
+from utils.quota_store import estimate_cost
+
+DEFAULT_SUITE = os.path.join(os.path.dirname(__file__), "suite.json")
+
+_HASHTAG = re.compile(r"#\w+")
+_TWEET_NUMBER = re.compile(r"^\s*(?:\d+\s*/\s*\d*|\d+[.)])\s*")
+
+
+@dataclass
+class EvalCase:
+    platform: str
+    theme: str
+    audience: str
+    tone: str
+
+
+def load_suite(path: str = DEFAULT_SUITE) -> List[EvalCase]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [EvalCase(**case) for case in json.load(f)]
+
+
+def make_target(spec: str, groq_base_url: Optional[str] = None, ollama_host: Optional[str] = None) -> Any:
+    """Builds a generator from "groq:<model>" or "ollama:<model>" """
+    provider, _, model = spec.partition(":")
+    if provider == "groq":
+        from generators.llm_handler import GroqProvider
+        api_key = os.getenv("GROQ_API_KEY") or ("stub" if groq_base_url else None)
+        return GroqProvider(api_key=api_key, model=model, base_url=groq_base_url).get_llm()
+    if provider == "ollama":
+        from generators.ollama_generator import OllamaGenerator
+        return OllamaGenerator(model=model, host=ollama_host or "http://localhost:11434")
+    raise ValueError(f"Unknown target {spec}, expected groq:<model> or ollama:<model>")
+
+
+def platform_constraints(prompt_manager: PromptManager, platform: str) -> Dict[str, Tuple[int, int]]:
+    """Reads the measurable requirements stated in a platform template"""
+    template_data = prompt_manager.get_template(platform)
+    template = template_data["template"]
+    constraints = {}
+    words = re.search(r"(\d+)-(\d+) words", template)
+    if words:
+        constraints["words"] = (int(words.group(1)), int(words.group(2)))
+    tweet_chars = re.search(r"Maximum (\d+) characters per tweet", template)
+    if tweet_chars:
+        constraints["tweet_chars"] = (1, int(tweet_chars.group(1)))
+    per_tweet = re.search(r"maximum (\d+)-(\d+) per tweet", template)
+    if per_tweet:
+        constraints["hashtags_per_tweet"] = (0, int(per_tweet.group(2)))
+    hashtags = re.search(r"(\d+)-(\d+) (?:[a-z]+ )*hashtags", template)
+    if hashtags and not per_tweet:
+        constraints["hashtags"] = (int(hashtags.group(1)), int(hashtags.group(2)))
+    chars = template_data.get("length", {}).get("chars")
+    if chars and not tweet_chars:
+        constraints["chars"] = (1, chars)
+    return constraints
+
+
+def split_tweets(content: str) -> List[str]:
+    return [_TWEET_NUMBER.sub("", block).strip() for block in re.split(r"\n\s*\n", content) if block.strip()]
+
+
+def check_constraints(content: str, constraints: Dict[str, Tuple[int, int]]) -> Dict[str, bool]:
+    """Returns pass/fail per constraint"""
+    def within(value, bounds):
+        return bounds[0] <= value <= bounds[1]
+
+    checks = {}
+    for name, bounds in constraints.items():
+        if name == "words":
+            checks[name] = within(len(re.findall(r"\b\w+\b", content)), bounds)
+        elif name == "chars":
+            checks[name] = within(len(content), bounds)
+        elif name == "hashtags":
+            checks[name] = within(len(_HASHTAG.findall(content)), bounds)
+        elif name == "tweet_chars":
+            checks[name] = all(within(len(tweet), bounds) for tweet in split_tweets(content))
+        elif name == "hashtags_per_tweet":
+            checks[name] = all(within(len(_HASHTAG.findall(tweet)), bounds) for tweet in split_tweets(content))
+    return checks
+
+
+def run_case(target: str, llm: Any, case: EvalCase, prompt_manager: PromptManager) -> Dict[str, Any]:
+    provider, _, model = target.partition(":")
+    result = {"target": target, **asdict(case)}
+    prompt_template = prompt_manager.compile(case.platform)
+    started = time.perf_counter()
+    try:
+        content = llm.generate_content(prompt_template, {"tema": case.theme, "audiencia": case.audience,
+                                                         "tono": case.tone}) or ""
+    except Exception as e:
+        result.update(error=str(e), latency=time.perf_counter() - started)
+        return result
+    latency = time.perf_counter() - started
+    usage = getattr(llm, "last_usage", None) or {}
+    prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    result.update(
+        latency=latency,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        tokens_per_second=completion_tokens / latency if latency > 0 else 0.0,
+        # Local models cost nothing, even when they share a name with a priced Groq model
+        cost=0.0 if provider == "ollama" else estimate_cost(model, prompt_tokens, completion_tokens),
+        checks=check_constraints(content, platform_constraints(prompt_manager, case.platform)),
+        safe=safety_check_middleware(case.theme, case.platform, content)["is_safe"],
+    )
+    return result
+
+
+def run(targets: Dict[str, Any], cases: List[EvalCase], repeats: int = 1) -> List[Dict[str, Any]]:
+    """Runs every case `repeats` times against every target, sequentially so latencies don't interfere"""
+    prompt_manager = PromptManager()
+    return [run_case(target, llm, case, prompt_manager)
+            for target, llm in targets.items() for _ in range(repeats) for case in cases]
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def summarize(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One row per target with latency, throughput, cost and pass rates"""
+    rows = []
+    for target in dict.fromkeys(result["target"] for result in results):
+        runs = [r for r in results if r["target"] == target]
+        ok = [r for r in runs if "error" not in r]
+        checks = [passed for r in ok for passed in r["checks"].values()]
+        per_check: Dict[str, List[bool]] = {}
+        for r in ok:
+            for name, passed in r["checks"].items():
+                per_check.setdefault(f"{r['platform']}.{name}", []).append(passed)
+        latencies = [r["latency"] for r in ok]
+        rows.append({
+            "target": target,
+            "runs": len(runs),
+            "errors": len(runs) - len(ok),
+            "latency_p50": _percentile(latencies, 0.5),
+            "latency_p95": _percentile(latencies, 0.95),
+            "tokens_per_second": statistics.mean(r["tokens_per_second"] for r in ok) if ok else 0.0,
+            "cost": sum(r["cost"] for r in ok),
+            "constraint_pass_rate": sum(checks) / len(checks) if checks else 0.0,
+            "safety_pass_rate": sum(r["safe"] for r in ok) / len(ok) if ok else 0.0,
+            "checks": {name: sum(values) / len(values) for name, values in sorted(per_check.items())},
+        })
+    return rows
+
+
+def render_report(rows: List[Dict[str, Any]]) -> str:
+    """Markdown comparison table, fastest target first, followed by per-check pass rates"""
+    rows = sorted(rows, key=lambda row: row["latency_p50"])
+    lines = [
+        "| Target | Runs | Errors | p50 (s) | p95 (s) | Tokens/s | Cost (USD) | Constraints | Safety |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for row in rows:
+        lines.append(f"| {row['target']} | {row['runs']} | {row['errors']} | {row['latency_p50']:.2f} | "
+                     f"{row['latency_p95']:.2f} | {row['tokens_per_second']:.1f} | {row['cost']:.4f} | "
+                     f"{row['constraint_pass_rate']:.0%} | {row['safety_pass_rate']:.0%} |")
+    check_names = sorted({name for row in rows for name in row["checks"]})
+    if check_names:
+        lines += ["", "| Check | " + " | ".join(row["target"] for row in rows) + " |",
+                  "|---|" + "---|" * len(rows)]
+        for name in check_names:
+            rates = [f"{row['checks'][name]:.0%}" if name in row["checks"] else "-" for row in rows]
+            lines.append(f"| {name} | " + " | ".join(rates) + " |")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare providers and models on a fixed suite")
+    parser.add_argument("--targets", nargs="+", required=True, help="groq:<model> or ollama:<model>")
+    parser.add_argument("--suite", default=DEFAULT_SUITE)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--stub", action="store_true", help="Run against a local stub server")
+    parser.add_argument("--out", help="Write raw results and the summary as JSON")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        from evaluation.stub_servers import StubLLMServer
+        # Relative speeds roughly in line with the hosted models, so the report has shape
+        stub = StubLLMServer(model_speeds={"gemma-7b-it": 900.0, "mixtral-8x7b-32768": 500.0,
+                                           "llama2-70b-4096": 250.0}).start()
+    try:
+        base_url = stub.url if stub else None
+        targets = {spec: make_target(spec, groq_base_url=base_url, ollama_host=base_url) for spec in args.targets}
+        results = run(targets, load_suite(args.suite), args.repeats)
+    finally:
+        if stub:
+            stub.stop()
+
+    summary = summarize(results)
+    print(render_report(summary))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "results": results}, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,135 @@
+"""
+Local stub LLM server for offline evaluation and tests.
+
+Speaks the subset of the Groq (OpenAI-style) chat completions API and the
+Ollama generate API used by the generators, and answers with
+platform-shaped text after a delay derived from a configurable
+tokens-per-second rate, so latency comparisons are meaningful offline.
+"""
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+from utils.prompt_manager import CHARS_PER_TOKEN, estimate_tokens
+
+# Neutral vocabulary, so the safety check judges the prompt and not the filler
+_WORDS = ["growth", "team", "data", "insight", "strategy", "product", "customer", "learning",
+          "value", "future", "impact", "idea", "quality", "trust", "design", "results"]
+
+
+def _sentence(seed: int, words: int) -> str:
+    text = " ".join(_WORDS[(seed * 7 + i * 3) % len(_WORDS)] for i in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def platform_responder(prompt: str, model: str) -> str:
+    """Default stub answer, shaped after the platform named in the prompt"""
+    if "Twitter thread" in prompt:
+        return "\n\n".join(f"{i}/7 {_sentence(i, 18)} #growth #data" for i in range(1, 8))
+    if "blog article" in prompt:
+        sections = [f"## Section {s}\n\n" + " ".join(_sentence(s * 10 + i, 12) for i in range(18))
+                    for s in range(1, 5)]
+        return "# Title\n\n" + "\n\n".join(sections) + "\n\n**Subscribe for more.**"
+    body = " ".join(_sentence(i, 14) for i in range(12))
+    if "LinkedIn post" in prompt:
+        return f"{body}\n\n#growth #data #strategy #learning"
+    if "Instagram post" in prompt:
+        return f"{body}\n\n" + " ".join(f"#{word}" for word in _WORDS[:9])
+    return body
+
+
+class StubLLMServer:
+    """
+    In-process HTTP server for POST /openai/v1/chat/completions (Groq)
+    and POST /api/generate (Ollama).
+
+    `model_speeds` sets tokens per second per model name; other models use
+    `tokens_per_second`. Use as a context manager or call start()/stop().
+    """
+
+    def __init__(self, tokens_per_second: float = 400.0, first_token_latency: float = 0.02,
+                 model_speeds: Optional[Dict[str, float]] = None,
+                 responder: Callable[[str, str], str] = platform_responder,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.tokens_per_second = tokens_per_second
+        self.first_token_latency = first_token_latency
+        self.model_speeds = model_speeds or {}
+        self.responder = responder
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.endswith("/chat/completions"):
+                    prompt = body["messages"][-1]["content"]
+                    payload = server._chat_completion(body, prompt)
+                elif self.path.endswith("/api/generate"):
+                    payload = server._ollama_generate(body)
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _complete(self, model: str, prompt: str, max_tokens: Optional[int]):
+        self.requests += 1
+        text = self.responder(prompt, model)
+        if max_tokens:
+            text = text[:math.floor(max_tokens * CHARS_PER_TOKEN)]
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        speed = self.model_speeds.get(model, self.tokens_per_second)
+        time.sleep(self.first_token_latency + completion_tokens / speed)
+        return text, prompt_tokens, completion_tokens
+
+    def _chat_completion(self, body: Dict, prompt: str) -> Dict:
+        text, prompt_tokens, completion_tokens = self._complete(body.get("model", ""), prompt,
+                                                                body.get("max_tokens"))
+        return {
+            "id": f"stub-{self.requests}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _ollama_generate(self, body: Dict) -> Dict:
+        max_tokens = (body.get("options") or {}).get("num_predict")
+        text, prompt_tokens, completion_tokens = self._complete(body.get("model", ""), body.get("prompt", ""),
+                                                                max_tokens)
+        return {"model": body.get("model", ""), "response": text, "done": True,
+                "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens}
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
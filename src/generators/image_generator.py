@@ -2,10 +2,18 @@ import base64
 import requests
 import logging
 from typing import Tuple, Optional
+from trackers.metrics import tracer, record_payload
+from utils.cache_backend import TieredCache, cache_key, shared_cache
+from utils.errors import InvalidRequestError, ProviderError
+from utils.singleflight import SingleFlight, flight_key
+
+_image_flight = SingleFlight("stability")
 
 class ImageGenerator:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cache: Optional[TieredCache] = None):
         self.api_key = api_key
+        # Imágenes recientes compartidas entre procesos (espacio "image"), solo con cached=True
+        self.cache = cache or shared_cache()
         self.api_host = "https://api.stability.ai"
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
@@ -41,10 +49,44 @@ class ImageGenerator:
         self, 
         prompt: str, 
         dimensions: Tuple[int, int] = (512, 512),
-        negative_prompt: str = ""
+        negative_prompt: str = "",
+        cached: bool = False
     ) -> Optional[str]:
         """
         Genera una imagen utilizando la API de Stability AI.
+        Las solicitudes idénticas simultáneas comparten una única llamada a la API.
+        Cada solicitud genera una imagen nueva salvo con `cached`, que sirve las
+        repetidas desde la caché compartida mientras no caduquen.
+        
+        Args:
+            prompt (str): Descripción de la imagen a generar
+            dimensions (Tuple[int, int]): Dimensiones de la imagen (ancho, alto)
+            negative_prompt (str): Prompt negativo para la generación
+            cached (bool): Reutilizar una imagen reciente generada con los mismos parámetros
+            
+        Returns:
+            Optional[str]: Imagen en formato base64 si es exitoso, None si falla
+        """
+        image_key = cache_key(prompt, tuple(dimensions), negative_prompt)
+        if cached:
+            image_base64 = self.cache.get("image", image_key)
+            if image_base64 is not None:
+                return image_base64
+        key = flight_key(self.api_key, prompt, tuple(dimensions), negative_prompt)
+        image_base64, _ = _image_flight.do(key, self._generate_image, prompt, tuple(dimensions), negative_prompt)
+        if image_base64:
+            # Se guarda siempre, así una solicitud posterior con cached=True la reutiliza
+            self.cache.set("image", image_key, image_base64)
+        return image_base64
+
+    def _generate_image(
+        self, 
+        prompt: str, 
+        dimensions: Tuple[int, int],
+        negative_prompt: str
+    ) -> Optional[str]:
+        """
+        Realiza la llamada a la API de Stability AI.
         
         Args:
             prompt (str): Descripción de la imagen a generar
@@ -66,7 +108,7 @@ class ImageGenerator:
             
             # Validar dimensiones permitidas
             if dimensions not in [(512, 512), (768, 512), (512, 768)]:
-                raise ValueError("Dimensiones no válidas")
+                raise InvalidRequestError("Dimensiones no válidas")
 
             engine_id = "stable-diffusion-v1-6"
             api_url = f"{self.api_host}/v1/generation/{engine_id}/text-to-image"
@@ -99,7 +141,10 @@ class ImageGenerator:
                 })
 
             self.logger.info("Enviando solicitud a la API...")
-            response = requests.post(api_url, headers=headers, json=payload)
+            with tracer.span("stability.generate_image", engine=engine_id,
+                             width=dimensions[0], height=dimensions[1]):
+                response = requests.post(api_url, headers=headers, json=payload)
+                record_payload("stability.generate_image", "response", len(response.content or b""))
             
             if response.status_code != 200:
                 self.logger.error(f"Error en la API: {response.status_code} - {response.text}")
@@ -117,6 +162,9 @@ class ImageGenerator:
             
             return image_base64
 
+        except requests.RequestException as e:
+            self.logger.error(f"Error durante la generación de imagen: {str(e)}")
+            raise ProviderError(f"Stability API no disponible: {str(e)}") from e
         except Exception as e:
             self.logger.error(f"Error durante la generación de imagen: {str(e)}")
             raise e
\ No newline at end of file
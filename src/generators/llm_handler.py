@@ -1,8 +1,14 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, Iterator, List, Any
 import os
+import threading
 from langchain_core.pydantic_v1 import BaseModel
 from groq import Groq
+from trackers.metrics import tracer, record_tokens, record_payload
+from utils.errors import ProviderError, retryable_status
+from utils.singleflight import SingleFlight, flight_key
+
+_groq_flight = SingleFlight("groq")
 
 
 class LLMProvider(ABC):
@@ -25,42 +31,108 @@ class GroqProvider(LLMProvider):
     def __init__(self, 
                  api_key: Optional[str] = None, 
                  model: str = "mixtral-8x7b-32768",
-                 temperature: float = 0.7):
+                 temperature: float = 0.7,
+                 max_tokens: Optional[int] = None,
+                 timeout: Optional[float] = 60.0,
+                 base_url: Optional[str] = None):
         self.api_key = api_key or os.getenv("GROQ_API_KEY")
+        # None uses the SDK default (or GROQ_BASE_URL); set to point at a proxy or stub server
+        self.base_url = base_url
         self.model = model
         self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
     
     def get_llm(self):
         if not self.api_key:
             raise ValueError("Groq API key required")
         
-        client = Groq(api_key=self.api_key)
+        client = Groq(api_key=self.api_key, base_url=self.base_url)
 
         class GroqLLM(BaseModel):
             client: Any
             model: str
             temperature: float
+            max_tokens: Optional[int] = None
+            timeout: Optional[float] = None
+            # Usage reported by the last call: {"prompt_tokens": ..., "completion_tokens": ...}
+            last_usage: Optional[Dict[str, int]] = None
+            
+            def _call(self, prompt: str, stop: Optional[List[str]] = None,
+                      max_tokens: Optional[int] = None, json_mode: bool = False) -> str:
+                max_tokens = max_tokens or self.max_tokens
+                # Concurrent identical requests share a single upstream call
+                key = flight_key(self.model, self.temperature, max_tokens, stop, json_mode, prompt)
+                (content, usage), shared = _groq_flight.do(key, self._request, prompt, stop, max_tokens, json_mode)
+                self.last_usage = {"prompt_tokens": 0, "completion_tokens": 0} if shared else usage
+                return content
+            
+            def _completion_args(self, prompt: str, stop: Optional[List[str]], max_tokens: Optional[int],
+                                 json_mode: bool) -> Dict[str, Any]:
+                args = dict(model=self.model, messages=[{"role": "user", "content": prompt}],
+                            temperature=self.temperature, max_tokens=max_tokens, stop=stop, timeout=self.timeout)
+                if json_mode:
+                    args["response_format"] = {"type": "json_object"}
+                return args
             
-            def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-                try:
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[{"role": "user", "content": prompt}],
-                        temperature=self.temperature,
-                        stop=stop
-                    )
-                    return response.choices[0].message.content
-                except Exception as e:
-                    raise ValueError(f"Groq API Error: {str(e)}")
+            def _request(self, prompt: str, stop: Optional[List[str]], max_tokens: Optional[int],
+                         json_mode: bool = False):
+                with tracer.span("groq.call", model=self.model, max_tokens=max_tokens or 0):
+                    record_payload("groq.call", "request", len(prompt.encode("utf-8")))
+                    try:
+                        response = self.client.chat.completions.create(
+                            **self._completion_args(prompt, stop, max_tokens, json_mode))
+                    except Exception as e:
+                        raise ProviderError(f"Groq API Error: {str(e)}",
+                                            retryable_status(getattr(e, "status_code", None))) from e
+                    usage = None
+                    if getattr(response, "usage", None) is not None:
+                        usage = {"prompt_tokens": response.usage.prompt_tokens,
+                                 "completion_tokens": response.usage.completion_tokens}
+                        record_tokens("groq", self.model, usage["prompt_tokens"], usage["completion_tokens"])
+                    content = response.choices[0].message.content
+                    record_payload("groq.call", "response", len((content or "").encode("utf-8")))
+                    return content, usage
+            
+            def stream_content(self, prompt_template: Any, template_params: Dict[str, str]) -> Iterator[str]:
+                """Yields the completion as it is generated; usage is set once the stream ends"""
+                if getattr(prompt_template, "json_mode", False):
+                    # Groq's JSON mode does not support streaming: one chunk from a regular call
+                    yield self.generate_content(prompt_template, template_params)
+                    return
+                prompt = prompt_template.format(**template_params)
+                max_tokens = getattr(prompt_template, "max_tokens", None) or self.max_tokens
+                self.last_usage = None
+                with tracer.span("groq.stream", model=self.model, max_tokens=max_tokens or 0):
+                    record_payload("groq.stream", "request", len(prompt.encode("utf-8")))
+                    try:
+                        stream = self.client.chat.completions.create(
+                            stream=True, **self._completion_args(prompt, None, max_tokens, False))
+                        for chunk in stream:
+                            # Groq reports usage on the last chunk under x_groq
+                            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+                            if usage is not None:
+                                self.last_usage = {"prompt_tokens": usage.prompt_tokens,
+                                                   "completion_tokens": usage.completion_tokens}
+                                record_tokens("groq", self.model, usage.prompt_tokens, usage.completion_tokens)
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                yield chunk.choices[0].delta.content
+                    except Exception as e:
+                        raise ProviderError(f"Groq API Error: {str(e)}",
+                                            retryable_status(getattr(e, "status_code", None))) from e
             
             def validate_params(self, required_params: List[str], provided_params: Dict[str, str]) -> bool:
                 return all(param in provided_params and provided_params[param].strip() for param in required_params)
             
-            def generate_content(self, prompt_template: str, template_params: Dict[str, str]) -> str:
+            def generate_content(self, prompt_template: Any, template_params: Dict[str, str]) -> str:
+                # prompt_template may be a raw string or a PromptManager BoundPrompt,
+                # whose platform token budget caps the completion length
                 formatted_prompt = prompt_template.format(**template_params)
-                return self._call(formatted_prompt)
+                return self._call(formatted_prompt, max_tokens=getattr(prompt_template, "max_tokens", None),
+                                  json_mode=getattr(prompt_template, "json_mode", False))
 
-        return GroqLLM(client=client, model=self.model, temperature=self.temperature)
+        return GroqLLM(client=client, model=self.model, temperature=self.temperature,
+                       max_tokens=self.max_tokens, timeout=self.timeout)
     
     def get_name(self) -> str:
         return "Groq-Mixtral-8x7b-32768"
@@ -69,11 +141,39 @@ class GroqProvider(LLMProvider):
         return "Groq Mixtral 8x7B (High performance)"
 
 
+class OllamaProvider(LLMProvider):
+    """
+    Local models served by Ollama, chosen per platform by model profiles.
+    Profile models are warmed up in the background when the provider is created.
+    """
+
+    def __init__(self, host: str = "http://localhost:11434", model: str = "mistral",
+                 platform_profiles: Optional[Dict[str, Any]] = None, warm_up: bool = True):
+        from generators.ollama_generator import OllamaGenerator
+
+        self.host = host
+        self.model = model
+        self.platform_profiles = platform_profiles or {}
+        self._generator_class = OllamaGenerator
+        if warm_up:
+            threading.Thread(target=self.get_llm().warm_up, daemon=True).start()
+
+    def get_llm(self):
+        return self._generator_class(model=self.model, host=self.host, platform_profiles=self.platform_profiles)
+
+    def get_name(self) -> str:
+        return "Ollama-Local"
+
+    def get_description(self) -> str:
+        return "Ollama local models (quantized, per-platform profiles)"
+
+
 class LLMManager:
     """Main LLM manager"""
     
-    def __init__(self):
+    def __init__(self, semantic_cache: Optional[Any] = None):
         self.providers: Dict[str, LLMProvider] = {}
+        self.semantic_cache = semantic_cache
         self._initialize_default_providers()
     
     def _initialize_default_providers(self):
@@ -83,6 +183,16 @@ class LLMManager:
                 api_key=groq_api_key, 
                 model="mixtral-8x7b-32768"
             ))
+        ollama_host = os.getenv("OLLAMA_HOST")
+        if ollama_host:
+            from generators.ollama_generator import profiles_from_env, size_profiles
+            from utils.prompt_manager import PromptManager
+            if not ollama_host.startswith("http"):
+                ollama_host = f"http://{ollama_host}"
+            self.add_provider(OllamaProvider(
+                host=ollama_host,
+                platform_profiles=size_profiles(profiles_from_env(), PromptManager())
+            ))
     
     def add_provider(self, provider: LLMProvider):
         """Add a new provider"""
@@ -95,4 +205,15 @@ class LLMManager:
     def get_available_providers(self) -> list:
         """Return list of available providers"""
         return [(name, provider.get_description()) 
-                for name, provider in self.providers.items()]
\ No newline at end of file
+                for name, provider in self.providers.items()]
+    
+    def get_llm(self, name: str):
+        """Get the LLM of a provider, behind the semantic cache if one is configured"""
+        provider = self.get_provider(name)
+        if provider is None:
+            return None
+        llm = provider.get_llm()
+        if self.semantic_cache is not None:
+            from generators.semantic_cache import SemanticCachedLLM
+            return SemanticCachedLLM(llm, self.semantic_cache)
+        return llm
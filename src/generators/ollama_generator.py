@@ -1,20 +1,174 @@
-from typing import Dict, Optional
+import json
+import logging
+import math
+import os
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional, Union
 import requests
+from trackers.metrics import registry, tracer, record_tokens, record_payload
+from utils.errors import ProviderError, retryable_status
+
+logger = logging.getLogger(__name__)
+
+# Segundos de carga del modelo; valores altos son arranques en frío
+LOAD_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass(frozen=True)
+class OllamaModelProfile:
+    """
+    Modelo y opciones de Ollama para una plataforma.
+
+    `num_ctx` debe ser estable por modelo: si cambia entre peticiones, Ollama
+    recarga el modelo. `keep_alive=-1` lo mantiene cargado indefinidamente.
+    """
+    model: str
+    keep_alive: Union[str, int] = "30m"
+    num_ctx: Optional[int] = None
+    num_thread: Optional[int] = None
+    temperature: float = 0.7
+
+
+# Modelo cuantizado pequeño para los textos cortos y uno mayor para los largos
+DEFAULT_PLATFORM_PROFILES = {
+    "Twitter": OllamaModelProfile("llama3.2:3b-instruct-q4_K_M", keep_alive=-1),
+    "Instagram": OllamaModelProfile("llama3.2:3b-instruct-q4_K_M", keep_alive=-1),
+    "LinkedIn": OllamaModelProfile("mistral:7b-instruct-q5_K_M", keep_alive="1h"),
+    "Blog": OllamaModelProfile("mistral:7b-instruct-q5_K_M", keep_alive="1h"),
+}
+
+
+def context_window(tokens: int, minimum: int = 2048) -> int:
+    """Menor potencia de dos que contiene `tokens`, y al menos `minimum`"""
+    return max(minimum, 1 << math.ceil(math.log2(max(tokens, 1))))
+
+
+def size_profiles(profiles: Dict[str, OllamaModelProfile], prompt_manager: Any,
+                  context_headroom: int = 768) -> Dict[str, OllamaModelProfile]:
+    """
+    Fija `num_ctx` a partir de la longitud de los templates: estimación del
+    prompt, más `context_headroom` (contexto del perfil y de noticias), más el
+    presupuesto de tokens. Las plataformas que comparten modelo reciben la
+    ventana mayor, para que el modelo no se recargue.
+    """
+    from utils.prompt_manager import estimate_tokens
+
+    needed: Dict[str, int] = {}
+    for platform, profile in profiles.items():
+        compiled = prompt_manager.get_compiled(platform)
+        if compiled is None or profile.num_ctx:
+            continue
+        prompt_tokens = estimate_tokens(compiled.static_text + compiled.dynamic_template)
+        needed[profile.model] = max(needed.get(profile.model, 0),
+                                    prompt_tokens + context_headroom + (compiled.max_tokens or 0))
+    return {platform: profile if profile.num_ctx or profile.model not in needed
+            else replace(profile, num_ctx=context_window(needed[profile.model]))
+            for platform, profile in profiles.items()}
+
+
+def profiles_from_env() -> Dict[str, OllamaModelProfile]:
+    """
+    Perfiles por plataforma del archivo JSON en OLLAMA_PROFILES
+    ({"Twitter": {"model": ..., "keep_alive": ...}}), o los de por defecto.
+    OLLAMA_NUM_THREAD se aplica a los perfiles que no fijan num_thread.
+    """
+    path = os.getenv("OLLAMA_PROFILES")
+    profiles = dict(DEFAULT_PLATFORM_PROFILES)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            profiles = {platform: OllamaModelProfile(**options) for platform, options in json.load(f).items()}
+    num_thread = os.getenv("OLLAMA_NUM_THREAD")
+    if num_thread:
+        profiles = {platform: profile if profile.num_thread else replace(profile, num_thread=int(num_thread))
+                    for platform, profile in profiles.items()}
+    return profiles
+
 
 class OllamaGenerator:
     """Clase para generar contenido usando Ollama API"""
     
-    def __init__(self, model: str = "mistral", temperature: float = 0.7):
+    def __init__(self, model: str = "mistral", temperature: float = 0.7, keep_alive: Union[str, int] = "30m",
+                 max_tokens: Optional[int] = None, timeout: Optional[float] = 300.0,
+                 host: str = "http://localhost:11434",
+                 platform_profiles: Optional[Dict[str, OllamaModelProfile]] = None,
+                 num_ctx: Optional[int] = None, num_thread: Optional[int] = None):
         """
         Inicializa el generador de contenido con Ollama
         
         Args:
             model (str): Nombre del modelo de Ollama a utilizar
             temperature (float): Temperatura para la generación (0.0 - 1.0)
+            keep_alive (str | int): Tiempo que el modelo permanece cargado (-1: siempre);
+                mientras siga cargado, Ollama reutiliza la caché KV del prefijo común del prompt
+            max_tokens (int): Límite de tokens generados si el template no define uno
+            timeout (float): Tiempo máximo de espera de la respuesta en segundos
+            host (str): URL del servidor de Ollama
+            platform_profiles (dict): OllamaModelProfile por plataforma; tienen prioridad
+                sobre `model` para los templates de esas plataformas
+            num_ctx (int): Ventana de contexto del modelo por defecto
+            num_thread (int): Hilos de CPU por petición (por defecto, los que elija Ollama)
         """
-        self.base_url = "http://localhost:11434/api/generate"
+        self.base_url = f"{host.rstrip('/')}/api/generate"
         self.model = model
         self.temperature = temperature
+        self.keep_alive = keep_alive
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.platform_profiles = dict(platform_profiles or {})
+        self.num_ctx = num_ctx
+        self.num_thread = num_thread
+        self.last_usage: Optional[Dict[str, int]] = None
+    
+    def profile_for(self, template: Any) -> OllamaModelProfile:
+        """Perfil de la plataforma del template, o uno con la configuración del generador"""
+        # BoundPrompt la lleva en `compiled`; SectionPrompt y RepairPrompt, en `platform`
+        platform = (getattr(template, "platform", None)
+                    or getattr(getattr(template, "compiled", None), "platform", None))
+        profile = self.platform_profiles.get(platform)
+        if profile is not None:
+            return profile
+        return OllamaModelProfile(self.model, self.keep_alive, self.num_ctx, self.num_thread, self.temperature)
+    
+    @staticmethod
+    def _options(profile: OllamaModelProfile, num_predict: Optional[int] = None) -> Dict[str, Any]:
+        options = {"temperature": profile.temperature}
+        if num_predict:
+            options["num_predict"] = num_predict
+        if profile.num_ctx:
+            options["num_ctx"] = profile.num_ctx
+        if profile.num_thread:
+            options["num_thread"] = profile.num_thread
+        return options
+    
+    @staticmethod
+    def _record_load(model: str, result: Dict[str, Any]) -> float:
+        # Ollama informa load_duration en nanosegundos; casi cero si el modelo ya estaba cargado
+        seconds = (result.get("load_duration") or 0) / 1e9
+        registry.observe("ollama_model_load_seconds", seconds, {"model": model}, buckets=LOAD_BUCKETS,
+                         help="Time Ollama spent loading the model for a request")
+        return seconds
+    
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Carga el modelo de cada perfil con su keep_alive y su ventana de contexto,
+        para que la primera petición real no pague el arranque en frío.
+        Devuelve los segundos de carga por modelo.
+        """
+        # Sin perfiles por plataforma, solo se usa el modelo por defecto
+        profiles = {(p.model, p.num_ctx, p.num_thread): p
+                    for p in list(self.platform_profiles.values()) or [self.profile_for(None)]}
+        loaded = {}
+        for profile in profiles.values():
+            payload = {"model": profile.model, "prompt": "", "keep_alive": profile.keep_alive,
+                       "options": self._options(profile), "stream": False}
+            try:
+                with tracer.span("ollama.warm_up", model=profile.model):
+                    response = requests.post(self.base_url, json=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    loaded[profile.model] = self._record_load(profile.model, response.json())
+            except Exception as e:
+                logger.warning(f"Could not warm up Ollama model {profile.model}: {e}")
+        return loaded
     
     def generate_content(self, 
                         template: str, 
@@ -23,40 +177,64 @@ class OllamaGenerator:
         Genera contenido usando Ollama API
         
         Args:
-            template (str): Template de prompt a utilizar
-            params (dict): Parámetros para el template
+            template (str | BoundPrompt): Template de prompt a utilizar
+            params (dict): Parámetros para el template; {} para prompts que ya
+                llevan los suyos (SectionPrompt, RepairPrompt)
             
         Returns:
             str: Contenido generado
         """
         try:
-            # Validar parámetros
-            if not template or not params:
-                raise ValueError("Template y parámetros son requeridos")
+            # Validar el template; los placeholders sin valor fallan al formatear
+            if not template:
+                raise ValueError("El template es requerido")
             
             # Reemplazar los placeholders en el template
-            prompt = template.format(**params)
+            prompt = template.format(**(params or {}))
             
-            # Preparar la solicitud para Ollama
+            # Preparar la solicitud para Ollama; los parámetros del modelo van en "options"
+            profile = self.profile_for(template)
+            num_predict = getattr(template, "max_tokens", None) or self.max_tokens
             payload = {
-                "model": self.model,
+                "model": profile.model,
                 "prompt": prompt,
-                "temperature": self.temperature,
+                "keep_alive": profile.keep_alive,
+                "options": self._options(profile, num_predict),
                 "stream": False
             }
+            if getattr(template, "json_mode", False):
+                payload["format"] = "json"
             
-            # Realizar la solicitud
-            response = requests.post(self.base_url, json=payload)
-            
-            if response.status_code != 200:
-                raise ValueError(f"Error en la API de Ollama: {response.text}")
-            
-            # Extraer el texto generado
-            result = response.json()
-            return result.get('response', '')
+            with tracer.span("ollama.generate", model=profile.model,
+                             prefix_key=getattr(template, "prefix_key", "")) as span:
+                # Realizar la solicitud
+                record_payload("ollama.generate", "request", len(prompt.encode("utf-8")))
+                response = requests.post(self.base_url, json=payload, timeout=self.timeout)
+                
+                if response.status_code != 200:
+                    raise ProviderError(f"Error en la API de Ollama: {response.text}",
+                                        retryable_status(response.status_code))
+                
+                # Extraer el texto generado
+                result = response.json()
+                span.set_attribute("ollama.load_seconds", self._record_load(profile.model, result))
+                self.last_usage = {"prompt_tokens": result.get("prompt_eval_count", 0),
+                                   "completion_tokens": result.get("eval_count", 0)}
+                record_tokens("ollama", profile.model,
+                              result.get("prompt_eval_count"), result.get("eval_count"))
+                content = result.get('response', '')
+                record_payload("ollama.generate", "response", len(content.encode("utf-8")))
+                return content
             
+        except ProviderError as e:
+            logger.error(f"Error generando contenido: {str(e)}")
+            raise
+        except requests.RequestException as e:
+            # Servidor de Ollama caído o sin respuesta a tiempo
+            logger.error(f"Error generando contenido: {str(e)}")
+            raise ProviderError(f"Ollama no disponible: {str(e)}") from e
         except Exception as e:
-            print(f"Error generando contenido: {str(e)}")
+            logger.error(f"Error generando contenido: {str(e)}")
             raise Exception(f"Error en la generación de contenido: {str(e)}")
 
     def validate_params(self, required_params: list, provided_params: Dict) -> bool:
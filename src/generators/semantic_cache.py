@@ -0,0 +1,176 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from trackers.metrics import record_cache, tracer
+
+EmbedFn = Callable[[List[str]], np.ndarray]
+
+
+def default_embed_fn() -> EmbedFn:
+    """Local MiniLM embeddings, the same model used by ScientificContentService"""
+    from langchain.embeddings import HuggingFaceEmbeddings
+
+    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    return lambda texts: np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+
+class SemanticMatch:
+    def __init__(self, result: str, similarity: float, is_hit: bool):
+        self.result = result
+        self.similarity = similarity
+        self.is_hit = is_hit
+
+
+class _Partition:
+    """Fixed-capacity vector index for one scope; evicted rows are reused in place"""
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.results: List[Optional[str]] = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+
+
+class SemanticCache:
+    """
+    Near-duplicate cache for generation requests.
+
+    Requests are partitioned by scope (profile prompt prefix, platform and
+    tone must match exactly) and compared by cosine similarity of their
+    embedded theme and audience. At or above `threshold` the stored
+    generation is returned as is; between `draft_threshold` and `threshold`
+    it is offered as a draft. Each scope holds at most `max_entries`
+    generations and evicts the least recently used one.
+    """
+
+    def __init__(self, embed_fn: Optional[EmbedFn] = None, threshold: float = 0.92,
+                 draft_threshold: Optional[float] = 0.8, max_entries: int = 256, max_scopes: int = 1024):
+        self._embed_fn = embed_fn
+        self.threshold = threshold
+        self.draft_threshold = draft_threshold
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self._partitions: Dict[Any, _Partition] = {}
+        self._scope_used: Dict[Any, float] = {}
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> np.ndarray:
+        if self._embed_fn is None:
+            self._embed_fn = default_embed_fn()
+        with tracer.span("semantic_cache.embed"):
+            vector = np.asarray(self._embed_fn([text]), dtype=np.float32)[0]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, scope: Any, text: str, vector: Optional[np.ndarray] = None) -> Optional[SemanticMatch]:
+        """Returns the closest stored generation above the draft threshold, if any"""
+        vector = self.embed(text) if vector is None else vector
+        with self._lock:
+            partition = self._partitions.get(scope)
+            if partition is None or partition.size == 0:
+                record_cache("semantic", False)
+                return None
+            scores = partition.vectors[:partition.size] @ vector
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            floor = self.draft_threshold if self.draft_threshold is not None else self.threshold
+            if similarity < floor:
+                record_cache("semantic", False)
+                return None
+            now = time.monotonic()
+            partition.last_used[best] = now
+            self._scope_used[scope] = now
+            is_hit = similarity >= self.threshold
+            record_cache("semantic", is_hit)
+            return SemanticMatch(partition.results[best], similarity, is_hit)
+
+    def store(self, scope: Any, text: str, result: str, vector: Optional[np.ndarray] = None):
+        """Adds a generation, evicting the least recently used one when the scope is full"""
+        vector = self.embed(text) if vector is None else vector
+        with self._lock:
+            partition = self._partitions.get(scope)
+            if partition is None:
+                if len(self._partitions) >= self.max_scopes:
+                    oldest = min(self._scope_used, key=self._scope_used.get)
+                    del self._partitions[oldest], self._scope_used[oldest]
+                partition = self._partitions[scope] = _Partition(self.max_entries, vector.shape[0])
+            if partition.size < self.max_entries:
+                row = partition.size
+                partition.size += 1
+            else:
+                row = int(np.argmin(partition.last_used))
+            now = time.monotonic()
+            partition.vectors[row] = vector
+            partition.results[row] = result
+            partition.last_used[row] = now
+            self._scope_used[scope] = now
+
+    def clear(self, scope: Any = None):
+        with self._lock:
+            if scope is None:
+                self._partitions.clear()
+                self._scope_used.clear()
+            else:
+                self._partitions.pop(scope, None)
+                self._scope_used.pop(scope, None)
+
+
+class _DraftPrompt:
+    """Wraps a prompt template and appends a previous generation as a draft"""
+
+    def __init__(self, template: Any, draft: str):
+        self.template = template
+        self.draft = draft
+        self.max_tokens = getattr(template, "max_tokens", None)
+        self.prefix_key = getattr(template, "prefix_key", "")
+
+    def format(self, **params) -> str:
+        return (f"{self.template.format(**params)}\n\n"
+                f"Use this previous draft as a starting point and adapt it to the topic, "
+                f"audience and tone above:\n{self.draft}")
+
+
+class SemanticCachedLLM:
+    """
+    Puts a SemanticCache in front of any generator exposing
+    `generate_content(prompt_template, template_params)`.
+    """
+
+    def __init__(self, llm: Any, cache: SemanticCache, use_drafts: bool = True):
+        self.llm = llm
+        self.cache = cache
+        self.use_drafts = use_drafts
+        self.last_match: Optional[SemanticMatch] = None
+        self.last_usage: Optional[Dict[str, int]] = None
+
+    def __getattr__(self, name: str):
+        return getattr(self.llm, name)
+
+    def cache_key(self, prompt_template: Any, template_params: Dict[str, str]) -> Tuple[Any, str]:
+        # The model is read per call: ContentService switches it on the shared generator
+        scope = (
+            getattr(self.llm, "model", None),
+            getattr(prompt_template, "prefix_key", None) or str(prompt_template),
+            template_params.get("tono", ""),
+        )
+        text = f"{template_params.get('tema', '')} | {template_params.get('audiencia', '')}"
+        return scope, text
+
+    def generate_content(self, prompt_template: Any, template_params: Dict[str, str]) -> str:
+        scope, text = self.cache_key(prompt_template, template_params)
+        vector = self.cache.embed(text)
+        match = self.cache.lookup(scope, text, vector)
+        self.last_match = match
+        if match and match.is_hit:
+            self.last_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            return match.result
+        if match and self.use_drafts:
+            prompt_template = _DraftPrompt(prompt_template, match.result)
+        result = self.llm.generate_content(prompt_template, template_params)
+        self.last_usage = getattr(self.llm, "last_usage", None)
+        if result:
+            self.cache.store(scope, text, result, vector)
+        return result
@@ -0,0 +1,385 @@
+"""
+Content calendar with off-peak pre-generation.
+
+Planned posts (profile, platform, theme, publish date) live in a SQLite
+file. A scheduler pre-generates text, images and translations for upcoming
+posts during an off-peak window, under a concurrency limit and a rate
+budget, and stores the results in the ArtifactStore. A post is generated
+again only when its profile, its platform template or its own parameters
+change, or when its artifacts were evicted. Run the scheduler with:
+    python -m services.content_calendar
+"""
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from trackers.metrics import registry, tracer
+from utils.artifact_store import Artifact, ArtifactStore
+
+logger = logging.getLogger(__name__)
+
+PLANNED = "planned"
+GENERATING = "generating"
+READY = "ready"
+FAILED = "failed"
+
+
+@dataclass
+class CalendarEntry:
+    id: str
+    profile: Optional[str]
+    platform: str
+    theme: str
+    audience: str
+    tone: str
+    publish_at: float
+    target_language: Optional[str]
+    image_prompt: Optional[str]
+    state: str
+    fingerprint: Optional[str]
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    updated_at: float
+    lease_expires: Optional[float]
+    attempts: int
+    model: Optional[str]
+
+    def params(self) -> Dict[str, Any]:
+        return {"profile": self.profile, "platform": self.platform, "theme": self.theme,
+                "audience": self.audience, "tone": self.tone, "target_language": self.target_language,
+                "image_prompt": self.image_prompt, "model": self.model}
+
+
+_COLUMNS = ("id, profile, platform, theme, audience, tone, publish_at, target_language, image_prompt, "
+            "state, fingerprint, result, error, updated_at, lease_expires, attempts, model")
+
+
+def _row_to_entry(row) -> CalendarEntry:
+    values = list(row)
+    values[11] = json.loads(values[11]) if values[11] is not None else None
+    return CalendarEntry(*values)
+
+
+class ContentCalendar:
+    """
+    SQLite-backed content calendar.
+
+    Each claim counts as an attempt; a failed entry is retried until it has
+    used `max_attempts`, and not at all after a non-retryable error.
+    """
+
+    def __init__(self, db_path: str = "calendar.db", lease_seconds: float = 900.0, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    id TEXT PRIMARY KEY,
+                    profile TEXT,
+                    platform TEXT NOT NULL,
+                    theme TEXT NOT NULL,
+                    audience TEXT NOT NULL,
+                    tone TEXT NOT NULL,
+                    publish_at REAL NOT NULL,
+                    target_language TEXT,
+                    image_prompt TEXT,
+                    state TEXT NOT NULL,
+                    fingerprint TEXT,
+                    result TEXT,
+                    error TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    model TEXT
+                )
+            """)
+            # Calendars created before entries carried attempts and a model
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+            for column, definition in (("attempts", "INTEGER NOT NULL DEFAULT 0"), ("model", "TEXT")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE entries ADD COLUMN {column} {definition}")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_publish_at ON entries (publish_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return conn
+
+    def add(self, platform: str, theme: str, audience: str, tone: str, publish_at: float,
+            profile: Optional[str] = None, target_language: Optional[str] = None,
+            image_prompt: Optional[str] = None, model: Optional[str] = None) -> CalendarEntry:
+        entry_id = uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute(
+                f"INSERT INTO entries ({_COLUMNS}) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL, NULL, ?, NULL, 0, ?)",
+                (entry_id, profile, platform, theme, audience, tone, publish_at, target_language,
+                 image_prompt, PLANNED, time.time(), model)
+            )
+        return self.get(entry_id)
+
+    def get(self, entry_id: str) -> Optional[CalendarEntry]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return _row_to_entry(row) if row else None
+
+    def delete(self, entry_id: str):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+
+    def upcoming(self, start: Optional[float] = None, end: Optional[float] = None) -> List[CalendarEntry]:
+        """Entries publishing between `start` (default now) and `end`, soonest first"""
+        start = time.time() if start is None else start
+        end = float("inf") if end is None else end
+        with closing(self._connect()) as conn:
+            rows = conn.execute(f"SELECT {_COLUMNS} FROM entries WHERE publish_at BETWEEN ? AND ? "
+                                f"ORDER BY publish_at", (start, end)).fetchall()
+        return [_row_to_entry(row) for row in rows]
+
+    def claim(self, entry_id: str) -> bool:
+        """Marks an entry as generating unless another scheduler holds a live lease on it"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE entries SET state = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ? AND (state != ? OR lease_expires < ?)",
+                (GENERATING, now + self.lease_seconds, now, entry_id, GENERATING, now)
+            ).rowcount == 1
+
+    def complete(self, entry_id: str, fingerprint: str, result: Dict[str, Any]):
+        self._finish(entry_id, READY, fingerprint=fingerprint, result=json.dumps(result, ensure_ascii=False),
+                     attempts=0)
+
+    def fail(self, entry_id: str, error: str, fingerprint: Optional[str] = None, retry: bool = True):
+        """Marks an entry failed; without `retry` it uses up its remaining attempts"""
+        self._finish(entry_id, FAILED, fingerprint=fingerprint, error=error,
+                     attempts=None if retry else self.max_attempts)
+
+    def exhausted(self, entry: CalendarEntry) -> bool:
+        return entry.attempts >= self.max_attempts
+
+    def _finish(self, entry_id: str, state: str, fingerprint: Optional[str] = None,
+                result: Optional[str] = None, error: Optional[str] = None, attempts: Optional[int] = None):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE entries SET state = ?, fingerprint = COALESCE(?, fingerprint), "
+                "result = COALESCE(?, result), error = ?, lease_expires = NULL, "
+                "attempts = COALESCE(?, attempts), updated_at = ? WHERE id = ?",
+                (state, fingerprint, result, error, attempts, time.time(), entry_id)
+            )
+
+    def find_ready(self, profile: Optional[str], platform: str, theme: str, audience: str,
+                   tone: str, model: Optional[str] = None) -> Optional[CalendarEntry]:
+        """A ready entry generated for exactly these parameters and model, if any"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM entries WHERE state = ? AND profile IS ? AND platform = ? "
+                f"AND theme = ? AND audience = ? AND tone = ? AND model IS ? ORDER BY publish_at LIMIT 1",
+                (READY, profile, platform, theme, audience, tone, model)
+            ).fetchone()
+        return _row_to_entry(row) if row else None
+
+
+def parse_window(spec: str) -> Tuple[int, int]:
+    """Parses an hour range such as "22-6" (wraps past midnight)"""
+    start, _, end = spec.partition("-")
+    return int(start) % 24, int(end) % 24
+
+
+def in_window(window: Tuple[int, int], moment: Optional[datetime] = None) -> bool:
+    hour = (moment or datetime.now()).hour
+    start, end = window
+    if start == end:
+        return True
+    return start <= hour < end if start < end else hour >= start or hour < end
+
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` calls per minute, with bursts up to `burst`"""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.interval = 60.0 / per_minute
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) / self.interval)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * self.interval
+            time.sleep(wait)
+
+
+class CalendarScheduler:
+    """
+    Pre-generates upcoming calendar entries inside the off-peak `window`.
+
+    At most `max_concurrency` entries generate at once and at most
+    `rate_per_minute` generations start per minute. Only entries publishing
+    within `horizon_days` whose fingerprint changed are generated. Entries
+    left generating by a crashed scheduler are picked up once their lease
+    expires; errors in `non_retryable` are not retried.
+    """
+
+    def __init__(self, calendar: ContentCalendar, content_service: Any, artifact_store: ArtifactStore,
+                 language_service: Optional[Any] = None, window: Tuple[int, int] = (22, 6),
+                 max_concurrency: int = 2, rate_per_minute: float = 10.0, horizon_days: float = 14.0,
+                 non_retryable: Tuple[Type[BaseException], ...] = ()):
+        self.calendar = calendar
+        self.content_service = content_service
+        self.artifact_store = artifact_store
+        self.language_service = language_service
+        self.window = window
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(rate_per_minute)
+        self.horizon_days = horizon_days
+        self.non_retryable = non_retryable
+
+    def fingerprint(self, entry: CalendarEntry) -> str:
+        """Changes with the profile context, the platform template version or the entry parameters"""
+        profile_context = None
+        if entry.profile:
+            profile_context = self.content_service.profile_manager.get_prompt_context(entry.profile)
+        data = json.dumps({
+            "profile": profile_context,
+            "template": self.content_service.prompt_manager.template_version(entry.platform),
+            "params": entry.params(),
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def is_current(self, entry: CalendarEntry) -> bool:
+        """True if the entry's stored result matches its fingerprint and is still on disk"""
+        if entry.state != READY or not entry.result or entry.fingerprint != self.fingerprint(entry):
+            return False
+        handles = [value for value in entry.result.values() if isinstance(value, dict) and "id" in value]
+        return all(self.artifact_store.path(Artifact(**handle)) for handle in handles)
+
+    def needs_generation(self, entry: CalendarEntry, now: float) -> bool:
+        if entry.state == GENERATING:
+            # Reclaim leases left by a crashed scheduler while attempts remain
+            return (entry.lease_expires or 0) < now and not self.calendar.exhausted(entry)
+        if entry.state == FAILED and self.calendar.exhausted(entry):
+            # Given up on, until its profile, template or parameters change
+            return entry.fingerprint != self.fingerprint(entry)
+        return not self.is_current(entry)
+
+    def stale_entries(self, now: Optional[float] = None) -> List[CalendarEntry]:
+        now = time.time() if now is None else now
+        entries = self.calendar.upcoming(now, now + self.horizon_days * 86400)
+        return [entry for entry in entries if self.needs_generation(entry, now)]
+
+    def generate(self, entry: CalendarEntry):
+        """Generates one entry and stores its artifacts; results use the app's stored-result layout"""
+        if not self.calendar.claim(entry.id):
+            return
+        fingerprint = self.fingerprint(entry)
+        self.rate_limiter.acquire()
+        try:
+            with tracer.span("calendar.generate", platform=entry.platform):
+                image = None
+                if entry.image_prompt:
+                    image = {"prompt": entry.image_prompt, "dimensions": [512, 512], "negative_prompt": ""}
+                result = self.content_service.generate_bundle(entry.platform, entry.theme, entry.audience,
+                                                              entry.tone, entry.profile, entry.model, image=image)
+                stored = {
+                    "kind": "content",
+                    "platform": entry.platform,
+                    "image_prompt": entry.image_prompt,
+                    "image_error": result.get("image_error"),
+                    "errors": [],
+                    "content": self.artifact_store.put(result["content"] or "", ".txt").to_dict(),
+                }
+                if result.get("image_base64"):
+                    stored["image"] = self.artifact_store.put(base64.b64decode(result["image_base64"]),
+                                                              ".png").to_dict()
+                if entry.target_language and self.language_service is not None:
+                    translated = self.language_service.translate_content(result["content"] or "",
+                                                                         entry.target_language)
+                    stored["translation"] = self.artifact_store.put(translated, ".txt").to_dict()
+                    stored["target_language"] = entry.target_language
+            self.calendar.complete(entry.id, fingerprint, stored)
+            registry.inc("calendar_generations_total", 1, {"outcome": "ready"},
+                         help="Calendar entries pre-generated")
+        except Exception as e:
+            logger.exception(f"Calendar entry {entry.id} failed")
+            self.calendar.fail(entry.id, str(e), fingerprint,
+                               retry=not isinstance(e, self.non_retryable))
+            registry.inc("calendar_generations_total", 1, {"outcome": "failed"},
+                         help="Calendar entries pre-generated")
+
+    def run_once(self, moment: Optional[datetime] = None) -> int:
+        """Generates stale entries if inside the window; returns how many were attempted"""
+        if not in_window(self.window, moment):
+            return 0
+        entries = self.stale_entries()
+        if entries:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="calendar") as executor:
+                list(executor.map(self.generate, entries))
+        return len(entries)
+
+    def run_forever(self, stop_event: Optional[threading.Event] = None, poll_interval: float = 300.0):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Calendar scheduler pass failed")
+            stop_event.wait(poll_interval)
+
+
+def scheduler_from_env(content_service: Any, artifact_store: ArtifactStore,
+                       language_service: Optional[Any] = None,
+                       non_retryable: Tuple[Type[BaseException], ...] = ()) -> CalendarScheduler:
+    return CalendarScheduler(
+        ContentCalendar(os.getenv("CALENDAR_DB", "calendar.db"),
+                        max_attempts=int(os.getenv("CALENDAR_MAX_ATTEMPTS", "3"))),
+        content_service, artifact_store,
+        language_service=language_service, non_retryable=non_retryable,
+        window=parse_window(os.getenv("CALENDAR_WINDOW", "22-6")),
+        max_concurrency=int(os.getenv("CALENDAR_CONCURRENCY", "2")),
+        rate_per_minute=float(os.getenv("CALENDAR_RATE_PER_MINUTE", "10")),
+        horizon_days=float(os.getenv("CALENDAR_HORIZON_DAYS", "14")),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate content calendar entries off-peak")
+    parser.add_argument("--once", action="store_true", help="Run a single pass, ignoring the window")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from dotenv import load_dotenv
+    from services.content_service import NON_RETRYABLE_ERRORS, content_service_from_env
+    from services.language_service import LanguageService
+
+    load_dotenv()
+    service = content_service_from_env()
+    store = ArtifactStore(os.getenv("ARTIFACT_DIR", "artifacts"),
+                          max_bytes=int(os.getenv("ARTIFACT_CACHE_MB", "512")) * 1024 * 1024)
+    scheduler = scheduler_from_env(service, store, LanguageService(), non_retryable=NON_RETRYABLE_ERRORS)
+    if args.once:
+        scheduler.window = (0, 0)
+        print(f"Generated {scheduler.run_once()} entries")
+    else:
+        scheduler.run_forever()
@@ -0,0 +1,453 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from generators.llm_handler import LLMManager
+from utils.company_profile import ProfileManager
+from utils.blog_sections import (OUTLINE, SectionCache, SectionPrompt, assemble, parse_outline, part_prompts,
+                                 strip_heading)
+from utils.cache_backend import TieredCache, shared_cache
+from utils.content_safety import safety_check_middleware
+from utils.errors import InvalidRequestError, ProviderError
+from utils.prompt_manager import PromptManager, estimate_tokens
+from utils.quota_store import QuotaStore, QuotaExceededError
+from utils.structured_output import (IncrementalJSONParser, RepairPrompt, normalize, render_markdown,
+                                     repair_path, set_path, validate)
+
+DEFAULT_PROVIDER = "Groq-Mixtral-8x7b-32768"
+
+
+class UnsafeContentError(Exception):
+    """Raised when a theme or a generated text fails the safety check"""
+
+
+class ContentService:
+    """
+    Platform content generation shared by the Streamlit app and the API server:
+    safety checks, prompt compilation, quota reservation and the LLM call.
+    """
+
+    def __init__(self, llm_manager: Optional[LLMManager] = None,
+                 prompt_manager: Optional[PromptManager] = None,
+                 profile_manager: Optional[ProfileManager] = None,
+                 quota_store: Optional[QuotaStore] = None,
+                 image_generator: Optional[Any] = None,
+                 provider_name: Optional[str] = None,
+                 section_workers: int = 4,
+                 news_pipeline: Optional[Any] = None,
+                 cache: Optional[TieredCache] = None):
+        self.llm_manager = llm_manager or LLMManager()
+        self.prompt_manager = prompt_manager or PromptManager()
+        self.profile_manager = profile_manager or ProfileManager()
+        self.quota_store = quota_store
+        self.image_generator = image_generator
+        # LLM_PROVIDER selects another LLMManager provider, e.g. "Ollama-Local"
+        self.provider_name = provider_name or os.getenv("LLM_PROVIDER", DEFAULT_PROVIDER)
+        # services.news_pipeline.NewsPipeline; grounds posts requested with news=True
+        self.news_pipeline = news_pipeline
+        # LLM wrappers keep per-call state (last_usage), so each thread gets its own
+        self._local = threading.local()
+        # Parts of sectioned Blog articles, reused across edits and, through the
+        # shared cache (CACHE_URL), across worker processes
+        self.section_cache = SectionCache(shared=cache or shared_cache())
+        self.section_workers = section_workers
+        self._section_executor: Optional[ThreadPoolExecutor] = None
+        self._section_lock = threading.Lock()
+
+    def get_llm(self, model: Optional[str] = None) -> Any:
+        llms = getattr(self._local, "llms", None)
+        if llms is None:
+            llms = self._local.llms = {}
+        llm = llms.get(model)
+        if llm is None:
+            llm = self.llm_manager.get_llm(self.provider_name)
+            if llm is None:
+                raise ProviderError(f"LLM provider not available: {self.provider_name}")
+            target = getattr(llm, "llm", llm)
+            # Model ids from the app and API name Groq models; Ollama takes its
+            # models from the platform profiles and its own configuration
+            if model and not hasattr(target, "platform_profiles"):
+                target.model = model
+            llms[model] = llm
+        return llm
+
+    @staticmethod
+    def model_for(llm: Any, platform: str) -> Optional[str]:
+        """The model that writes `platform` posts: its Ollama platform profile's, else the LLM's"""
+        llm = getattr(llm, "llm", llm)
+        profile = (getattr(llm, "platform_profiles", None) or {}).get(platform)
+        return profile.model if profile is not None else getattr(llm, "model", None)
+
+    def build_prompt(self, platform: str, profile: Optional[str] = None, tones: Optional[List[str]] = None,
+                     structured: bool = False, grounding: Optional[str] = None):
+        """
+        Returns the compiled template for a platform bound to a profile context
+        and an optional grounding block, a variant prompt asking for one variant
+        per tone if `tones` is given, or a prompt asking for the platform's JSON
+        schema if `structured`.
+        """
+        profile_context = self.profile_manager.get_prompt_context(profile) if profile else None
+        if tones is not None:
+            prompt_template = self.prompt_manager.compile_variants(platform, tones, profile_context, grounding)
+        elif structured:
+            prompt_template = self.prompt_manager.compile_structured(platform, profile_context, grounding)
+        else:
+            prompt_template = self.prompt_manager.compile(platform, profile_context, grounding)
+        if prompt_template is None:
+            raise InvalidRequestError(f"No template found for platform {platform}")
+        return prompt_template
+
+    def job_version(self, kind: str, params: Dict[str, Any]) -> str:
+        """
+        Version of the job inputs that are not in its parameters: the profile
+        context and the platform template. Part of JobQueue idempotency keys.
+        """
+        profile = params.get("profile")
+        profile_context = self.profile_manager.get_prompt_context(profile) if profile else None
+        data = json.dumps([profile_context, self.prompt_manager.template_version(params.get("platform", ""))],
+                          ensure_ascii=False)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def news_context(self, theme: str, news: bool) -> Optional[str]:
+        """Market news context block for a theme if `news` is requested"""
+        if not news:
+            return None
+        if self.news_pipeline is None:
+            raise ProviderError("Market news grounding is not configured")
+        return self.news_pipeline.context_block(theme)
+
+    def _call_llm(self, llm: Any, prompt_template: Any, template_params: Dict[str, str],
+                  profile: Optional[str], call: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Calls the LLM (or `call`, if given) inside a quota reservation for the
+        profile, if quotas are enabled.
+        """
+        call = call or (lambda: llm.generate_content(prompt_template, template_params))
+        if self.quota_store is None:
+            return call()
+        tenant = profile or "default"
+        # The prefix plus the unrendered template text (task line and rules) of compiled prompts
+        prompt_text = prompt_template.prefix + getattr(getattr(prompt_template, "compiled", None),
+                                                       "dynamic_template", "")
+        requested_tokens = estimate_tokens(prompt_text) + (prompt_template.max_tokens or 0)
+        with self.quota_store.reserve(tenant, requested_tokens) as reservation:
+            result = call()
+            if llm.last_usage:
+                reservation.record(model=getattr(llm, "model", None), **llm.last_usage)
+        return result
+
+    def generate(self, platform: str, theme: str, audience: str, tone: str,
+                 profile: Optional[str] = None, model: Optional[str] = None, news: bool = False) -> Dict[str, Any]:
+        """
+        Generates content for a platform, grounded in recent market news if `news`.
+
+        Raises UnsafeContentError, QuotaExceededError or ValueError (bad template or params).
+        """
+        safety = safety_check_middleware(theme, platform, "")
+        if not safety['is_safe']:
+            raise UnsafeContentError(safety['message'])
+
+        prompt_template = self.build_prompt(platform, profile, grounding=self.news_context(theme, news))
+        template_params = {"tema": theme, "audiencia": audience, "tono": tone}
+        prompt_template.compiled.validate(template_params)
+
+        llm = self.get_llm(model)
+        result = self._call_llm(llm, prompt_template, template_params, profile)
+
+        safety = safety_check_middleware(theme, platform, result or "")
+        if not safety['is_safe']:
+            raise UnsafeContentError(safety['message'])
+
+        return {
+            "platform": platform,
+            "content": result,
+            "usage": llm.last_usage,
+        }
+
+    def generate_variants(self, platform: str, theme: str, audience: str, tones: List[str],
+                          profile: Optional[str] = None, model: Optional[str] = None,
+                          news: bool = False) -> Dict[str, Any]:
+        """
+        Generates one variant per tone with a single LLM call.
+
+        Each variant is safety-checked on its own; a variant that is unsafe or
+        missing from the response carries an "error" instead of "content".
+        """
+        safety = safety_check_middleware(theme, platform, "")
+        if not safety['is_safe']:
+            raise UnsafeContentError(safety['message'])
+
+        prompt_template = self.build_prompt(platform, profile, tones, grounding=self.news_context(theme, news))
+        template_params = {"tema": theme, "audiencia": audience, "tono": ", ".join(tones)}
+        prompt_template.compiled.validate(template_params)
+
+        llm = self.get_llm(model)
+        result = self._call_llm(llm, prompt_template, template_params, profile)
+
+        variants = []
+        for tone, content in zip(tones, prompt_template.parse(result or "")):
+            if content is None:
+                variants.append({"tone": tone, "error": "Variant missing from model response"})
+                continue
+            safety = safety_check_middleware(theme, platform, content)
+            if safety['is_safe']:
+                variants.append({"tone": tone, "content": content})
+            else:
+                variants.append({"tone": tone, "error": safety['message']})
+
+        return {
+            "platform": platform,
+            "variants": variants,
+            "usage": llm.last_usage,
+        }
+
+    def generate_structured(self, platform: str, theme: str, audience: str, tone: str,
+                            profile: Optional[str] = None, model: Optional[str] = None,
+                            max_repairs: int = 2, news: bool = False) -> Dict[str, Any]:
+        """
+        Generates a post as JSON validated against the platform schema.
+
+        The response is streamed (when the LLM supports it) and validated field
+        by field. Invalid fields, or single list items such as one long tweet,
+        are regenerated on their own for up to `max_repairs` rounds; errors left
+        after that are returned in "errors". Bypasses the semantic cache.
+        """
+        safety = safety_check_middleware(theme, platform, "")
+        if not safety['is_safe']:
+            raise UnsafeContentError(safety['message'])
+
+        prompt_template = self.build_prompt(platform, profile, structured=True,
+                                            grounding=self.news_context(theme, news))
+        template_params = {"tema": theme, "audiencia": audience, "tono": tone}
+        prompt_template.compiled.validate(template_params)
+        schema = prompt_template.schema
+
+        llm = self.get_llm(model)
+        llm = getattr(llm, "llm", llm)
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+
+        def add_usage():
+            for name, value in (llm.last_usage or {}).items():
+                usage[name] = usage.get(name, 0) + (value or 0)
+
+        def stream_into(parser: IncrementalJSONParser):
+            stream = getattr(llm, "stream_content", None)
+            if stream is None:
+                parser.feed(llm.generate_content(prompt_template, template_params) or "")
+                return
+            for chunk in stream(prompt_template, template_params):
+                parser.feed(chunk)
+
+        data = None
+        # One retry of the whole post if the response has no JSON object at all
+        for _ in range(2):
+            parser = IncrementalJSONParser(schema)
+            self._call_llm(llm, prompt_template, template_params, profile, call=lambda: stream_into(parser))
+            add_usage()
+            try:
+                data = normalize(parser.close())
+                break
+            except ValueError:
+                continue
+        if data is None:
+            raise ProviderError(f"The model did not return a JSON object for {platform}", retryable=False)
+
+        repairs = 0
+        errors = validate(schema, data)
+        while errors and repairs < max_repairs:
+            failing: Dict[tuple, list] = {}
+            for error in errors:
+                failing.setdefault(repair_path(error), []).append(error)
+            for path, path_errors in failing.items():
+                repair = RepairPrompt(platform, schema, data, path, path_errors, prompt_template.max_tokens)
+                parser = IncrementalJSONParser({})
+                parser.feed(self._call_llm(llm, repair, {}, profile) or "")
+                add_usage()
+                if "value" in parser.fields:
+                    set_path(data, path, parser.fields["value"])
+            repairs += 1
+            errors = validate(schema, normalize(data))
+
+        content = render_markdown(platform, data)
+        safety = safety_check_middleware(theme, platform, content)
+        if not safety['is_safe']:
+            raise UnsafeContentError(safety['message'])
+
+        return {
+            "platform": platform,
+            "content": content,
+            "data": data,
+            "usage": usage,
+            "repairs": repairs,
+            "errors": [str(error) for error in errors],
+        }
+
+    def _generate_section(self, prompt: SectionPrompt, profile: Optional[str], model: Optional[str],
+                          refresh: bool = False) -> Tuple[Any, Optional[Dict[str, int]]]:
+        """Returns a part and the tokens used to generate it (None if it came from the section cache)"""
+        cached = None if refresh else self.section_cache.get(prompt.key)
+        if cached is not None:
+            return cached, None
+        llm = self.get_llm(model)
+        # Parts have their own exact cache; near-duplicate matches would mix up sections
+        llm = getattr(llm, "llm", llm)
+        text = self._call_llm(llm, prompt, {}, profile) or ""
+        value = parse_outline(text) if prompt.spec is OUTLINE else strip_heading(text)
+        self.section_cache.put(prompt.key, value)
+        return value, llm.last_usage or {}
+
+    def _sections_executor(self) -> ThreadPoolExecutor:
+        with self._section_lock:
+            if self._section_executor is None:
+                self._section_executor = ThreadPoolExecutor(max_workers=self.section_workers,
+                                                            thread_name_prefix="sections")
+            return self._section_executor
+
+    def generate_sections(self, platform: str, theme: str, audience: str, tone: str,
+                          profile: Optional[str] = None, model: Optional[str] = None,
+                          parallel: bool = True, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Generates a Blog article part by part (outline, introduction, sections,
+        conclusion, call to action), reusing every cached part whose inputs did
+        not change. Parts missing from the cache are generated in parallel.
+        `refresh` writes every part again and replaces the cached ones.
+        """
+        if platform != "Blog":
+            raise InvalidRequestError(f"Section-level generation is only available for Blog, not {platform}")
+        safety = safety_check_middleware(theme, platform, "")
+        if not safety['is_safe']:
+            raise UnsafeContentError(safety['message'])
+        template_params = {"tema": theme, "audiencia": audience, "tono": tone}
+        self.prompt_manager.get_compiled(platform).validate(template_params)
+
+        company = self.profile_manager.load_profile(profile) if profile else None
+        version = self.prompt_manager.template_version(platform)
+        model_id = self.model_for(self.get_llm(model), platform)
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        regenerated = []
+
+        def add_usage(name: str, part_usage: Optional[Dict[str, int]]):
+            if part_usage is None:
+                return
+            regenerated.append(name)
+            for key, value in part_usage.items():
+                usage[key] = usage.get(key, 0) + (value or 0)
+
+        outline_prompt = SectionPrompt(OUTLINE, template_params, company, version, model_id)
+        outline, outline_usage = self._generate_section(outline_prompt, profile, model, refresh)
+        add_usage("outline", outline_usage)
+
+        prompts = part_prompts(outline, template_params, company, version, model_id)
+        if parallel:
+            executor = self._sections_executor()
+            futures = {name: executor.submit(self._generate_section, prompt, profile, model, refresh)
+                       for name, prompt in prompts.items()}
+            results = {name: future.result() for name, future in futures.items()}
+        else:
+            results = {name: self._generate_section(prompt, profile, model, refresh)
+                       for name, prompt in prompts.items()}
+        parts = {}
+        for name, (text, part_usage) in results.items():
+            parts[name] = text
+            add_usage(name, part_usage)
+
+        data = assemble(outline, parts)
+        content = render_markdown(platform, data)
+        safety = safety_check_middleware(theme, platform, content)
+        if not safety['is_safe']:
+            raise UnsafeContentError(safety['message'])
+
+        return {
+            "platform": platform,
+            "content": content,
+            "data": data,
+            "usage": usage,
+            "regenerated": regenerated,
+        }
+
+    def generate_bundle(self, platform: str, theme: str, audience: str, tone: str,
+                        profile: Optional[str] = None, model: Optional[str] = None,
+                        image: Optional[Dict[str, Any]] = None, structured: bool = False,
+                        sectioned: bool = False, news: bool = False, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Generates content (structured if `structured`, part by part if
+        `sectioned`, grounded in market news if `news`) and, if `image` is
+        given ({"prompt", "dimensions", "negative_prompt", "cached"}), an image for it.
+        `structured` and `sectioned` exclude each other. News grounding takes
+        the whole-article path, since cached sections would not follow the
+        news. `refresh` bypasses cached sections. An image failure is reported
+        in the result instead of failing the text.
+        """
+        if structured and sectioned:
+            raise InvalidRequestError("Choose either structured output or section-by-section generation")
+        if sectioned and not news:
+            result = self.generate_sections(platform, theme, audience, tone, profile, model, refresh=refresh)
+        elif structured:
+            result = self.generate_structured(platform, theme, audience, tone, profile, model, news=news)
+        else:
+            result = self.generate(platform, theme, audience, tone, profile, model, news)
+        if image is None:
+            return result
+        if self.image_generator is None:
+            result["image_error"] = "Image generation is not configured"
+            return result
+        try:
+            image_base64 = self.image_generator.generate_image(
+                prompt=image["prompt"],
+                dimensions=tuple(image.get("dimensions", (512, 512))),
+                negative_prompt=image.get("negative_prompt", ""),
+                cached=image.get("cached", False)
+            )
+            if image_base64:
+                result["image_base64"] = image_base64
+            else:
+                result["image_error"] = "Could not generate image"
+        except Exception as e:
+            result["image_error"] = str(e)
+        return result
+
+
+# Errors that will not go away by retrying the same job
+NON_RETRYABLE_ERRORS = (UnsafeContentError, QuotaExceededError, InvalidRequestError)
+
+
+def content_job_handlers(service: ContentService) -> Dict[str, Callable[[Dict[str, Any]], Any]]:
+    """JobWorker handlers backed by a ContentService"""
+    return {
+        "content": lambda params: service.generate_bundle(**params),
+        "variants": lambda params: service.generate_variants(**params),
+    }
+
+
+def content_service_from_env(**overrides) -> ContentService:
+    """
+    ContentService configured from the environment, the same for the app, the
+    API, job workers and the calendar scheduler: PROFILE_TOKEN_QUOTA,
+    STABILITY_API_KEY (images), SEMANTIC_CACHE_THRESHOLD (semantic cache),
+    ALPHA_VANTAGE_API_KEY (news grounding) and CACHE_URL (shared cache).
+    `overrides` replace constructor arguments, which are then not built.
+    """
+    options = dict(overrides)
+    if "llm_manager" not in options:
+        semantic_cache = None
+        threshold = os.getenv("SEMANTIC_CACHE_THRESHOLD")
+        if threshold:
+            from generators.semantic_cache import SemanticCache
+            semantic_cache = SemanticCache(threshold=float(threshold))
+        options["llm_manager"] = LLMManager(semantic_cache=semantic_cache)
+    if "quota_store" not in options:
+        # Daily token quota per company profile, shared by every process using the file
+        options["quota_store"] = QuotaStore(default_limit=int(os.getenv("PROFILE_TOKEN_QUOTA", "200000")))
+    if "image_generator" not in options:
+        stability_api_key = os.getenv("STABILITY_API_KEY")
+        if stability_api_key:
+            from generators.image_generator import ImageGenerator
+            options["image_generator"] = ImageGenerator(api_key=stability_api_key)
+    if "news_pipeline" not in options:
+        # Market news grounding, enabled with ALPHA_VANTAGE_API_KEY
+        from services.news_pipeline import news_pipeline_from_env
+        options["news_pipeline"] = news_pipeline_from_env()
+    return ContentService(**options)
@@ -0,0 +1,225 @@
+"""
+Process pool for CPU-bound embedding and text splitting.
+
+Each worker process loads the embedding model once and keeps it. Work is
+fanned out in chunks, and workers write vectors straight into a shared
+memory block owned by the parent instead of pickling them back.
+
+Scaling benchmark, from `src/`:
+    python -m services.embedding_pool --texts 2000 --processes 1,2,4,8
+"""
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from trackers.metrics import registry, tracer
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+# Per-process state, set by _init_worker
+_worker_embeddings = None
+_worker_splitter = None
+_worker_splitter_args = (1000, 200)
+
+
+def default_embeddings(model_name: str):
+    from langchain.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+def default_splitter(chunk_size: int, chunk_overlap: int):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+class SyntheticEmbeddings:
+    """
+    CPU-bound stand-in model (token hashing plus random projections) for
+    benchmarking the pool itself without downloading a model.
+    """
+
+    def __init__(self, model_name: str = "synthetic", dimension: int = 384, rounds: int = 64):
+        self.dimension = dimension
+        self.rounds = rounds
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            seed = sum(ord(c) * (i + 1) for i, c in enumerate(text[:512])) % (2 ** 32)
+            rng = np.random.default_rng(seed)
+            vector = np.zeros(self.dimension)
+            for _ in range(self.rounds):
+                vector = np.tanh(vector + rng.standard_normal(self.dimension))
+            vectors.append((vector / (np.linalg.norm(vector) or 1.0)).tolist())
+        return vectors
+
+
+def _init_worker(model_name: str, embeddings_factory: Callable[[str], Any],
+                 splitter_args: Tuple[int, int], threads: int):
+    global _worker_embeddings, _worker_splitter_args
+    # Avoid oversubscription: the pool already provides the parallelism
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_embeddings = embeddings_factory(model_name)
+    _worker_splitter_args = splitter_args
+
+
+def _embed_into(shm_name: str, shape: Tuple[int, int], start: int, texts: List[str]) -> int:
+    vectors = np.asarray(_worker_embeddings.embed_documents(texts), dtype=np.float32)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        target = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        target[start:start + len(texts)] = vectors
+        del target
+    finally:
+        shm.close()
+    return len(texts)
+
+
+def _embed_query(text: str) -> List[float]:
+    return list(_worker_embeddings.embed_query(text))
+
+
+def _dimension() -> int:
+    return len(_worker_embeddings.embed_query("dimension probe"))
+
+
+def _worker_pid(delay: float) -> int:
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _split(items: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+    global _worker_splitter
+    if _worker_splitter is None:
+        _worker_splitter = default_splitter(*_worker_splitter_args)
+    return [(chunk, metadata) for text, metadata in items for chunk in _worker_splitter.split_text(text)]
+
+
+def _chunks(items: Sequence[Any], size: int) -> List[Tuple[int, Sequence[Any]]]:
+    return [(start, items[start:start + size]) for start in range(0, len(items), size)]
+
+
+class EmbeddingPool:
+    """
+    Embeddings backed by a pool of worker processes with preloaded models.
+
+    Implements the LangChain embeddings interface (`embed_documents`,
+    `embed_query`), so it can be passed to vector stores in place of an
+    in-process model. Safe to use from several threads at once.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, processes: Optional[int] = None,
+                 chunk_size: int = 64, embeddings_factory: Callable[[str], Any] = default_embeddings,
+                 splitter_args: Tuple[int, int] = (1000, 200), start_method: str = "spawn"):
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        threads = max(1, (os.cpu_count() or 1) // self.processes)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=get_context(start_method), initializer=_init_worker,
+            initargs=(model_name, embeddings_factory, splitter_args, threads)
+        )
+        self._dimension: Optional[int] = None
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = self._executor.submit(_dimension).result()
+        return self._dimension
+
+    def warm_up(self, max_rounds: int = 20):
+        """Starts every worker, which loads its model, ahead of the first request"""
+        seen = set()
+        for _ in range(max_rounds):
+            futures = [self._executor.submit(_worker_pid, 0.05) for _ in range(self.processes)]
+            seen.update(future.result() for future in futures)
+            if len(seen) >= self.processes:
+                break
+        return self.dimension
+
+    def embed_array(self, texts: Sequence[str]) -> np.ndarray:
+        """Embeds texts in parallel and returns a float32 (len(texts), dimension) array"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        shape = (len(texts), self.dimension)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, math.prod(shape) * 4))
+        try:
+            with tracer.span("embedding_pool.embed", texts=len(texts), processes=self.processes):
+                futures = [self._executor.submit(_embed_into, shm.name, shape, start, chunk)
+                           for start, chunk in _chunks(texts, self.chunk_size)]
+                for future in futures:
+                    future.result()
+            registry.inc("embedding_pool_texts_total", len(texts), help="Texts embedded by the embedding pool")
+            return np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._executor.submit(_embed_query, text).result()
+
+    def split(self, items: List[Tuple[str, Dict[str, Any]]],
+              docs_per_task: int = 4) -> List[Tuple[str, Dict[str, Any]]]:
+        """Splits (text, metadata) pairs into chunks across the workers, keeping the input order"""
+        with tracer.span("embedding_pool.split", documents=len(items)):
+            results = self._executor.map(_split, [chunk for _, chunk in _chunks(items, docs_per_task)])
+            return [pair for result in results for pair in result]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def benchmark(texts: List[str], process_counts: List[int], **pool_kwargs) -> List[Dict[str, float]]:
+    """Measures embedding throughput for each process count (models are loaded before timing)"""
+    results = []
+    for processes in process_counts:
+        pool = EmbeddingPool(processes=processes, **pool_kwargs)
+        try:
+            pool.warm_up()
+            started = time.perf_counter()
+            pool.embed_array(texts)
+            elapsed = time.perf_counter() - started
+        finally:
+            pool.shutdown()
+        results.append({"processes": processes, "seconds": elapsed, "texts_per_second": len(texts) / elapsed})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding pool scaling benchmark")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--processes", default=",".join(str(n) for n in (1, 2, 4, os.cpu_count() or 1)))
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--synthetic", action="store_true", help="Use SyntheticEmbeddings instead of the model")
+    args = parser.parse_args()
+
+    sample = [f"Paper {i}: transformer models for scientific retrieval, abstract sentence {i % 17}." * 8
+              for i in range(args.texts)]
+    counts = sorted({int(n) for n in args.processes.split(",")})
+    baseline = None
+    print(f"{'processes':>9} {'seconds':>9} {'texts/s':>9} {'speedup':>8}")
+    factory = SyntheticEmbeddings if args.synthetic else default_embeddings
+    for row in benchmark(sample, counts, chunk_size=args.chunk_size, model_name=args.model,
+                         embeddings_factory=factory):
+        baseline = baseline or row["texts_per_second"]
+        print(f"{row['processes']:>9} {row['seconds']:>9.2f} {row['texts_per_second']:>9.1f} "
+              f"{row['texts_per_second'] / baseline:>7.2f}x")
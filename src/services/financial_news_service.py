@@ -1,17 +1,41 @@
 import requests
-from typing import List, Dict
+from typing import List, Dict, Optional
 import yfinance as yf
 from datetime import datetime, timedelta
+from trackers.metrics import tracer, record_payload
+from utils.cache_backend import TieredCache, shared_cache
 
 class FinancialNewsService:
-    def __init__(self, alpha_vantage_key: str):
+    def __init__(self, alpha_vantage_key: str, cache: Optional[TieredCache] = None):
         self.alpha_vantage_key = alpha_vantage_key
+        # Alpha Vantage quotas are per key, so all worker processes share one snapshot
+        self.cache = cache or shared_cache()
         
+    def fetch_feed(self, time_from: Optional[str] = None, limit: int = 1000) -> List[Dict]:
+        """Raw NEWS_SENTIMENT feed items, newest first; `time_from` is YYYYMMDDTHHMM (UTC)"""
+        params = {"function": "NEWS_SENTIMENT", "apikey": self.alpha_vantage_key, "sort": "LATEST", "limit": limit}
+        if time_from:
+            params["time_from"] = time_from
+        with tracer.span("retrieval.news_feed"):
+            response = requests.get("https://www.alphavantage.co/query", params=params, timeout=30)
+            record_payload("retrieval.news_feed", "response", len(response.content or b""))
+            data = response.json()
+        if "feed" not in data:
+            # Rate limits and bad keys come back as 200 with an "Information" or "Note" message
+            raise ValueError(data.get("Information") or data.get("Note") or data.get("Error Message")
+                             or "Unexpected Alpha Vantage response")
+        return data["feed"]
+
     def get_market_news(self) -> List[Dict]:
+        return self.cache.get_or_compute("market_news", "latest", self._fetch_market_news)
+
+    def _fetch_market_news(self) -> List[Dict]:
         # Get news from Alpha Vantage
         url = f"https://www.alphavantage.co/query?function=NEWS_SENTIMENT&apikey={self.alpha_vantage_key}"
-        response = requests.get(url)
-        data = response.json()
+        with tracer.span("retrieval.market_news"):
+            response = requests.get(url)
+            record_payload("retrieval.market_news", "response", len(response.content or b""))
+            data = response.json()
         
         # Get market data from Yahoo Finance
         indices = ["^GSPC", "^IXIC", "^DJI"]  # S&P 500, NASDAQ, Dow Jones
@@ -21,8 +45,8 @@ class FinancialNewsService:
             ticker = yf.Ticker(index)
             hist = ticker.history(period="1d")
             market_data[index] = {
-                "price": hist['Close'].iloc[-1],
-                "change": hist['Close'].iloc[-1] - hist['Open'].iloc[-1]
+                "price": float(hist['Close'].iloc[-1]),
+                "change": float(hist['Close'].iloc[-1] - hist['Open'].iloc[-1])
             }
             
         return {
@@ -0,0 +1,244 @@
+"""
+Hybrid lexical + dense retrieval over arXiv chunks.
+
+A BM25 inverted index is kept next to the vector store and updated in the
+same `add_documents()` call, so both always hold the same chunks. Queries
+are answered by reciprocal rank fusion of the two rankings, or by BM25
+alone for keyword-style queries (quoted phrases, identifiers such as
+"GPT-4", "LoRA" or "arXiv:2106.09685") that gain nothing from an embedding
+and would otherwise pay the embedding latency. A quoted phrase only matches
+chunks containing its terms in that order.
+"""
+import heapq
+import math
+import re
+import threading
+import uuid
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from trackers.metrics import registry, tracer
+from utils.errors import InvalidRequestError
+
+HYBRID, LEXICAL, DENSE, AUTO = "hybrid", "lexical", "dense", "auto"
+MODES = (HYBRID, LEXICAL, DENSE, AUTO)
+
+# Chunk metadata keys linking vector store results back to BM25 documents of this index
+CHUNK_ID = "chunk_id"
+INDEX_ID = "index_id"
+
+STOPWORDS = frozenset("""
+    a an and are as at be by for from has have in into is it its of on or that the their this to
+    was we were which with
+""".split())
+
+_TERM = re.compile(r"[a-z0-9]+(?:[-_.:][a-z0-9]+)*")
+_RAW_TERM = re.compile(r"[A-Za-z0-9]+(?:[-_.:][A-Za-z0-9]+)*")
+_IDENTIFIER = re.compile(r"\d|[-_.:]|^[A-Z]{2,}s?$|[a-z][A-Z]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms without stopwords. Compound terms ("bert-base",
+    "2106.09685") are kept whole and also split into their parts, so both
+    the exact term and its pieces match.
+    """
+    terms = []
+    for term in _TERM.findall((text or "").lower()):
+        if term in STOPWORDS:
+            continue
+        terms.append(term)
+        parts = re.split(r"[-_.:]", term)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part and part not in STOPWORDS)
+    return terms
+
+
+def contains_phrase(text: str, phrase: str) -> bool:
+    """True if the phrase terms appear consecutively in the text, ignoring case and punctuation"""
+    words = " ".join(_TERM.findall((phrase or "").lower()))
+    return bool(words) and f" {words} " in f" {' '.join(_TERM.findall((text or '').lower()))} "
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Any]], k: int = 60,
+                           limit: Optional[int] = None) -> List[Tuple[Any, float]]:
+    """Fuses ranked id lists: score(d) = sum(1 / (k + rank)), rank starting at 1"""
+    scores: Dict[Any, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+    return fused[:limit] if limit is not None else fused
+
+
+class BM25Index:
+    """
+    Incremental Okapi BM25 over tokenized chunks.
+
+    Postings map each term to {doc_id: term frequency}; document lengths and
+    the total length are updated on every add, so IDF and length
+    normalization always reflect the whole corpus without a rebuild.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def add(self, doc_id: int, text: str):
+        counts = Counter(tokenize(text))
+        with self._lock:
+            if doc_id in self._lengths:
+                raise ValueError(f"Document {doc_id} is already indexed")
+            for term, count in counts.items():
+                self._postings[term][doc_id] = count
+            length = sum(counts.values())
+            self._lengths[doc_id] = length
+            self._total_length += length
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._postings
+
+    def idf(self, term: str) -> float:
+        n = len(self._lengths)
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k (doc_id, score) for the query terms, best first"""
+        terms = Counter(tokenize(query))
+        with self._lock:
+            if not self._lengths:
+                return []
+            average = self._total_length / len(self._lengths)
+            scores: Dict[int, float] = defaultdict(float)
+            for term, query_count in terms.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = self.idf(term)
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average)
+                    scores[doc_id] += query_count * idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda pair: pair[1])
+
+
+class HybridIndex:
+    """
+    Vector store plus BM25 index over the same chunks.
+
+    `vectorstore` is any store with `add_documents()` and
+    `similarity_search(query, k)` (Chroma); every chunk gets `chunk_id` and
+    `index_id` metadata entries so dense hits map back to the same document,
+    and hits from other indexes sharing the store are dropped. `rrf_k` is
+    the reciprocal rank fusion constant and `candidates` how many results
+    each ranking contributes to the fusion.
+    """
+
+    def __init__(self, vectorstore: Any = None, mode: str = AUTO, k: int = 4, rrf_k: int = 60,
+                 candidates: int = 20, lexical_max_terms: int = 4):
+        if mode not in MODES:
+            raise InvalidRequestError(f"Unknown retrieval mode {mode!r}; use one of {', '.join(MODES)}")
+        self.vectorstore = vectorstore
+        self.mode = mode
+        self.k = k
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.lexical_max_terms = lexical_max_terms
+        self.bm25 = BM25Index()
+        self.index_id = uuid.uuid4().hex
+        self._documents: List[Any] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add_documents(self, documents: Iterable[Any]) -> List[int]:
+        """Indexes chunks (objects with page_content and metadata) in both indexes"""
+        documents = list(documents)
+        with self._lock:
+            start = len(self._documents)
+            ids = list(range(start, start + len(documents)))
+            for doc_id, document in zip(ids, documents):
+                document.metadata = dict(document.metadata or {}, **{CHUNK_ID: doc_id, INDEX_ID: self.index_id})
+                self.bm25.add(doc_id, document.page_content)
+            self._documents.extend(documents)
+        if self.vectorstore is not None and documents:
+            with tracer.span("retrieval.embed_index", chunks=len(documents)):
+                self.vectorstore.add_documents(documents)
+        return ids
+
+    def needs_embedding(self, query: str) -> bool:
+        """
+        False for keyword-style queries: a quoted phrase, or a few terms that
+        are all identifiers (digits, inner punctuation, acronyms, mixed case)
+        already present in the index.
+        """
+        stripped = query.strip()
+        if len(stripped) > 2 and stripped[0] == stripped[-1] == '"':
+            return False
+        raw_terms = _RAW_TERM.findall(stripped)
+        if not raw_terms or len(raw_terms) > self.lexical_max_terms:
+            return True
+        return not all(_IDENTIFIER.search(term) and term.lower() in self.bm25 for term in raw_terms)
+
+    def resolve_mode(self, query: str, mode: Optional[str] = None) -> str:
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise InvalidRequestError(f"Unknown retrieval mode {mode!r}; use one of {', '.join(MODES)}")
+        if self.vectorstore is None:
+            return LEXICAL
+        if mode == AUTO:
+            return HYBRID if self.needs_embedding(query) else LEXICAL
+        return mode
+
+    def search(self, query: str, k: Optional[int] = None, mode: Optional[str] = None) -> List[Any]:
+        """The k best chunks for the query (AUTO: lexical fast path or hybrid)"""
+        k = k or self.k
+        mode = self.resolve_mode(query, mode)
+        with tracer.span("retrieval.search", mode=mode, k=k) as span:
+            if mode == LEXICAL:
+                ids = self._lexical_ids(query, k)
+            else:
+                dense_ids = self._dense_ids(query, k if mode == DENSE else max(k, self.candidates))
+                if mode == DENSE:
+                    ids = dense_ids[:k]
+                else:
+                    lexical_ids = [doc_id for doc_id, _ in self.bm25.search(query, max(k, self.candidates))]
+                    ids = [doc_id for doc_id, _ in
+                           reciprocal_rank_fusion([lexical_ids, dense_ids], self.rrf_k, limit=k)]
+            span.set_attribute("retrieval.results", len(ids))
+        registry.inc("retrieval_queries_total", labels={"mode": mode}, help="Scientific retrieval queries by mode")
+        return [self._documents[doc_id] for doc_id in ids]
+
+    def _lexical_ids(self, query: str, k: int) -> List[int]:
+        stripped = query.strip()
+        if not (len(stripped) > 2 and stripped[0] == stripped[-1] == '"'):
+            return [doc_id for doc_id, _ in self.bm25.search(stripped, k)]
+        # Phrase query: BM25 ranks the candidates, only chunks with the exact term sequence are kept
+        phrase = stripped[1:-1]
+        ids = []
+        for doc_id, _ in self.bm25.search(phrase, len(self.bm25)):
+            if contains_phrase(self._documents[doc_id].page_content, phrase):
+                ids.append(doc_id)
+                if len(ids) == k:
+                    break
+        return ids
+
+    def _dense_ids(self, query: str, k: int) -> List[int]:
+        ids = []
+        for document in self.vectorstore.similarity_search(query, k=k):
+            metadata = document.metadata or {}
+            doc_id = metadata.get(CHUNK_ID)
+            # Stores shared with other indexes (or holding older chunks) return ids that are not ours
+            if metadata.get(INDEX_ID) != self.index_id or not isinstance(doc_id, int):
+                continue
+            if 0 <= doc_id < len(self._documents) and doc_id not in ids:
+                ids.append(doc_id)
+        return ids
@@ -0,0 +1,334 @@
+"""
+Durable local job queue for long-running generations.
+
+Jobs live in a SQLite file, so they survive Streamlit reruns, disconnects
+and process restarts, and any number of worker processes can drain them:
+    python -m services.job_queue --workers 4
+"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type
+
+from trackers.metrics import registry, tracer
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATES = (SUCCEEDED, FAILED)
+
+
+def make_idempotency_key(kind: str, params: Dict[str, Any], version: Optional[str] = None) -> str:
+    """
+    Derives a stable key from the job kind, its normalized parameters and
+    the version of any other inputs it depends on (e.g. the profile content)
+    """
+    def normalize(value):
+        if isinstance(value, str):
+            # Case is kept: it shows in the generated text
+            return " ".join(value.split())
+        if isinstance(value, dict):
+            return {k: normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+
+    data = {"kind": kind, "params": normalize(params)}
+    if version is not None:
+        data["version"] = version
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Job:
+    id: str
+    idempotency_key: str
+    kind: str
+    params: Dict[str, Any]
+    state: str
+    result: Optional[Any]
+    error: Optional[str]
+    attempts: int
+    created_at: float
+    updated_at: float
+
+    @property
+    def done(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+_COLUMNS = "id, idempotency_key, kind, params, state, result, error, attempts, created_at, updated_at"
+
+
+def _row_to_job(row) -> Job:
+    return Job(
+        id=row[0], idempotency_key=row[1], kind=row[2], params=json.loads(row[3]),
+        state=row[4], result=json.loads(row[5]) if row[5] is not None else None,
+        error=row[6], attempts=row[7], created_at=row[8], updated_at=row[9]
+    )
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue.
+
+    Submitting the same request twice returns the existing job instead of
+    enqueuing a new one. `versioner(kind, params)` adds the version of inputs
+    that are not in the parameters (profile, template) to the key, so edits
+    start a new job. A finished job is run again when it is older than
+    `result_ttl` seconds or submitted with `regenerate=True`. Workers claim
+    jobs under a lease; a job whose worker died is picked up again once the
+    lease expires, up to `max_attempts`.
+    """
+
+    def __init__(self, db_path: str = "jobs.db", lease_seconds: float = 300.0, max_attempts: int = 3,
+                 result_ttl: Optional[float] = 3600.0,
+                 versioner: Optional[Callable[[str, Dict[str, Any]], Optional[str]]] = None):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+        self.versioner = versioner
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_state_created ON jobs (state, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return conn
+
+    def submit(self, kind: str, params: Dict[str, Any], idempotency_key: Optional[str] = None,
+               regenerate: bool = False) -> Job:
+        """
+        Enqueues a job, or returns the existing one with the same idempotency
+        key. A failed or expired job, or any finished one if `regenerate`, is
+        queued again under the same id.
+        """
+        if idempotency_key is None:
+            version = self.versioner(kind, params) if self.versioner else None
+            idempotency_key = make_idempotency_key(kind, params, version)
+        key = idempotency_key
+        now = time.time()
+        expired_before = now - self.result_ttl if self.result_ttl is not None else float("-inf")
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (id, idempotency_key, kind, params, state, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (uuid.uuid4().hex, key, kind, json.dumps(params, ensure_ascii=False), QUEUED, now, now)
+                ).rowcount
+                if not inserted:
+                    # Failed jobs, expired results and explicit regenerations run again
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, result = NULL, error = NULL, attempts = 0, updated_at = ? "
+                        "WHERE idempotency_key = ? AND (state = ? OR (state = ? AND (? OR updated_at < ?)))",
+                        (QUEUED, now, key, FAILED, SUCCEEDED, regenerate, expired_before)
+                    )
+                row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        registry.inc("jobs_submitted_total", 1, {"kind": kind, "deduplicated": str(not inserted).lower()},
+                     help="Jobs submitted to the queue")
+        return _row_to_job(row)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Returns the job, or None if it does not exist (or was deleted)"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def claim(self, worker_id: str, kinds: Optional[List[str]] = None) -> Optional[Job]:
+        """Takes the oldest runnable job (queued, or running with an expired lease)"""
+        now = time.time()
+        kind_filter = ""
+        args: List[Any] = [QUEUED, RUNNING, now, self.max_attempts]
+        if kinds:
+            kind_filter = f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            args.extend(kinds)
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, error = ?, worker_id = NULL, updated_at = ? "
+                    "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                    (FAILED, "Worker lease expired on the last attempt", now, RUNNING, now, self.max_attempts)
+                )
+                row = conn.execute(
+                    f"SELECT id FROM jobs WHERE (state = ? OR (state = ? AND lease_expires < ?)) "
+                    f"AND attempts < ?{kind_filter} ORDER BY created_at LIMIT 1",
+                    args
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET state = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE id = ?",
+                    (RUNNING, worker_id, now + self.lease_seconds, now, row[0])
+                )
+                job_row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (row[0],)).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return _row_to_job(job_row)
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extends the lease of a running job; returns False if the worker lost it"""
+        with closing(self._connect()) as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker_id = ? AND state = ?",
+                (time.time() + self.lease_seconds, job_id, worker_id, RUNNING)
+            ).rowcount
+        return updated > 0
+
+    def complete(self, job_id: str, worker_id: str, result: Any):
+        self._finish(job_id, worker_id, SUCCEEDED, result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True):
+        """Marks a job failed, or requeues it while it has attempts left"""
+        job = self.get(job_id)
+        state = QUEUED if retry and job and job.attempts < self.max_attempts else FAILED
+        self._finish(job_id, worker_id, state, error=error)
+
+    def _finish(self, job_id: str, worker_id: str, state: str, result: Optional[str] = None,
+                error: Optional[str] = None):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ?, worker_id = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ? AND worker_id = ?",
+                (state, result, error, time.time(), job_id, worker_id)
+            )
+
+    def watch(self, job_id: str, poll_interval: float = 0.5, timeout: Optional[float] = None) -> Iterator[Job]:
+        """Yields the job each time its state changes, until it finishes or the timeout expires"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        last_seen = None
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            if (job.state, job.updated_at) != last_seen:
+                last_seen = (job.state, job.updated_at)
+                yield job
+            if job.done or (deadline is not None and time.monotonic() >= deadline):
+                return
+            time.sleep(poll_interval)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll_interval: float = 0.5) -> Optional[Job]:
+        """Blocks until the job finishes (or the timeout expires) and returns its last state"""
+        job = None
+        for job in self.watch(job_id, poll_interval, timeout):
+            pass
+        return job
+
+
+class JobWorker:
+    """Claims jobs from a JobQueue and runs the handler registered for their kind"""
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[Dict[str, Any]], Any]],
+                 worker_id: Optional[str] = None, poll_interval: float = 0.5,
+                 non_retryable: Tuple[Type[BaseException], ...] = ()):
+        self.queue = queue
+        self.handlers = handlers
+        self.non_retryable = non_retryable
+        self.worker_id = worker_id or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.poll_interval = poll_interval
+
+    def run_once(self) -> bool:
+        """Runs at most one job; returns False when there was nothing to do"""
+        job = self.queue.claim(self.worker_id, list(self.handlers))
+        if job is None:
+            return False
+        stop_heartbeat = threading.Event()
+
+        def heartbeat():
+            while not stop_heartbeat.wait(self.queue.lease_seconds / 3):
+                self.queue.heartbeat(job.id, self.worker_id)
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            with tracer.span("job.run", kind=job.kind, attempt=job.attempts):
+                result = self.handlers[job.kind](job.params)
+            self.queue.complete(job.id, self.worker_id, result)
+            registry.inc("jobs_finished_total", 1, {"kind": job.kind, "state": SUCCEEDED},
+                         help="Jobs finished by workers")
+        except Exception as e:
+            logger.warning(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+            self.queue.fail(job.id, self.worker_id, str(e), retry=not isinstance(e, self.non_retryable))
+            registry.inc("jobs_finished_total", 1, {"kind": job.kind, "state": FAILED},
+                         help="Jobs finished by workers")
+        finally:
+            stop_heartbeat.set()
+        return True
+
+    def run_forever(self, stop_event: Optional[threading.Event] = None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            if not self.run_once():
+                stop_event.wait(self.poll_interval)
+
+
+def job_queue_from_env(versioner: Optional[Callable[[str, Dict[str, Any]], Optional[str]]] = None) -> JobQueue:
+    return JobQueue(os.getenv("JOB_QUEUE_DB", "jobs.db"),
+                    result_ttl=float(os.getenv("JOB_RESULT_TTL", "3600")), versioner=versioner)
+
+
+def _worker_main(db_path: str):
+    from dotenv import load_dotenv
+    from services.content_service import NON_RETRYABLE_ERRORS, content_job_handlers, content_service_from_env
+
+    load_dotenv()
+    # Same configuration as the app and the API, so news and cached jobs run here too
+    service = content_service_from_env()
+    JobWorker(JobQueue(db_path), content_job_handlers(service),
+              non_retryable=NON_RETRYABLE_ERRORS).run_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run job queue workers")
+    parser.add_argument("--db", default="jobs.db")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    processes = [multiprocessing.Process(target=_worker_main, args=(args.db,)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
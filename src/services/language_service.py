@@ -1,5 +1,8 @@
-from typing import List
+from typing import List, Optional
 from translate import Translator
+from trackers.metrics import tracer, record_payload
+from utils.cache_backend import TieredCache, cache_key, shared_cache
+from utils.errors import InvalidRequestError
 
 class LanguageService:
     SUPPORTED_LANGUAGES = {
@@ -9,15 +12,25 @@ class LanguageService:
         'it': 'Italiano'
     }
     
-    def __init__(self):
+    def __init__(self, cache: Optional[TieredCache] = None):
         self.translators = {
             lang: Translator(to_lang=lang) 
             for lang in self.SUPPORTED_LANGUAGES.keys()
         }
+        # Translations are shared by every worker process through the shared cache
+        self.cache = cache or shared_cache()
     
     def translate_content(self, content: str, target_language: str) -> str:
         if target_language not in self.SUPPORTED_LANGUAGES:
-            raise ValueError(f"Unsupported language: {target_language}")
+            raise InvalidRequestError(f"Unsupported language: {target_language}")
             
+        return self.cache.get_or_compute("translation", cache_key(target_language, content),
+                                         lambda: self._translate(content, target_language))
+
+    def _translate(self, content: str, target_language: str) -> str:
         translator = self.translators[target_language]
-        return translator.translate(content)
\ No newline at end of file
+        with tracer.span("translation.translate", target_language=target_language):
+            record_payload("translation.translate", "request", len(content.encode("utf-8")))
+            translated = translator.translate(content)
+            record_payload("translation.translate", "response", len(translated.encode("utf-8")))
+            return translated
\ No newline at end of file
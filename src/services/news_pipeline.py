@@ -0,0 +1,334 @@
+"""
+Financial news pipeline for grounding generated posts.
+
+Alpha Vantage NEWS_SENTIMENT feed items are ingested incrementally into a
+SQLite store, de-duplicated by URL, and each refresh only asks for items
+newer than the latest one stored. Ticker and topic sentiment is aggregated
+with numpy (relevance-weighted, decayed by age) and cached until the next
+ingest, and `context_block()` turns it into a few lines that fit in a
+PromptManager prefix instead of the raw article list.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from trackers.metrics import registry, tracer
+
+logger = logging.getLogger(__name__)
+
+AV_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def parse_time(value: str) -> float:
+    """Alpha Vantage timestamps ("20240102T153000", UTC) to epoch seconds"""
+    value = value.strip()
+    if len(value) == 13:
+        value += "00"
+    return datetime.strptime(value, AV_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+
+def format_time(epoch: float) -> str:
+    """Epoch seconds to the `time_from` format accepted by Alpha Vantage (YYYYMMDDTHHMM)"""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y%m%dT%H%M")
+
+
+def sentiment_label(score: float) -> str:
+    """Alpha Vantage's own thresholds for sentiment scores"""
+    if score <= -0.35:
+        return "Bearish"
+    if score <= -0.15:
+        return "Somewhat-Bearish"
+    if score < 0.15:
+        return "Neutral"
+    if score < 0.35:
+        return "Somewhat-Bullish"
+    return "Bullish"
+
+
+def _float(value: Any, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class NewsStore:
+    """SQLite store of feed items with their per-ticker and per-topic scores"""
+
+    def __init__(self, db_path: str = "news.db"):
+        self.db_path = db_path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    url TEXT PRIMARY KEY,
+                    published REAL NOT NULL,
+                    title TEXT NOT NULL,
+                    source TEXT,
+                    score REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS articles_published ON articles (published);
+                CREATE TABLE IF NOT EXISTS ticker_sentiment (
+                    url TEXT NOT NULL,
+                    ticker TEXT NOT NULL,
+                    relevance REAL NOT NULL,
+                    score REAL NOT NULL,
+                    PRIMARY KEY (url, ticker)
+                );
+                CREATE TABLE IF NOT EXISTS topic_relevance (
+                    url TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    relevance REAL NOT NULL,
+                    PRIMARY KEY (url, topic)
+                );
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def ingest(self, feed: Iterable[Dict[str, Any]]) -> int:
+        """Stores new feed items; items already stored (same URL) are skipped. Returns how many were new"""
+        added = 0
+        with closing(self._connect()) as conn, conn:
+            for item in feed:
+                url = item.get("url")
+                if not url or not item.get("time_published"):
+                    continue
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO articles (url, published, title, source, score) VALUES (?, ?, ?, ?, ?)",
+                    (url, parse_time(item["time_published"]), item.get("title", ""), item.get("source"),
+                     _float(item.get("overall_sentiment_score")))
+                )
+                if cursor.rowcount == 0:
+                    continue
+                added += 1
+                conn.executemany(
+                    "INSERT OR IGNORE INTO ticker_sentiment (url, ticker, relevance, score) VALUES (?, ?, ?, ?)",
+                    [(url, ticker["ticker"], _float(ticker.get("relevance_score")),
+                      _float(ticker.get("ticker_sentiment_score")))
+                     for ticker in item.get("ticker_sentiment", []) if ticker.get("ticker")]
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO topic_relevance (url, topic, relevance) VALUES (?, ?, ?)",
+                    [(url, topic["topic"], _float(topic.get("relevance_score")))
+                     for topic in item.get("topics", []) if topic.get("topic")]
+                )
+        return added
+
+    def latest_published(self) -> Optional[float]:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT MAX(published) FROM articles").fetchone()[0]
+
+    def prune(self, before: float) -> int:
+        """Deletes items published before `before`"""
+        with closing(self._connect()) as conn, conn:
+            old = "SELECT url FROM articles WHERE published < ?"
+            conn.execute(f"DELETE FROM ticker_sentiment WHERE url IN ({old})", (before,))
+            conn.execute(f"DELETE FROM topic_relevance WHERE url IN ({old})", (before,))
+            return conn.execute("DELETE FROM articles WHERE published < ?", (before,)).rowcount
+
+    def ticker_rows(self, since: float) -> List[Tuple[str, float, float, float]]:
+        """(ticker, published, relevance, score) for items published since `since`"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT t.ticker, a.published, t.relevance, t.score FROM ticker_sentiment t "
+                "JOIN articles a ON a.url = t.url WHERE a.published >= ?", (since,)
+            ).fetchall()
+
+    def topic_rows(self, since: float) -> List[Tuple[str, float, float, float]]:
+        """(topic, published, relevance, article score) for items published since `since`"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT t.topic, a.published, t.relevance, a.score FROM topic_relevance t "
+                "JOIN articles a ON a.url = t.url WHERE a.published >= ?", (since,)
+            ).fetchall()
+
+    def headlines(self, since: float, limit: int) -> List[Tuple[str, Optional[str], float, float]]:
+        """(title, source, published, score) of the most recent items"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT title, source, published, score FROM articles WHERE published >= ? "
+                "ORDER BY published DESC LIMIT ?", (since, limit)
+            ).fetchall()
+
+    def count(self, since: float = 0.0) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM articles WHERE published >= ?", (since,)).fetchone()[0]
+
+
+@dataclass
+class SentimentScore:
+    name: str
+    score: float
+    mentions: int
+    weight: float
+
+    @property
+    def label(self) -> str:
+        return sentiment_label(self.score)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "score": round(self.score, 4), "label": self.label,
+                "mentions": self.mentions, "weight": round(self.weight, 4)}
+
+
+@dataclass
+class SentimentSnapshot:
+    """Aggregated sentiment over a time window, strongest signal first"""
+    window_hours: float
+    articles: int
+    tickers: List[SentimentScore] = field(default_factory=list)
+    topics: List[SentimentScore] = field(default_factory=list)
+    headlines: List[Tuple[str, Optional[str], float, float]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "window_hours": self.window_hours,
+            "articles": self.articles,
+            "tickers": [score.to_dict() for score in self.tickers],
+            "topics": [score.to_dict() for score in self.topics],
+            "headlines": [{"title": title, "source": source, "published": format_time(published),
+                           "score": score} for title, source, published, score in self.headlines],
+        }
+
+
+def aggregate_scores(rows: List[Tuple[str, float, float, float]], now: float,
+                     half_life_hours: float) -> List[SentimentScore]:
+    """
+    Weighted mean sentiment per name, with weight = relevance * 0.5 ** (age / half-life).
+    Sorted by total weight, so the most discussed names come first.
+    """
+    if not rows:
+        return []
+    names = np.array([row[0] for row in rows])
+    published, relevance, scores = np.array([row[1:] for row in rows], dtype=np.float64).T
+    age_hours = np.maximum(now - published, 0.0) / 3600.0
+    weights = relevance * np.power(0.5, age_hours / half_life_hours)
+    unique, inverse = np.unique(names, return_inverse=True)
+    total_weight = np.bincount(inverse, weights=weights, minlength=len(unique))
+    weighted_score = np.bincount(inverse, weights=weights * scores, minlength=len(unique))
+    mentions = np.bincount(inverse, minlength=len(unique))
+    mean = np.divide(weighted_score, total_weight, out=np.zeros_like(weighted_score), where=total_weight > 0)
+    order = np.argsort(-total_weight, kind="stable")
+    return [SentimentScore(str(unique[i]), float(mean[i]), int(mentions[i]), float(total_weight[i]))
+            for i in order]
+
+
+class NewsPipeline:
+    """
+    Keeps the NewsStore fresh from a feed source and serves aggregated sentiment.
+
+    `source` is anything with `fetch_feed(time_from=None) -> List[Dict]`, such
+    as FinancialNewsService. Refreshes happen at most every `refresh_interval`
+    seconds (Alpha Vantage quotas are small) and a failed refresh falls back to
+    what is already stored. Snapshots are cached until the next ingest.
+    """
+
+    def __init__(self, store: NewsStore, source: Optional[Any] = None, window_hours: float = 72.0,
+                 half_life_hours: float = 24.0, refresh_interval: float = 3600.0):
+        self.store = store
+        self.source = source
+        self.window_hours = window_hours
+        self.half_life_hours = half_life_hours
+        self.refresh_interval = refresh_interval
+        self._last_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self._snapshot: Optional[Tuple[Tuple, SentimentSnapshot]] = None
+        self._generation = 0
+
+    def refresh(self, force: bool = False) -> int:
+        """Fetches items newer than the latest stored one; returns how many were new"""
+        if self.source is None:
+            return 0
+        with self._refresh_lock:
+            if not force and time.time() - self._last_refresh < self.refresh_interval:
+                return 0
+            self._last_refresh = time.time()
+            latest = self.store.latest_published()
+            try:
+                with tracer.span("news.refresh"):
+                    feed = self.source.fetch_feed(time_from=format_time(latest) if latest else None)
+            except Exception as e:
+                logger.warning(f"News refresh failed, using stored items: {e}")
+                return 0
+            added = self.store.ingest(feed)
+            # Keep a few windows of history, enough for any snapshot
+            self.store.prune(time.time() - 4 * self.window_hours * 3600)
+            if added:
+                self._generation += 1
+            registry.inc("news_items_ingested_total", added, help="News items added to the news store")
+            return added
+
+    def snapshot(self, now: Optional[float] = None, headlines: int = 3) -> SentimentSnapshot:
+        """Aggregated sentiment over the window; recomputed only after new items or hourly"""
+        now = time.time() if now is None else now
+        # The decay changes slowly, so an hour-old aggregation is still representative
+        key = (self._generation, int(now // 3600), headlines)
+        cached = self._snapshot
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        since = now - self.window_hours * 3600
+        with tracer.span("news.aggregate"):
+            snapshot = SentimentSnapshot(
+                window_hours=self.window_hours,
+                articles=self.store.count(since),
+                tickers=aggregate_scores(self.store.ticker_rows(since), now, self.half_life_hours),
+                topics=aggregate_scores(self.store.topic_rows(since), now, self.half_life_hours),
+                headlines=self.store.headlines(since, headlines),
+            )
+        self._snapshot = (key, snapshot)
+        return snapshot
+
+    def context_block(self, query: str = "", max_tickers: int = 5, max_topics: int = 3,
+                      headlines: int = 3) -> Optional[str]:
+        """
+        Compact market context for a prompt. Tickers and topics named in
+        `query` come first, then the most discussed ones. None if no news is stored.
+        """
+        self.refresh()
+        snapshot = self.snapshot(headlines=headlines)
+        if not snapshot.articles:
+            return None
+        words = {word.strip(".,:;!?()$").lower() for word in query.split()}
+
+        def pick(scores: List[SentimentScore], limit: int) -> List[SentimentScore]:
+            named = [score for score in scores
+                     if score.name.lower() in words or set(score.name.lower().replace("_", " ").split()) & words]
+            return (named + [score for score in scores if score not in named])[:limit]
+
+        def describe(score: SentimentScore) -> str:
+            return f"{score.name.replace('_', ' ')} {score.score:+.2f} {score.label} ({score.mentions})"
+
+        lines = [f"Market News Context (last {snapshot.window_hours:g}h, {snapshot.articles} articles):"]
+        tickers = pick(snapshot.tickers, max_tickers)
+        if tickers:
+            lines.append("- Ticker sentiment: " + "; ".join(describe(score) for score in tickers))
+        topics = pick(snapshot.topics, max_topics)
+        if topics:
+            lines.append("- Topic sentiment: " + "; ".join(describe(score) for score in topics))
+        for title, source, published, _ in snapshot.headlines:
+            date = datetime.fromtimestamp(published, tz=timezone.utc).strftime("%Y-%m-%d")
+            lines.append(f"- Headline: {title} ({source or 'unknown'}, {date})")
+        lines.append("Use this context only where relevant; do not invent figures beyond it.")
+        return "\n".join(lines)
+
+
+def news_pipeline_from_env() -> Optional[NewsPipeline]:
+    """Pipeline fed by Alpha Vantage, or None without ALPHA_VANTAGE_API_KEY"""
+    api_key = os.getenv("ALPHA_VANTAGE_API_KEY")
+    if not api_key:
+        return None
+    from services.financial_news_service import FinancialNewsService
+    return NewsPipeline(
+        NewsStore(os.getenv("NEWS_DB", "news.db")), FinancialNewsService(alpha_vantage_key=api_key),
+        window_hours=float(os.getenv("NEWS_WINDOW_HOURS", "72")),
+        refresh_interval=float(os.getenv("NEWS_REFRESH_MINUTES", "60")) * 60,
+    )
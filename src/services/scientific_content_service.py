@@ -1,11 +1,17 @@
 from langchain.document_loaders import ArxivLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores import Chroma
-from langchain.chains import RetrievalQAWithSourcesChain
-from typing import List, Dict
+from langchain.chains import QAWithSourcesChain, RetrievalQAWithSourcesChain
+from typing import List, Dict, Optional
+import os
+import threading
+import uuid
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.schema import Document
 from langchain.llms import HuggingFaceHub
+from trackers.metrics import tracer
+from services.embedding_pool import EmbeddingPool
+from services.hybrid_index import AUTO, HybridIndex
 
 def filter_complex_metadata(metadata: Dict) -> Dict:
     """Filter out None values and complex types from metadata."""
@@ -16,20 +22,65 @@ def filter_complex_metadata(metadata: Dict) -> Dict:
             filtered_metadata[key] = value
     return filtered_metadata
 
+class _LockedEmbeddings:
+    """Serializes calls into an in-process embedding model shared by several threads"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            return self.embeddings.embed_query(text)
+
 class ScientificContentService:
+    """
+    Process-wide singleton; safe to share between threads and sessions.
+
+    Creation and initialization happen once under a lock. The text splitter
+    is stateless and the LLM client is thread-safe. The in-process embedding
+    model is serialized by a lock; with `workers` (or SCIENTIFIC_WORKERS)
+    set, splitting and embedding fan out to an EmbeddingPool of processes
+    instead and run in parallel.
+
+    Chunks are indexed in a HybridIndex (Chroma plus BM25); retrieval mode,
+    top-k and the fusion constant come from SCIENTIFIC_RETRIEVAL,
+    SCIENTIFIC_TOP_K and SCIENTIFIC_RRF_K.
+    """
     _instance = None
+    _lock = threading.Lock()
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
-            cls._instance = super(ScientificContentService, cls).__new__(cls)
-            cls._instance.initialized = False
+            with cls._lock:
+                if cls._instance is None:
+                    instance = super(ScientificContentService, cls).__new__(cls)
+                    instance.initialized = False
+                    cls._instance = instance
         return cls._instance
 
-    def __init__(self, api_token: str = None):  # Modificado para aceptar el token
-        if not self.initialized:
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="all-MiniLM-L6-v2"
-            )
+    def __init__(self, api_token: str = None, workers: Optional[int] = None):  # Modificado para aceptar el token
+        if self.initialized:
+            return
+        with self._lock:
+            if self.initialized:
+                return
+            if workers is None:
+                workers = int(os.getenv("SCIENTIFIC_WORKERS", "0"))
+            self.pool = EmbeddingPool(processes=workers) if workers > 0 else None
+            if self.pool is not None:
+                self.embeddings = self.pool
+            else:
+                self.embeddings = _LockedEmbeddings(HuggingFaceEmbeddings(
+                    model_name="all-MiniLM-L6-v2"
+                ))
+            self.retrieval_mode = os.getenv("SCIENTIFIC_RETRIEVAL", AUTO)
+            self.top_k = int(os.getenv("SCIENTIFIC_TOP_K", "4"))
+            self.rrf_k = int(os.getenv("SCIENTIFIC_RRF_K", "60"))
             self.text_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=1000,
                 chunk_overlap=200
@@ -49,7 +100,9 @@ class ScientificContentService:
             load_max_docs=max_papers,
             load_all_available_meta=True
         )
-        documents = loader.load()
+        with tracer.span("retrieval.fetch_arxiv", max_papers=max_papers) as span:
+            documents = loader.load()
+            span.set_attribute("retrieval.documents", len(documents))
         
         # Clean up metadata for each document
         cleaned_documents = []
@@ -63,10 +116,21 @@ class ScientificContentService:
             
         return cleaned_documents
         
-    def process_documents(self, documents: List[Document]):
-        """Process documents and create a vector store."""
+    def process_documents(self, documents: List[Document], index: Optional[HybridIndex] = None) -> HybridIndex:
+        """
+        Split documents and index the chunks for retrieval.
+
+        Pass an existing `index` to add papers to it incrementally; both the
+        vector store and the BM25 index are updated with the new chunks only.
+        """
         # Split documents into chunks
-        texts = self.text_splitter.split_documents(documents)
+        with tracer.span("retrieval.split", documents=len(documents)) as span:
+            if self.pool is not None:
+                pairs = self.pool.split([(doc.page_content, doc.metadata) for doc in documents])
+                texts = [Document(page_content=text, metadata=metadata) for text, metadata in pairs]
+            else:
+                texts = self.text_splitter.split_documents(documents)
+            span.set_attribute("retrieval.chunks", len(texts))
         
         # Ensure all document chunks have clean metadata
         cleaned_texts = []
@@ -78,23 +142,38 @@ class ScientificContentService:
             )
             cleaned_texts.append(cleaned_text)
         
-        # Create vector store with cleaned documents
-        vectorstore = Chroma.from_documents(
-            documents=cleaned_texts,
-            embedding=self.embeddings
-        )
-        
-        return vectorstore
+        # Index the cleaned chunks in the vector store and the BM25 index
+        if index is None:
+            # One collection per index: the in-memory client shares the default "langchain" collection
+            index = HybridIndex(
+                Chroma(collection_name=uuid.uuid4().hex, embedding_function=self.embeddings),
+                mode=self.retrieval_mode,
+                k=self.top_k,
+                rrf_k=self.rrf_k
+            )
+        index.add_documents(cleaned_texts)
+        return index
         
-    def generate_content(self, query: str, vectorstore) -> Dict[str, str]:
-        """Generate content based on the query and vector store."""
-        # Create retrieval chain
-        qa_chain = RetrievalQAWithSourcesChain.from_chain_type(
+    def generate_content(self, query: str, index, mode: Optional[str] = None,
+                         k: Optional[int] = None) -> Dict[str, str]:
+        """Generate content based on the query and the retrieval index."""
+        if not isinstance(index, HybridIndex):
+            # Plain vector store: dense retrieval only
+            qa_chain = RetrievalQAWithSourcesChain.from_chain_type(
+                llm=self.llm,
+                chain_type="stuff",
+                retriever=index.as_retriever()
+            )
+            with tracer.span("retrieval.qa"):
+                return qa_chain({"question": query})
+
+        documents = index.search(query, k=k, mode=mode)
+        qa_chain = QAWithSourcesChain.from_chain_type(
             llm=self.llm,
-            chain_type="stuff",
-            retriever=vectorstore.as_retriever()
+            chain_type="stuff"
         )
         
         # Generate response
-        response = qa_chain({"question": query})
+        with tracer.span("retrieval.qa", documents=len(documents)):
+            response = qa_chain({"docs": documents, "question": query})
         return response
\ No newline at end of file
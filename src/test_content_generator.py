@@ -1,8 +1,64 @@
+import os
+import tempfile
+import time
 import unittest
 import requests
+from datetime import datetime
+from functools import partial
 from unittest.mock import Mock, patch
 from utils.prompt_manager import PromptManager
-from generators.ollama_generator import OllamaGenerator
+from generators.ollama_generator import (DEFAULT_PLATFORM_PROFILES, OllamaGenerator, OllamaModelProfile,
+                                         size_profiles)
+from trackers.metrics import MetricsRegistry, Tracer, BatchExporter, registry
+from utils.company_profile import CompanyProfile, ProfileManager
+from generators.semantic_cache import SemanticCache, SemanticCachedLLM
+from services.job_queue import JobQueue, JobWorker, SUCCEEDED, FAILED
+from utils.errors import ProviderError
+from utils.quota_store import QuotaStore, QuotaExceededError
+from trackers.langsmith_tracker import RunSubmitter, PRIORITY_LOW, PRIORITY_HIGH
+from utils.singleflight import SingleFlight, AsyncSingleFlight, flight_key
+from utils.zip_export import ZipStream, add_result
+from utils.artifact_store import Artifact, ArtifactStore
+from utils.cache_backend import RedisBackend, ShardedSQLiteBackend, TieredCache
+from services.content_calendar import ContentCalendar, CalendarScheduler, READY, FAILED, GENERATING, in_window
+from evaluation.runner import EvalCase, check_constraints, make_target, platform_constraints, run, summarize
+from evaluation.stub_servers import StubLLMServer
+from services.news_pipeline import NewsPipeline, NewsStore, aggregate_scores, format_time
+from services.embedding_pool import EmbeddingPool, SyntheticEmbeddings
+from services.hybrid_index import CHUNK_ID, HybridIndex, contains_phrase, reciprocal_rank_fusion, tokenize
+from utils.blog_sections import OUTLINE, SectionCache, SectionPrompt, assemble, parse_outline, part_prompts
+from utils.structured_output import (PLATFORM_SCHEMAS, IncrementalJSONParser, RepairPrompt, repair_path, validate,
+                                     render_markdown)
+
+try:
+    from generators.llm_handler import GroqProvider
+    from services.content_service import ContentService, UnsafeContentError, content_service_from_env
+    from api import server as api_server
+except ImportError:  # generators.llm_handler necesita langchain_core y groq
+    GroqProvider = ContentService = UnsafeContentError = content_service_from_env = api_server = None
+
+
+class StubLLM:
+    """Generador local: responde con `respond(prompt)` y registra los prompts recibidos"""
+    def __init__(self, respond=None, model="stub-model"):
+        self.respond = respond or (lambda prompt: "Post de prueba")
+        self.model = model
+        self.prompts = []
+        self.last_usage = None
+
+    def generate_content(self, prompt_template, template_params):
+        prompt = prompt_template.format(**template_params)
+        self.prompts.append(prompt)
+        self.last_usage = {"prompt_tokens": 10, "completion_tokens": 5}
+        return self.respond(prompt)
+
+
+class StubLLMManager:
+    def __init__(self, llm):
+        self.llm = llm
+
+    def get_llm(self, name):
+        return self.llm
 
 class TestPromptManager(unittest.TestCase):
     def setUp(self):
@@ -23,11 +79,147 @@ class TestPromptManager(unittest.TestCase):
         self.assertIn("params", template_data)
         self.assertEqual(template_data["params"], ["tema", "audiencia", "tono"])
 
+    def test_compile_puts_static_prefix_first(self):
+        """Verifica que el prefijo estático se comparta y preceda a los parámetros"""
+        bound = self.prompt_manager.compile("Twitter", "Company Context:\n    - Company Name: {Acme}")
+        prompt = bound.format(tema="IA", audiencia="Estudiantes", tono="Casual")
+        self.assertTrue(prompt.startswith(bound.prefix))
+        self.assertIn("- Company Name: {Acme}", prompt)
+        self.assertNotIn("    ", prompt)
+        self.assertIs(bound, self.prompt_manager.compile("Twitter", "Company Context:\n    - Company Name: {Acme}"))
+
+    def test_rendered_prompt_keeps_instruction_order(self):
+        """Verifica que la tarea preceda a las reglas de estructura y formato de la plantilla"""
+        params = {"tema": "IA", "audiencia": "Estudiantes", "tono": "Casual"}
+        for platform in self.prompt_manager.get_all_platforms():
+            template = self.prompt_manager.get_template(platform)["template"]
+            prompt = self.prompt_manager.compile(platform, "Company Context:\n- Company Name: Acme").format(**params)
+            self.assertTrue(prompt.startswith("Company Context:"))
+            self.assertTrue(prompt.endswith(template.format(**params)))
+        prompt = self.prompt_manager.compile("Blog").format(**params)
+        self.assertTrue(prompt.startswith("Create a professional blog article about IA."))
+        self.assertLess(prompt.index("Audience:"), prompt.index("Required Structure:"))
+
+    def test_compiled_template_validates_params(self):
+        """Verifica que falten parámetros produzca un error"""
+        bound = self.prompt_manager.compile("Blog")
+        with self.assertRaises(ValueError):
+            bound.format(tema="IA", audiencia="", tono="Casual")
+
+    def test_token_budget_by_platform(self):
+        """Verifica que los hilos de Twitter tengan menos presupuesto que un blog"""
+        self.assertLess(self.prompt_manager.get_token_budget("Twitter"),
+                        self.prompt_manager.get_token_budget("Blog"))
+        self.assertEqual(self.prompt_manager.compile("Blog").max_tokens,
+                         self.prompt_manager.get_token_budget("Blog"))
+
     def test_get_template_invalid_platform(self):
         """Verifica que se maneje correctamente una plataforma inválida"""
         template_data = self.prompt_manager.get_template("PlataformaInexistente")
         self.assertIsNone(template_data)
 
+    def test_variant_prompt_round_trip(self):
+        """Verifica que las variantes se pidan en una sola llamada y se separen por tono"""
+        variants = self.prompt_manager.compile_variants("LinkedIn", ["Professional", "Casual", "Humorous"],
+                                                        "Company Context:\n- Company Name: Acme")
+        prompt = variants.format(tema="IA", audiencia="Estudiantes", tono="Professional")
+        self.assertEqual(prompt.count(variants.prefix), 1)
+        self.assertIn("=== VARIANT 2: Casual ===", prompt)
+        self.assertEqual(variants.max_tokens, 3 * self.prompt_manager.get_token_budget("LinkedIn"))
+        response = "=== VARIANT 1: Professional ===\nFormal\n\n=== variant 3: Humorous ===\nDivertido"
+        self.assertEqual(variants.parse(response), ["Formal", None, "Divertido"])
+
+class TestStructuredOutput(unittest.TestCase):
+    def test_fields_are_validated_while_streaming(self):
+        """Verifica que cada campo se valide en cuanto termina de llegar"""
+        parser = IncrementalJSONParser(PLATFORM_SCHEMAS["Twitter"])
+        long_tweet = "a" * 300
+        text = '```json\n{"tweets": ["Hola {IA}", "%s", "Fin \\" ok"], "extra": {"a": [1]}' % long_tweet
+        completed = []
+        for i in range(0, len(text), 7):
+            completed += parser.feed(text[i:i + 7])
+        # El objeto aún no se ha cerrado, pero "tweets" ya está validado
+        self.assertFalse(parser.complete)
+        self.assertEqual([key for key, _ in completed], ["tweets"])
+        self.assertEqual([error.path for error in parser.errors["tweets"]], [("tweets", 1)])
+        self.assertEqual([key for key, _ in parser.feed("}\n```")], ["extra"])
+        data = parser.close()
+        errors = validate(PLATFORM_SCHEMAS["Twitter"], data)
+        self.assertEqual(repair_path(errors[0]), ("tweets", 1))
+        self.assertEqual(render_markdown("Instagram", {"body": "Texto", "hashtags": ["#ia"]}), "Texto\n\n#ia")
+
+    def test_render_markdown_tolerates_invalid_data(self):
+        """Verifica que el markdown se genere aunque los datos no superen la validación"""
+        blog = {"title": None, "introduction": 42, "sections": ["texto", {"heading": "Por qué", "body": None}],
+                "conclusion": None}
+        self.assertEqual(render_markdown("Blog", blog), "42\n\n## Por qué\n\n")
+        self.assertEqual(render_markdown("Instagram", {"body": None, "hashtags": ["#ia", 7, None]}), "\n\n#ia 7")
+        self.assertEqual(render_markdown("Twitter", {"tweets": "Hola"}), "")
+
+    def test_repair_prompt_counts_its_text(self):
+        """Verifica que la reserva de cuota cuente el prompt de reparación completo"""
+        repair = RepairPrompt("Twitter", PLATFORM_SCHEMAS["Twitter"], {"tweets": ["a"]}, ("tweets", 0), [])
+        self.assertEqual(repair.prefix, repair.format())
+
+    def test_compile_structured_enables_json_mode(self):
+        """Verifica que el prompt estructurado incluya el esquema y active el modo JSON"""
+        prompt_template = PromptManager().compile_structured("Instagram")
+        self.assertTrue(prompt_template.json_mode)
+        self.assertIn('"hashtags"', prompt_template.format(tema="IA", audiencia="Estudiantes", tono="Casual"))
+
+
+class TestBlogSections(unittest.TestCase):
+    def setUp(self):
+        self.profile = CompanyProfile(name="Acme", description="Tools", industry="Software",
+                                      tone_of_voice="Friendly", target_audience=["Devs"],
+                                      key_values=["Quality"], hashtags=["#acme"], website="acme.dev")
+        self.params = {"tema": "AI", "audiencia": "Developers", "tono": "Casual"}
+        self.outline = {"title": "AI for developers", "headings": ["Why", "How", "Next"]}
+
+    def keys(self, params, profile):
+        prompts = part_prompts(self.outline, params, profile, "v1")
+        keys = {name: prompt.key for name, prompt in prompts.items()}
+        keys["outline"] = SectionPrompt(OUTLINE, params, profile, "v1").key
+        return keys
+
+    def test_keys_only_change_for_dependent_sections(self):
+        """Verifica que un cambio de audiencia o de un campo del perfil solo afecte a sus secciones"""
+        before = self.keys(self.params, self.profile)
+        after_audience = self.keys(dict(self.params, audiencia="Managers"), self.profile)
+        changed = {name for name in before if before[name] != after_audience[name]}
+        self.assertEqual(changed, {"introduction", "section.0", "section.1", "section.2", "call_to_action"})
+
+        self.profile.website = "acme.io"
+        after_website = self.keys(self.params, self.profile)
+        self.assertEqual({name for name in before if before[name] != after_website[name]}, {"call_to_action"})
+        # Una nueva versión de la plantilla invalida también el esquema
+        self.assertNotEqual(before["outline"], SectionPrompt(OUTLINE, self.params, self.profile, "v2").key)
+
+    def test_prompt_and_assembly(self):
+        """Verifica el prompt de una sección, el esquema del artículo y la caché"""
+        prompt = part_prompts(self.outline, self.params, self.profile)["section.1"]
+        text = prompt.format()
+        self.assertIn('section "How"', text)
+        self.assertIn("Why, How, Next", text)
+        self.assertIn("Key Values: Quality", prompt.prefix)
+        self.assertNotIn("acme.dev", prompt.prefix)
+        self.assertEqual(parse_outline('```json\n{"title": "T", "headings": ["A", "B"]}\n```'),
+                         {"title": "T", "headings": ["A", "B"]})
+        with self.assertRaises(ValueError):
+            parse_outline('{"title": "T", "headings": ["A"]}')
+
+        parts = {name: name for name in part_prompts(self.outline, self.params)}
+        data = assemble(self.outline, parts)
+        self.assertEqual(validate(PLATFORM_SCHEMAS["Blog"], data), [])
+        self.assertEqual(data["sections"][2], {"heading": "Next", "body": "section.2"})
+
+        cache = SectionCache(max_entries=1)
+        cache.put("a", "first")
+        cache.put("b", "second")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), "second")
+
+
 class TestOllamaGenerator(unittest.TestCase):
     def setUp(self):
         self.generator = OllamaGenerator(model="mistral")
@@ -54,6 +246,62 @@ class TestOllamaGenerator(unittest.TestCase):
         result = self.generator.generate_content(self.test_template, self.test_params)
         self.assertEqual(result, "Contenido generado de prueba")
 
+    @patch('requests.post')
+    def test_generate_content_enforces_token_budget(self, mock_post):
+        """Verifica que se envíe num_predict y se registre el uso de tokens"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"response": "ok", "prompt_eval_count": 12, "eval_count": 3}
+        mock_post.return_value = mock_response
+
+        template = PromptManager().compile("Twitter")
+        self.generator.generate_content(template, self.test_params)
+        payload = mock_post.call_args.kwargs["json"]
+        self.assertEqual(payload["options"]["num_predict"], template.max_tokens)
+        self.assertEqual(payload["options"]["temperature"], 0.7)
+        self.assertNotIn("temperature", payload)
+        self.assertEqual(self.generator.last_usage, {"prompt_tokens": 12, "completion_tokens": 3})
+
+    @patch('requests.post')
+    def test_platform_profiles_and_warm_up(self, mock_post):
+        """Verifica el modelo por plataforma, la ventana de contexto y el precalentamiento"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"response": "ok", "load_duration": 2_500_000_000}
+        mock_post.return_value = mock_response
+
+        prompt_manager = PromptManager()
+        profiles = size_profiles(DEFAULT_PLATFORM_PROFILES, prompt_manager)
+        # LinkedIn y Blog comparten modelo, así que comparten la ventana del Blog
+        self.assertEqual(profiles["LinkedIn"].num_ctx, profiles["Blog"].num_ctx)
+        self.assertGreaterEqual(profiles["Blog"].num_ctx, prompt_manager.get_token_budget("Blog"))
+        self.assertLess(profiles["Twitter"].num_ctx, profiles["Blog"].num_ctx)
+        self.assertEqual(size_profiles({"Blog": OllamaModelProfile("m", num_ctx=8192)}, prompt_manager)["Blog"].num_ctx,
+                         8192)
+
+        generator = OllamaGenerator(platform_profiles=profiles)
+        generator.generate_content(prompt_manager.compile("Twitter"), self.test_params)
+        payload = mock_post.call_args.kwargs["json"]
+        self.assertEqual(payload["model"], profiles["Twitter"].model)
+        self.assertEqual(payload["keep_alive"], -1)
+        self.assertEqual(payload["options"]["num_ctx"], profiles["Twitter"].num_ctx)
+        # Las secciones del Blog y las reparaciones de campos también usan el perfil de su plataforma
+        # y se generan sin parámetros propios, porque los prompts ya llevan los suyos
+        section = SectionPrompt(OUTLINE, {"tema": "Cloud", "tono": "Casual"})
+        repair = RepairPrompt("Twitter", PLATFORM_SCHEMAS["Twitter"], {"tweets": ["a"]}, ("tweets", 0), [])
+        for prompt, platform in ((section, "Blog"), (repair, "Twitter")):
+            self.assertEqual(generator.generate_content(prompt, {}), "ok")
+            payload = mock_post.call_args.kwargs["json"]
+            self.assertEqual(payload["model"], profiles[platform].model)
+            self.assertEqual(payload["prompt"], prompt.format())
+            self.assertEqual(payload["format"], "json")
+
+        self.assertEqual(set(generator.warm_up()), {profiles["Twitter"].model, profiles["Blog"].model})
+        loads_before = registry.get_histogram("ollama_model_load_seconds", {"model": "mistral"})[1]
+        self.assertEqual(self.generator.warm_up(), {"mistral": 2.5})
+        self.assertEqual(registry.get_histogram("ollama_model_load_seconds", {"model": "mistral"})[1],
+                         loads_before + 1)
+
     @patch('requests.post')
     def test_generate_content_api_error(self, mock_post):
         """Verifica el manejo de errores de la API"""
@@ -80,6 +328,1009 @@ class TestOllamaGenerator(unittest.TestCase):
             self.generator.validate_params(required_params, self.test_params)
         )
 
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.tracer = Tracer(self.registry)
+
+    def test_span_records_duration(self):
+        """Verifica que un span mida una duración real y anide el trace"""
+        with self.tracer.span("outer") as outer:
+            with self.tracer.span("inner") as inner:
+                pass
+        self.assertEqual(inner.trace_id, outer.trace_id)
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertGreaterEqual(outer.duration, inner.duration)
+        total, count = self.registry.get_histogram(
+            "span_duration_seconds", {"span": "outer", "status": "OK"})
+        self.assertEqual(count, 1)
+
+    def test_interleaved_tasks_keep_their_own_spans(self):
+        """Verifica que tareas asyncio intercaladas en un hilo no mezclen sus spans"""
+        import asyncio
+        parents = {}
+
+        async def request(name):
+            with self.tracer.span(name) as outer:
+                await asyncio.sleep(0.01)
+                with self.tracer.span(f"{name}.inner") as inner:
+                    await asyncio.sleep(0.01)
+                parents[name] = (outer.span_id, inner.parent_id)
+            self.assertIsNone(self.tracer.current_span())
+
+        async def main():
+            await asyncio.gather(request("a"), request("b"))
+
+        asyncio.run(main())
+        for outer_id, parent_id in parents.values():
+            self.assertEqual(outer_id, parent_id)
+
+    def test_prometheus_rendering(self):
+        """Verifica el formato de exposición de Prometheus"""
+        self.registry.inc("llm_tokens_total", 5, {"kind": "prompt"})
+        text = self.registry.render_prometheus()
+        self.assertIn('llm_tokens_total{kind="prompt"} 5.0', text)
+
+    def test_batch_exporter_does_not_block(self):
+        """Verifica que el exportador descarte spans en lugar de bloquear"""
+        exported = []
+        exporter = BatchExporter(exported.extend, interval=0.01, max_queue=1, registry=self.registry)
+        self.tracer.add_exporter(exporter)
+        for _ in range(50):
+            with self.tracer.span("burst"):
+                pass
+        exporter.shutdown()
+        exporter.flush()
+        self.assertEqual(len(exported) + self.registry.get_counter("spans_dropped_total"), 50)
+
+    def test_metrics_port_in_use_does_not_crash(self):
+        """Verifica que un METRICS_PORT ocupado no impida arrancar"""
+        import socket
+        from trackers import metrics
+        with socket.socket() as taken:
+            taken.bind(("127.0.0.1", 0))
+            taken.listen(1)
+            port = taken.getsockname()[1]
+            done = getattr(metrics.configure_from_env, "_done", False)
+            metrics.configure_from_env._done = False
+            try:
+                with patch.dict(os.environ, {"METRICS_PORT": str(port)}), \
+                        patch.object(metrics, "_server", None), \
+                        self.assertLogs("trackers.metrics", level="WARNING"):
+                    metrics.configure_from_env()
+            finally:
+                metrics.configure_from_env._done = done
+
+class TestQuotaStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = QuotaStore(os.path.join(self.tmp_dir.name, "quotas.db"), default_limit=100)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_records_actual_usage(self):
+        """Verifica que se registre el uso real y no la reserva"""
+        with self.store.reserve("Acme", 80) as reservation:
+            reservation.record(prompt_tokens=20, completion_tokens=10)
+        self.assertEqual(self.store.used("Acme"), 30)
+        self.assertEqual(self.store.remaining("Acme"), 70)
+
+    def test_inflight_reservations_count_against_quota(self):
+        """Verifica que las reservas en curso impidan superar la cuota"""
+        with self.store.reserve("Acme", 60):
+            with self.assertRaises(QuotaExceededError):
+                with self.store.reserve("Acme", 60):
+                    pass
+            with self.store.reserve("Otro", 60):
+                pass
+
+    def test_reservations_are_shared_between_instances(self):
+        """Verifica que las reservas de otro proceso cuenten y que las huérfanas caduquen"""
+        other = QuotaStore(self.store.db_path, default_limit=100, reservation_ttl=0.2)
+        with other.reserve("Acme", 60):
+            self.assertEqual(self.store.remaining("Acme"), 40)
+            with self.assertRaises(QuotaExceededError):
+                with self.store.reserve("Acme", 60):
+                    pass
+        self.assertEqual(self.store.remaining("Acme"), 100)
+
+        abandoned = other.reserve("Acme", 60)
+        abandoned.__enter__()  # proceso terminado sin liberar la reserva
+        self.assertEqual(self.store.remaining("Acme"), 40)
+        time.sleep(0.3)
+        self.assertEqual(self.store.remaining("Acme"), 100)
+
+class TestSemanticCache(unittest.TestCase):
+    @staticmethod
+    def embed(texts):
+        """Embedding de prueba: bolsa de palabras sobre un vocabulario fijo"""
+        import numpy as np
+        vocabulary = ["ai", "healthcare", "in", "for", "finance", "doctors", "students"]
+        return np.array([[text.lower().split().count(word) for word in vocabulary] for text in texts],
+                        dtype=np.float32)
+
+    def setUp(self):
+        self.llm = Mock()
+        self.llm.generate_content.side_effect = lambda template, params: f"post about {params['tema']}"
+        self.llm.model = "mixtral-8x7b-32768"
+        self.cache = SemanticCache(embed_fn=self.embed, threshold=0.7, draft_threshold=None, max_entries=2)
+        self.cached_llm = SemanticCachedLLM(self.llm, self.cache)
+        self.template = PromptManager().compile("Blog")
+
+    def params(self, theme, audience="doctors", tone="Professional"):
+        return {"tema": theme, "audiencia": audience, "tono": tone}
+
+    def test_near_duplicate_hits_cache(self):
+        """Verifica que un tema casi idéntico reutilice la generación"""
+        first = self.cached_llm.generate_content(self.template, self.params("AI in healthcare"))
+        second = self.cached_llm.generate_content(self.template, self.params("AI for healthcare"))
+        self.assertEqual(first, second)
+        self.assertEqual(self.llm.generate_content.call_count, 1)
+        self.assertTrue(self.cached_llm.last_match.is_hit)
+
+    def test_scope_separates_tone_and_profile(self):
+        """Verifica que otro tono u otro perfil no compartan resultados"""
+        self.cached_llm.generate_content(self.template, self.params("AI in healthcare"))
+        self.cached_llm.generate_content(self.template, self.params("AI in healthcare", tone="Casual"))
+        other_profile = PromptManager().compile("Blog", "Company Context:\n- Company Name: Acme")
+        self.cached_llm.generate_content(other_profile, self.params("AI in healthcare"))
+        self.assertEqual(self.llm.generate_content.call_count, 3)
+
+    def test_scope_separates_models(self):
+        """Verifica que al cambiar de modelo no se sirva la generación de otro"""
+        self.cached_llm.generate_content(self.template, self.params("AI in healthcare"))
+        self.llm.model = "gemma-7b-it"
+        self.cached_llm.generate_content(self.template, self.params("AI in healthcare"))
+        self.assertEqual(self.llm.generate_content.call_count, 2)
+
+    def test_lru_eviction(self):
+        """Verifica que se expulse la entrada usada hace más tiempo"""
+        for theme in ["AI in healthcare", "finance", "students"]:
+            self.cached_llm.generate_content(self.template, self.params(theme, audience=""))
+        self.cached_llm.generate_content(self.template, self.params("AI in healthcare", audience=""))
+        self.assertEqual(self.llm.generate_content.call_count, 4)
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue = JobQueue(os.path.join(self.tmp_dir.name, "jobs.db"), max_attempts=2)
+        self.params = {"platform": "Blog", "theme": "IA", "audience": "Estudiantes", "tone": "Casual"}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_duplicate_submission_attaches_to_job(self):
+        """Verifica que la misma solicitud se asocie al trabajo existente"""
+        first = self.queue.submit("content", self.params)
+        second = self.queue.submit("content", {**self.params, "theme": "  IA "})
+        self.assertEqual(first.id, second.id)
+        # Las mayúsculas cambian el texto generado: es otra solicitud
+        self.assertNotEqual(self.queue.submit("content", {**self.params, "theme": "ia"}).id, first.id)
+
+        calls = []
+        worker = JobWorker(self.queue, {"content": lambda params: calls.append(params) or {"content": "ok"}})
+        self.assertTrue(worker.run_once())
+        self.assertTrue(worker.run_once())
+        self.assertFalse(worker.run_once())
+        self.assertEqual(len(calls), 2)
+
+        job = self.queue.wait(first.id, timeout=1)
+        self.assertEqual(job.state, SUCCEEDED)
+        self.assertEqual(job.result, {"content": "ok"})
+
+    def test_failed_job_is_retried_then_failed(self):
+        """Verifica los reintentos y el estado final de un trabajo fallido"""
+        job = self.queue.submit("content", self.params)
+        worker = JobWorker(self.queue, {"content": Mock(side_effect=RuntimeError("timeout"))})
+        self.assertTrue(worker.run_once())
+        self.assertTrue(worker.run_once())
+        self.assertFalse(worker.run_once())
+        job = self.queue.get(job.id)
+        self.assertEqual((job.state, job.attempts, job.error), (FAILED, 2, "timeout"))
+
+    def test_finished_job_runs_again_when_stale(self):
+        """Verifica que un resultado caducado, una regeneración o un perfil editado vuelvan a generar"""
+        versions = {"Acme": "v1"}
+        self.queue.versioner = lambda kind, params: versions[params["profile"]]
+        params = {**self.params, "profile": "Acme"}
+        worker = JobWorker(self.queue, {"content": lambda params: {"content": "ok"}})
+        first = self.queue.submit("content", params)
+        worker.run_once()
+        self.assertEqual(self.queue.submit("content", params).state, SUCCEEDED)
+        self.assertEqual(self.queue.submit("content", params, regenerate=True).state, "queued")
+        worker.run_once()
+
+        self.queue.result_ttl = 0
+        again = self.queue.submit("content", params)
+        self.assertEqual((again.id, again.state, again.result), (first.id, "queued", None))
+        worker.run_once()
+
+        versions["Acme"] = "v2"
+        self.assertNotEqual(self.queue.submit("content", params).id, first.id)
+
+    def test_expired_lease_is_reclaimed(self):
+        """Verifica que otro worker recupere un trabajo cuyo worker murió"""
+        self.queue.lease_seconds = -1
+        job = self.queue.submit("content", self.params)
+        self.assertIsNotNone(self.queue.claim("dead-worker"))
+        reclaimed = self.queue.claim("live-worker")
+        self.assertEqual(reclaimed.id, job.id)
+        self.assertEqual(reclaimed.attempts, 2)
+
+class StubLangSmithClient:
+    """Cliente local que registra los lotes recibidos"""
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def batch_ingest_runs(self, create):
+        if self.fail:
+            raise ConnectionError("LangSmith unavailable")
+        # Same check as langsmith.Client.batch_ingest_runs
+        if any(not run.get("trace_id") or not run.get("dotted_order") for run in create):
+            raise ValueError("Batch ingest requires trace_id and dotted_order to be set.")
+        self.batches.append(create)
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        """Verifica que las llamadas idénticas simultáneas compartan una sola ejecución"""
+        import threading
+        flight = SingleFlight("test")
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "contenido"
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.wait(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True, True])
+        self.assertTrue(all(result == "contenido" for result, _ in results))
+        # Una vez terminada, la siguiente llamada se ejecuta de nuevo
+        self.assertEqual(flight.do("k", lambda: "nuevo"), ("nuevo", False))
+
+    def test_errors_propagate_to_all_callers(self):
+        """Verifica que un error del líder llegue a los llamadores agrupados"""
+        import asyncio
+        flight = AsyncSingleFlight("test")
+
+        async def failing():
+            await asyncio.sleep(0.05)
+            raise ValueError("Groq API Error")
+
+        async def run():
+            return await asyncio.gather(*(flight.do("k", failing) for _ in range(3)), return_exceptions=True)
+
+        errors = asyncio.run(run())
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+        self.assertEqual(flight_key("Blog  IA", 1), flight_key("Blog IA", 1))
+
+
+class TestZipExport(unittest.TestCase):
+    def test_archive_round_trip(self):
+        """Verifica que el ZIP generado por streaming sea válido y guarde los PNG sin comprimir"""
+        import base64, io, zipfile
+        image = os.urandom(4096)
+        with tempfile.TemporaryDirectory() as tmp:
+            image_path = os.path.join(tmp, "image.png")
+            with open(image_path, "wb") as f:
+                f.write(image)
+            archive = ZipStream()
+            archive.add_buffer("content_blog.txt", "Contenido " * 100)
+            archive.add_file("image_blog.png", image_path)
+            add_result(archive, "Twitter", {"content": "Tweet", "image_base64": base64.b64encode(image).decode()},
+                       folder="twitter_1")
+            buffer = io.BytesIO()
+            size = archive.write_to(buffer)
+
+        self.assertEqual(size, len(buffer.getvalue()))
+        with zipfile.ZipFile(buffer) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            infos = {info.filename: info for info in zip_file.infolist()}
+            self.assertEqual(infos["content_blog.txt"].compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(infos["image_blog.png"].compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(zip_file.read("image_blog.png"), image)
+            self.assertEqual(zip_file.read("twitter_1/image_twitter.png"), image)
+            self.assertEqual(zip_file.read("twitter_1/content_twitter.txt"), b"Tweet")
+
+
+class TestEmbeddingPool(unittest.TestCase):
+    def test_pool_matches_in_process_embeddings(self):
+        """Verifica que los vectores devueltos por memoria compartida coincidan en orden y valor"""
+        import numpy as np
+        texts = [f"Artículo {i} sobre recuperación científica" for i in range(70)]
+        pool = EmbeddingPool(processes=2, chunk_size=16, embeddings_factory=SyntheticEmbeddings)
+        try:
+            vectors = pool.embed_array(texts)
+            query = pool.embed_query(texts[5])
+        finally:
+            pool.shutdown()
+        expected = np.asarray(SyntheticEmbeddings().embed_documents(texts), dtype=np.float32)
+        self.assertEqual(vectors.shape, (70, 384))
+        np.testing.assert_allclose(vectors, expected, rtol=1e-6)
+        np.testing.assert_allclose(query, expected[5], rtol=1e-6)
+
+
+class TestHybridIndex(unittest.TestCase):
+    class Chunk:
+        def __init__(self, text):
+            self.page_content = text
+            self.metadata = {"source": text[:10]}
+
+    class StubVectorStore:
+        """Devuelve los fragmentos en un orden fijo y cuenta las consultas"""
+
+        def __init__(self):
+            self.documents = []
+            self.queries = 0
+
+        def add_documents(self, documents):
+            self.documents.extend(documents)
+
+        def similarity_search(self, query, k=4):
+            self.queries += 1
+            return list(reversed(self.documents))[:k]
+
+    def setUp(self):
+        self.store = self.StubVectorStore()
+        self.index = HybridIndex(self.store, k=2)
+        self.index.add_documents([self.Chunk(text) for text in (
+            "Attention is all you need: the transformer architecture for translation.",
+            "LoRA: low-rank adaptation of large language models such as GPT-3.",
+            "Convolutional networks for image recognition.",
+        )])
+
+    def test_tokenize_keeps_compound_terms(self):
+        """Verifica que los términos compuestos se indexen enteros y por partes"""
+        self.assertEqual(tokenize("The GPT-3 model"), ["gpt-3", "gpt", "3", "model"])
+
+    def test_incremental_index_and_lexical_fast_path(self):
+        """Verifica que las consultas por identificador no consulten el almacén vectorial"""
+        self.assertEqual([doc.metadata[CHUNK_ID] for doc in self.store.documents], [0, 1, 2])
+        results = self.index.search("LoRA GPT-3")
+        self.assertEqual(self.store.queries, 0)
+        self.assertIn("low-rank", results[0].page_content)
+        self.index.add_documents([self.Chunk("QLoRA fine-tunes quantized GPT-3 style models.")])
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.bm25.search("qlora")[0][0], 3)
+        self.assertEqual(self.index.search('"image recognition"', k=1)[0].metadata[CHUNK_ID], 2)
+        self.assertEqual(self.store.queries, 0)
+
+    def test_hybrid_fuses_rankings(self):
+        """Verifica que las consultas en lenguaje natural combinen BM25 y vectores por RRF"""
+        results = self.index.search("how do transformers handle translation?")
+        self.assertEqual(self.store.queries, 1)
+        # BM25 ranks chunk 0 first, the stub store ranks chunk 2 first
+        self.assertEqual([doc.metadata[CHUNK_ID] for doc in results], [0, 2])
+        self.assertEqual(reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60)[0][0], "b")
+        with self.assertRaises(ValueError):
+            self.index.search("transformers", mode="sparse")
+
+    def test_quoted_queries_match_the_phrase(self):
+        """Verifica que una frase entre comillas solo devuelva fragmentos con esa secuencia exacta"""
+        self.assertEqual(self.index.search('"low-rank adaptation"')[0].metadata[CHUNK_ID], 1)
+        self.assertEqual(self.index.search('"recognition image"'), [])
+        self.assertEqual(self.index.search('"networks for image"')[0].metadata[CHUNK_ID], 2)
+        self.assertTrue(contains_phrase("Attention is all you need:", "all, you NEED"))
+        self.assertEqual(self.store.queries, 0)
+
+    def test_dense_hits_from_other_indexes_are_dropped(self):
+        """Verifica que un almacén compartido no devuelva fragmentos de otro índice"""
+        other = HybridIndex(self.store, k=2)
+        other.add_documents([self.Chunk(f"Diffusion models, part {i}.") for i in range(5)])
+        # The stub store returns the other index's five chunks first, with chunk ids 0-4
+        self.assertEqual(self.index.search("transformer translation", mode="dense", k=3), [])
+        results = self.index.search("transformer translation", mode="dense", k=8)
+        self.assertEqual([doc.metadata[CHUNK_ID] for doc in results], [2, 1, 0])
+        self.assertEqual([doc.metadata["source"] for doc in results], ["Convolutio", "LoRA: low-", "Attention "])
+
+
+class TestEvaluation(unittest.TestCase):
+    def test_runner_against_stub_server(self):
+        """Verifica que el evaluador mida latencia, tokens y restricciones contra el servidor simulado"""
+        cases = [EvalCase("Twitter", "Novedades del producto", "Analistas", "Casual"),
+                 EvalCase("Instagram", "Nuestro café", "Clientes", "Casual")]
+        with StubLLMServer(tokens_per_second=100000, first_token_latency=0) as stub:
+            results = run({"ollama:gemma-7b-it": make_target("ollama:gemma-7b-it", ollama_host=stub.url)}, cases)
+            self.assertEqual(stub.requests, 2)
+        # Modelo local con el mismo nombre que uno de pago en Groq
+        self.assertEqual([result["cost"] for result in results], [0.0, 0.0])
+        [row] = summarize(results)
+        self.assertEqual((row["runs"], row["errors"]), (2, 0))
+        self.assertEqual(row["constraint_pass_rate"], 1.0)
+        self.assertEqual(row["safety_pass_rate"], 1.0)
+        self.assertGreater(results[0]["completion_tokens"], 0)
+
+    def test_constraints_come_from_templates(self):
+        """Verifica que las restricciones se lean de los templates y detecten tweets largos"""
+        constraints = platform_constraints(PromptManager(), "Twitter")
+        self.assertEqual(constraints["tweet_chars"], (1, 280))
+        checks = check_constraints("1/2 Hola #ia\n\n2/2 " + "a" * 300, constraints)
+        self.assertEqual(checks, {"tweet_chars": False, "hashtags_per_tweet": True})
+
+
+class TestArtifactStore(unittest.TestCase):
+    def test_lru_eviction_keeps_recently_used(self):
+        """Verifica que se expulse el artefacto menos usado y que los handles caducados devuelvan None"""
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ArtifactStore(tmp, max_bytes=250)
+            first = store.put(b"a" * 100, ".png")
+            second = store.put("b" * 100, ".txt")
+            self.assertEqual(store.put(b"a" * 100, ".png"), first)
+            self.assertEqual(store.total_bytes, 200)
+            # Leer el primero lo vuelve reciente, así que se expulsa el segundo
+            self.assertIsNotNone(store.path(first))
+            third = store.put(b"c" * 100, ".png")
+            self.assertIsNone(store.read_text(second))
+            self.assertIsNotNone(store.path(first))
+            self.assertEqual(store.total_bytes, 200)
+            # Otro proceso reconstruye el índice desde el disco
+            reopened = ArtifactStore(tmp, max_bytes=250)
+            self.assertEqual(reopened.total_bytes, 200)
+            self.assertEqual(reopened.read_text(Artifact(**third.to_dict())), "c" * 100)
+
+    def test_limit_applies_to_the_shared_directory(self):
+        """Verifica que varios procesos que comparten el directorio respeten un único límite"""
+        with tempfile.TemporaryDirectory() as tmp:
+            app_store = ArtifactStore(tmp, max_bytes=250, rescan_interval=0)
+            api_store = ArtifactStore(tmp, max_bytes=250, rescan_interval=0)
+            for i in range(4):
+                app_store.put(bytes([i]) * 100, ".png")
+                api_store.put(bytes([10 + i]) * 100, ".png")
+            on_disk = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(tmp) for f in files)
+            self.assertLessEqual(on_disk, 250)
+
+    def test_eviction_does_not_rescan_the_directory(self):
+        """Verifica que, entre dos escaneos, la expulsión use solo el índice en memoria"""
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ArtifactStore(tmp, max_bytes=250, rescan_interval=3600)
+            first = store.put(b"a" * 100, ".png")
+            # Otro proceso ya lo ha expulsado del disco
+            os.unlink(store.path(first))
+            with patch("os.walk") as walk:
+                for i in range(5):
+                    store.put(bytes([i]) * 100, ".png")
+            walk.assert_not_called()
+            self.assertEqual(store.total_bytes, 200)
+
+
+class TestContentCalendar(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.calendar = ContentCalendar(os.path.join(self.tmp_dir.name, "calendar.db"))
+        self.service = Mock()
+        self.service.prompt_manager = PromptManager()
+        self.service.profile_manager.get_prompt_context.return_value = "Company: Acme"
+        self.service.generate_bundle.side_effect = lambda platform, theme, *args, **kwargs: {
+            "platform": platform, "content": f"Post about {theme}"}
+        self.store = ArtifactStore(os.path.join(self.tmp_dir.name, "artifacts"))
+        self.scheduler = CalendarScheduler(self.calendar, self.service, self.store, window=(0, 0),
+                                           rate_per_minute=6000)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_pregenerates_only_when_inputs_change(self):
+        """Verifica que solo se regenere al cambiar el perfil o la plantilla"""
+        entry = self.calendar.add("Twitter", "AI", "Devs", "Casual", time.time() + 3600, profile="Acme")
+        self.assertEqual(self.scheduler.run_once(), 1)
+        ready = self.calendar.get(entry.id)
+        self.assertEqual(ready.state, READY)
+        self.assertEqual(self.store.read_text(Artifact(**ready.result["content"])), "Post about AI")
+        self.assertEqual(self.calendar.find_ready("Acme", "Twitter", "AI", "Devs", "Casual").id, entry.id)
+
+        self.assertEqual(self.scheduler.run_once(), 0)
+        self.service.profile_manager.get_prompt_context.return_value = "Company: Acme (rebranded)"
+        self.assertEqual(self.scheduler.run_once(), 1)
+        self.service.prompt_manager.templates["Twitter"]["template"] += "\nKeep it short."
+        self.assertEqual(self.scheduler.run_once(), 1)
+        self.assertEqual(self.service.generate_bundle.call_count, 3)
+
+    def test_entries_keep_their_model(self):
+        """Verifica que la entrada se genere con su modelo y solo se reutilice para ese modelo"""
+        entry = self.calendar.add("Twitter", "Cloud", "Devs", "Casual", time.time() + 3600,
+                                  model="llama3-70b-8192")
+        self.assertEqual(self.scheduler.run_once(), 1)
+        self.assertEqual(self.service.generate_bundle.call_args.args[5], "llama3-70b-8192")
+        self.assertIsNone(self.calendar.find_ready(None, "Twitter", "Cloud", "Devs", "Casual"))
+        self.assertEqual(self.calendar.find_ready(None, "Twitter", "Cloud", "Devs", "Casual",
+                                                  "llama3-70b-8192").id, entry.id)
+
+    def test_reclaims_expired_leases(self):
+        """Verifica que una entrada abandonada en generación se retome al caducar su concesión"""
+        running = self.calendar.add("Twitter", "Cloud", "Devs", "Casual", time.time() + 3600)
+        abandoned = self.calendar.add("Blog", "Cloud", "Devs", "Casual", time.time() + 3600)
+        self.assertTrue(self.calendar.claim(running.id))
+        self.assertTrue(ContentCalendar(self.calendar.db_path, lease_seconds=-1).claim(abandoned.id))
+
+        self.assertEqual(self.scheduler.run_once(), 1)
+        self.assertEqual(self.calendar.get(abandoned.id).state, READY)
+        self.assertEqual(self.calendar.get(running.id).state, GENERATING)
+
+    def test_failed_entries_stop_retrying(self):
+        """Verifica el límite de intentos y que los errores no reintentables no se repitan"""
+        self.scheduler.non_retryable = (QuotaExceededError,)
+        self.service.generate_bundle.side_effect = RuntimeError("timeout")
+        entry = self.calendar.add("Twitter", "Cloud", "Devs", "Casual", time.time() + 3600, profile="Acme")
+        self.assertEqual([self.scheduler.run_once() for _ in range(4)], [1, 1, 1, 0])
+        self.assertEqual(self.calendar.get(entry.id).state, FAILED)
+
+        # A new profile version is worth one more try
+        self.service.profile_manager.get_prompt_context.return_value = "Company: Acme (rebranded)"
+        self.service.generate_bundle.side_effect = QuotaExceededError("over quota")
+        self.assertEqual([self.scheduler.run_once() for _ in range(2)], [1, 0])
+
+        quota_entry = self.calendar.add("Blog", "Cloud", "Devs", "Casual", time.time() + 3600)
+        self.assertEqual(self.scheduler.run_once(), 1)
+        self.assertEqual(self.scheduler.run_once(), 0)
+        self.assertEqual(self.calendar.get(quota_entry.id).error, "over quota")
+        self.assertEqual(self.service.generate_bundle.call_count, 5)
+
+    def test_window_wraps_midnight(self):
+        """Verifica la ventana fuera de horas punta que cruza la medianoche"""
+        self.assertTrue(in_window((22, 6), datetime(2024, 1, 1, 23)))
+        self.assertTrue(in_window((22, 6), datetime(2024, 1, 1, 5)))
+        self.assertFalse(in_window((22, 6), datetime(2024, 1, 1, 12)))
+        self.assertEqual(CalendarScheduler(self.calendar, self.service, self.store, window=(22, 6))
+                         .run_once(datetime(2024, 1, 1, 12)), 0)
+
+
+class StubNewsSource:
+    def __init__(self, feed):
+        self.feed = feed
+        self.calls = []
+
+    def fetch_feed(self, time_from=None):
+        self.calls.append(time_from)
+        return self.feed
+
+
+def news_item(url, published, tickers, topics=(), score=0.0):
+    return {"url": url, "title": f"News {url}", "time_published": format_time(published) + "00",
+            "source": "Wire", "overall_sentiment_score": score,
+            "ticker_sentiment": [{"ticker": ticker, "relevance_score": str(relevance),
+                                  "ticker_sentiment_score": str(sentiment)}
+                                 for ticker, relevance, sentiment in tickers],
+            "topics": [{"topic": topic, "relevance_score": "1.0"} for topic in topics]}
+
+
+class TestNewsPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = NewsStore(os.path.join(self.tmp_dir.name, "news.db"))
+        self.now = time.time() // 60 * 60
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_incremental_ingest_deduplicates(self):
+        """Verifica que se ignoren noticias repetidas y se pida solo lo nuevo"""
+        feed = [news_item("a", self.now - 3600, [("NVDA", 0.9, 0.5)]),
+                news_item("b", self.now - 60, [("AAPL", 0.5, -0.2)])]
+        source = StubNewsSource(feed)
+        pipeline = NewsPipeline(self.store, source, refresh_interval=0)
+        self.assertEqual(pipeline.refresh(), 2)
+        self.assertEqual(pipeline.refresh(), 0)
+        self.assertEqual(source.calls, [None, format_time(self.now - 60)])
+        self.assertEqual(self.store.count(), 2)
+
+    def test_weighted_sentiment_and_context_block(self):
+        """Verifica la agregación ponderada por relevancia y antigüedad y el bloque de contexto"""
+        rows = [("NVDA", self.now, 1.0, 0.6), ("NVDA", self.now - 24 * 3600, 1.0, 0.0),
+                ("AAPL", self.now, 0.1, -0.4)]
+        nvda, aapl = aggregate_scores(rows, self.now, half_life_hours=24)
+        # El artículo de hace un día pesa la mitad: (0.6 * 1 + 0 * 0.5) / 1.5
+        self.assertAlmostEqual(nvda.score, 0.4)
+        self.assertEqual((nvda.mentions, nvda.label), (2, "Bullish"))
+        self.assertEqual(aapl.label, "Bearish")
+
+        self.store.ingest([news_item("a", self.now - 600, [("NVDA", 0.9, 0.5)], ["Technology"], 0.3),
+                           news_item("b", self.now - 300, [("AAPL", 0.2, -0.2)], ["Earnings"], -0.1)])
+        pipeline = NewsPipeline(self.store)
+        context = pipeline.context_block("Apple (AAPL) earnings", max_tickers=1, max_topics=1)
+        self.assertIn("AAPL -0.20 Somewhat-Bearish (1)", context)
+        self.assertNotIn("NVDA", context)
+        self.assertIn("Earnings", context)
+        bound = PromptManager().compile("LinkedIn", None, context)
+        self.assertIn("Market News Context", bound.prefix)
+
+
+class StubRedis:
+    """Subconjunto de redis-py en memoria"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in self.data if key.startswith(match.rstrip("*"))]
+
+
+def fill_cache(root, start, count):
+    backend = ShardedSQLiteBackend(root, shards=4)
+    for i in range(start, start + count):
+        backend.set("test", f"key-{i}", f"value-{i}".encode())
+
+
+class TestCacheBackend(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, "cache")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_sqlite_tier_is_shared_and_bounded(self):
+        """Verifica que otro proceso vea las entradas y que cada shard respete su tamaño"""
+        import multiprocessing
+        backend = ShardedSQLiteBackend(self.root, shards=4, max_bytes=4 * 1000)
+        process = multiprocessing.get_context("spawn").Process(target=fill_cache, args=(self.root, 0, 20))
+        process.start()
+        fill_cache(self.root, 20, 20)
+        process.join(30)
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(backend.get("test", "key-3"), b"value-3")
+        self.assertEqual(backend.get("test", "key-33"), b"value-33")
+
+        for i in range(40):
+            backend.set("big", f"blob-{i}", bytes(300))
+        self.assertLessEqual(backend.total_bytes, 4 * 1000)
+        self.assertIsNone(backend.get("big", "blob-0"))
+        self.assertIsNotNone(backend.get("big", "blob-39"))
+        backend.set("short", "gone", b"x", ttl=-1)
+        self.assertIsNone(backend.get("short", "gone"))
+        backend.clear("big")
+        self.assertIsNone(backend.get("big", "blob-39"))
+
+    def test_tiered_cache_namespaces(self):
+        """Verifica los TTL por espacio de nombres y la lectura desde el nivel compartido"""
+        redis = StubRedis()
+        writer = TieredCache(RedisBackend(redis), ttls={"translation": 60})
+        writer.set("translation", "hola", {"text": "hello"})
+        writer.set("image", "png", b"\x89PNG")
+        reader = TieredCache(RedisBackend(redis))
+        self.assertEqual(reader.get("translation", "hola"), {"text": "hello"})
+        self.assertEqual(reader.get("image", "png"), b"\x89PNG")
+        self.assertEqual(reader.get_or_compute("translation", "adios", lambda: "bye"), "bye")
+        self.assertIn("content-cache:translation:adios", redis.data)
+        self.assertEqual(writer.ttl("translation"), 60)
+        reader.clear("translation")
+        self.assertEqual(list(redis.data), ["content-cache:image:png"])
+        self.assertIsNone(reader.get("translation", "hola"))
+
+    def test_images_are_cached_only_on_request(self):
+        """Verifica que "Generar" cree siempre una imagen nueva salvo que se pida la caché"""
+        from generators.image_generator import ImageGenerator
+        generator = ImageGenerator(api_key="test", cache=TieredCache())
+        with patch.object(generator, "_generate_image", side_effect=["img-1", "img-2", "img-3"]) as call:
+            self.assertEqual(generator.generate_image("Cloud"), "img-1")
+            self.assertEqual(generator.generate_image("Cloud"), "img-2")
+            self.assertEqual(generator.generate_image("Cloud", cached=True), "img-2")
+        self.assertEqual(call.call_count, 2)
+
+    def test_section_cache_defers_to_shared_tier(self):
+        """Verifica que con caché compartida las secciones sigan su TTL y no una LRU propia"""
+        shared = TieredCache(RedisBackend(StubRedis()))
+        sections = SectionCache(shared=shared)
+        sections.put("intro", "Texto")
+        self.assertEqual(sections.get("intro"), "Texto")
+        shared.clear(SectionCache.NAMESPACE)
+        self.assertIsNone(sections.get("intro"))
+
+
+class TestRunSubmitter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.spool_path = os.path.join(self.tmp_dir.name, "spool.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_flush_sends_batches(self):
+        """Verifica que los runs se envíen en lotes de tamaño máximo"""
+        client = StubLangSmithClient()
+        submitter = RunSubmitter(client, spool_path=self.spool_path, max_batch=2, start=False)
+        for i in range(5):
+            submitter.submit({"name": f"run-{i}"})
+        self.assertEqual(submitter.flush(), 5)
+        self.assertEqual([len(batch) for batch in client.batches], [2, 2, 1])
+
+    def test_spool_replays_undelivered_runs(self):
+        """Verifica que los runs no enviados se recuperen del spool al reiniciar"""
+        submitter = RunSubmitter(StubLangSmithClient(fail=True), spool_path=self.spool_path, start=False)
+        submitter.submit({"name": "pending"})
+        self.assertEqual(submitter.flush(), 0)
+
+        client = StubLangSmithClient()
+        restarted = RunSubmitter(client, spool_path=self.spool_path, start=False)
+        self.assertEqual(restarted.flush(), 1)
+        self.assertEqual(client.batches[0][0]["name"], "pending")
+        self.assertEqual(RunSubmitter(client, spool_path=self.spool_path, start=False).pending(), 0)
+
+    def test_runs_carry_trace_fields(self):
+        """Verifica que cada run lleve trace_id y dotted_order de run raíz"""
+        from datetime import datetime, timezone
+        from trackers.langsmith_tracker import LangSmithTracker
+        client = StubLangSmithClient()
+        submitter = RunSubmitter(client, spool_path=self.spool_path, start=False)
+        tracker = LangSmithTracker(client=client, submitter=submitter)
+        start = datetime(2024, 3, 1, 12, 0, 0, 250000, tzinfo=timezone.utc)
+        run_id = tracker.track_generation("prompt", "completion", {}, start_time=start, end_time=start)
+        self.assertEqual(submitter.flush(), 1)
+        run = client.batches[0][0]
+        self.assertEqual(run["trace_id"], run_id)
+        self.assertEqual(run["dotted_order"], f"20240301T120000250000Z{run_id}")
+        self.assertIsInstance(run["start_time"], datetime)
+
+    def test_compaction_keeps_in_flight_runs(self):
+        """Verifica que compactar el spool no pierda un lote tomado pero aún no enviado"""
+        submitter = RunSubmitter(StubLangSmithClient(), spool_path=self.spool_path, max_batch=1, start=False)
+        submitter.submit({"name": "in-flight"})
+        submitter.submit({"name": "sent"})
+        taken = submitter._take_batch()  # otro hilo emisor, todavía sin enviar
+        self.assertEqual(submitter.flush(), 1)
+        restarted = RunSubmitter(StubLangSmithClient(), spool_path=self.spool_path, start=False)
+        self.assertEqual(restarted.pending(), 1)
+        self.assertEqual(restarted._take_batch()[0][1]["id"], taken[0][1]["id"])
+
+    def test_spool_is_compacted_under_steady_traffic(self):
+        """Verifica que el spool se compacte aunque el buffer nunca llegue a vaciarse"""
+        submitter = RunSubmitter(StubLangSmithClient(), spool_path=self.spool_path, max_batch=1,
+                                 compact_after=4, start=False)
+        submitter.submit({"name": "run-0"})
+        for i in range(1, 20):
+            submitter.submit({"name": f"run-{i}"})
+            self.assertTrue(submitter._send(submitter._take_batch()))
+            with open(self.spool_path, encoding="utf-8") as f:
+                self.assertLessEqual(len(f.readlines()), 2 * 4 + 1)
+        self.assertEqual(RunSubmitter(StubLangSmithClient(), spool_path=self.spool_path, start=False).pending(), 1)
+
+    def test_backpressure_drops_low_priority_first(self):
+        """Verifica que con el buffer lleno se descarten primero los runs de baja prioridad"""
+        submitter = RunSubmitter(StubLangSmithClient(), spool_path=None, max_buffer=2, start=False)
+        submitter.submit({"name": "low"}, priority=PRIORITY_LOW)
+        submitter.submit({"name": "high-1"}, priority=PRIORITY_HIGH)
+        self.assertTrue(submitter.submit({"name": "high-2"}, priority=PRIORITY_HIGH))
+        self.assertFalse(submitter.submit({"name": "low-2"}, priority=PRIORITY_LOW))
+        self.assertEqual(submitter.dropped, 2)
+        client = submitter.client
+        submitter.flush()
+        self.assertEqual([run["name"] for run in client.batches[0]], ["high-1", "high-2"])
+
+@unittest.skipIf(ContentService is None, "langchain_core o groq no instalados")
+class TestContentService(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.responses = []
+        self.llm = StubLLM(lambda prompt: self.responses.pop(0))
+        self.service = ContentService(llm_manager=StubLLMManager(self.llm),
+                                      profile_manager=ProfileManager(self.tmp_dir.name), provider_name="stub")
+
+    def test_structured_repairs_only_the_invalid_item(self):
+        """Verifica que se reintente el post sin JSON y se regenere solo el tweet demasiado largo"""
+        import json
+        self.responses = [
+            "Lo siento, no puedo responder en JSON",
+            json.dumps({"tweets": ["Primer tweet", "x" * 300, "Último tweet"]}),
+            json.dumps({"value": "Segundo tweet corregido"}),
+        ]
+        result = self.service.generate_structured("Twitter", "Cloud computing", "CTOs", "Casual")
+        self.assertEqual(result["data"]["tweets"], ["Primer tweet", "Segundo tweet corregido", "Último tweet"])
+        self.assertEqual((result["repairs"], result["errors"]), (1, []))
+        self.assertEqual(len(self.llm.prompts), 3)
+        self.assertIn("tweets[1]", self.llm.prompts[2])
+        self.assertIn('Current value: "' + "x" * 300, self.llm.prompts[2])
+        self.assertEqual(result["usage"], {"prompt_tokens": 30, "completion_tokens": 15})
+
+    def test_sections_cache_per_model_and_refresh(self):
+        """Verifica que las secciones en caché dependan del modelo y que refresh las regenere"""
+        self.service.section_cache = SectionCache(shared=TieredCache())
+        self.llm.respond = lambda prompt: ('{"title": "Cloud", "headings": ["Why", "How"]}'
+                                           if "Plan a blog article" in prompt else "Texto")
+        generate = partial(self.service.generate_sections, "Blog", "Cloud computing", "CTOs", "Casual",
+                           parallel=False)
+        self.assertEqual(len(generate()["regenerated"]), 6)
+        self.assertEqual(generate()["regenerated"], [])
+        self.assertEqual(len(generate(refresh=True)["regenerated"]), 6)
+        self.assertEqual(len(generate(model="llama3-70b-8192")["regenerated"]), 6)
+        with self.assertRaises(ValueError):
+            self.service.generate_bundle("Blog", "Cloud computing", "CTOs", "Casual",
+                                         structured=True, sectioned=True)
+
+    def test_service_from_env(self):
+        """Verifica que la fábrica lea el entorno y respete los argumentos recibidos"""
+        quota_store = QuotaStore(os.path.join(self.tmp_dir.name, "quotas.db"))
+        env = {"SEMANTIC_CACHE_THRESHOLD": "", "STABILITY_API_KEY": "", "ALPHA_VANTAGE_API_KEY": ""}
+        with patch.dict(os.environ, env):
+            service = content_service_from_env(quota_store=quota_store, provider_name="stub")
+        self.assertIs(service.quota_store, quota_store)
+        self.assertEqual(service.provider_name, "stub")
+        self.assertIsNone(service.llm_manager.semantic_cache)
+        self.assertEqual((service.image_generator, service.news_pipeline), (None, None))
+
+    def test_model_ids_do_not_override_ollama_profiles(self):
+        """Verifica que un id de modelo de Groq no sustituya el modelo de Ollama"""
+        generator = OllamaGenerator(model="mistral", platform_profiles={"Blog": OllamaModelProfile("llama3:8b")})
+        service = ContentService(llm_manager=StubLLMManager(generator), provider_name="Ollama-Local")
+        llm = service.get_llm("llama3-70b-8192")
+        self.assertEqual(llm.model, "mistral")
+        self.assertEqual(service.model_for(llm, "Blog"), "llama3:8b")
+        self.assertEqual(service.model_for(llm, "Twitter"), "mistral")
+        self.assertEqual(self.service.get_llm("llama3-70b-8192").model, "llama3-70b-8192")
+
+    def test_groq_json_mode_is_not_streamed(self):
+        """Verifica que con modo JSON Groq use una llamada normal y no stream=True"""
+        with patch("generators.llm_handler.Groq") as groq:
+            create = groq.return_value.chat.completions.create
+            create.return_value.choices[0].message.content = '{"tweets": ["a", "b"]}'
+            create.return_value.usage.prompt_tokens = 7
+            create.return_value.usage.completion_tokens = 3
+            llm = GroqProvider(api_key="test").get_llm()
+            template = PromptManager().compile_structured("Twitter")
+            chunks = list(llm.stream_content(template, {"tema": "Cloud", "audiencia": "CTOs", "tono": "Casual"}))
+        self.assertEqual(chunks, ['{"tweets": ["a", "b"]}'])
+        self.assertNotIn("stream", create.call_args.kwargs)
+        self.assertEqual(create.call_args.kwargs["response_format"], {"type": "json_object"})
+        self.assertEqual(llm.last_usage, {"prompt_tokens": 7, "completion_tokens": 3})
+
+
+@unittest.skipIf(api_server is None, "langchain_core o groq no instalados")
+class TestApiServer(unittest.TestCase):
+    def setUp(self):
+        import threading
+        from types import SimpleNamespace
+        from fastapi.testclient import TestClient
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.started, self.release = threading.Event(), threading.Event()
+
+        def respond(prompt):
+            if "Slow" in prompt:
+                self.started.set()
+                self.release.wait(5)
+            if "Outage" in prompt:
+                raise ProviderError("Groq API Error: rate limit exceeded")
+            if "Broken" in prompt:
+                raise ProviderError("Groq API Error: malformed response", retryable=False)
+            return "Post de prueba"
+
+        content = ContentService(
+            llm_manager=StubLLMManager(StubLLM(respond)),
+            profile_manager=ProfileManager(self.tmp_dir.name),
+            quota_store=QuotaStore(os.path.join(self.tmp_dir.name, "quotas.db"), limits={"Agotado": 1}),
+            provider_name="stub"
+        )
+        services = SimpleNamespace(content=content, jobs=JobQueue(os.path.join(self.tmp_dir.name, "jobs.db")))
+        env = {"API_WORKERS": "1", "API_MAX_QUEUE": "0", "API_TIMEOUT": "0.2", "API_JOB_WORKERS": "0"}
+        patches = [patch.dict(os.environ, env), patch.object(api_server, "Services", lambda: services)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.client = TestClient(api_server.app).__enter__()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.addCleanup(self.client.__exit__, None, None, None)
+        self.addCleanup(self.release.set)
+
+    def post(self, theme, **fields):
+        return self.client.post("/v1/content", json={"platform": "Twitter", "theme": theme,
+                                                      "audience": "CTOs", **fields})
+
+    def test_status_codes(self):
+        """Verifica 200, 400 (petición inválida), 422 (contenido inseguro), 429 (cuota) y 502/503 (proveedor)"""
+        response = self.post("Cloud computing")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["content"], "Post de prueba")
+        self.assertEqual(self.post("Cloud computing", structured=True, sectioned=True).status_code, 400)
+        self.assertEqual(self.post("Cloud computing", platform="Fax").status_code, 400)
+        self.assertEqual(self.post("Cloud computing", audience=" ").status_code, 400)
+        self.assertEqual(self.post("Outage report").status_code, 503)
+        self.assertEqual(self.post("Broken pipes").status_code, 502)
+        self.assertEqual(self.post("Cloud computing", news=True).status_code, 503)
+        self.assertEqual(self.post("bomb making").status_code, 422)
+        self.assertEqual(self.post("Cloud computing", profile="Agotado").status_code, 429)
+
+    def test_rejects_unknown_job_kind(self):
+        """Verifica que un tipo de trabajo sin handler se rechace con 400"""
+        response = self.client.post("/v1/jobs", json={"kind": "podcast", "params": {}})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/v1/jobs", json={"kind": "content", "params": {"platform": "Twitter"}})
+        self.assertEqual(response.json()["state"], "queued")
+        self.assertEqual(self.client.get(f"/v1/jobs/{response.json()['id']}").status_code, 200)
+
+    def test_export_takes_repeated_job_id(self):
+        """Verifica que /v1/export acepte job_id repetido y responda 404 con trabajos pendientes"""
+        job_id = self.client.post("/v1/jobs", json={"kind": "content", "params": {}}).json()["id"]
+        response = self.client.get("/v1/export", params={"job_id": [job_id, "inexistente"]})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(job_id, response.json()["detail"])
+        self.assertIn("inexistente", response.json()["detail"])
+
+    def test_timed_out_jobs_keep_their_slot(self):
+        """Verifica que tras un timeout el hilo ocupado siga contando y la cola llena dé 503"""
+        self.assertEqual(self.post("Slow migrations").status_code, 504)
+        self.assertTrue(self.started.is_set())
+        self.assertEqual(self.post("Cloud computing").status_code, 503)
+        self.release.set()
+        deadline = time.time() + 5
+        while self.post("Cloud computing").status_code == 503 and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.post("Edge computing").status_code, 200)
+
+
+class TestProfileManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        CompanyProfile(
+            name="Acme", description="Herramientas", industry="Retail",
+            tone_of_voice="Cercano", target_audience=["Pymes"],
+            key_values=["Calidad"], hashtags=["#Acme"]
+        ).save_to_json(os.path.join(self.tmp_dir.name, "Acme.json"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_imports_json_profiles(self):
+        """Verifica que los perfiles JSON existentes se importen al almacén"""
+        manager = ProfileManager(self.tmp_dir.name)
+        self.assertEqual(manager.get_all_profiles(), ["Acme"])
+        self.assertEqual(manager.load_profile("Acme").industry, "Retail")
+        self.assertIn("Company Name: Acme", manager.get_prompt_context("Acme"))
+
+    def test_cache_sees_writes_from_other_instances(self):
+        """Verifica que la caché se invalide cuando otro proceso modifica el almacén"""
+        reader = ProfileManager(self.tmp_dir.name)
+        cached = reader.load_profile("Acme")
+        cached.industry = "Modificado sin guardar"
+        self.assertEqual(reader.load_profile("Acme").industry, "Retail")
+
+        writer = ProfileManager(self.tmp_dir.name)
+        updated = writer.load_profile("Acme")
+        updated.industry = "Ferretería"
+        writer.save_profile(updated)
+        writer.save_profile(CompanyProfile(
+            name="Beta", description="Software", industry="IT", tone_of_voice="Formal",
+            target_audience=["CTOs"], key_values=["Seguridad"], hashtags=["#Beta"]
+        ))
+
+        self.assertEqual(reader.get_all_profiles(), ["Acme", "Beta"])
+        self.assertEqual(reader.load_profile("Acme").industry, "Ferretería")
+        self.assertIsNone(reader.load_profile("Inexistente"))
+
+    def test_reimports_edited_json_files(self):
+        """Verifica que un JSON editado se vuelva a importar y uno sin cambios no"""
+        path = os.path.join(self.tmp_dir.name, "Acme.json")
+        manager = ProfileManager(self.tmp_dir.name)
+        edited_in_app = manager.load_profile("Acme")
+        edited_in_app.description = "Editado en la app"
+        manager.save_profile(edited_in_app)
+        self.assertEqual(manager.store.import_directory(self.tmp_dir.name), 0)
+        self.assertEqual(manager.load_profile("Acme").description, "Editado en la app")
+
+        edited_file = CompanyProfile.load_from_json(path)
+        edited_file.industry = "Ferretería"
+        edited_file.save_to_json(path)
+        self.assertEqual(ProfileManager(self.tmp_dir.name).load_profile("Acme").industry, "Ferretería")
+
 class TestIntegration(unittest.TestCase):
     def setUp(self):
         self.prompt_manager = PromptManager()
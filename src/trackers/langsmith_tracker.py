@@ -1,20 +1,312 @@
-from langsmith import Client
-from datetime import datetime
-from typing import Dict, Any
+from datetime import datetime, timezone
+from collections import deque
+from typing import Dict, Any, List, Optional
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HIGH = 2
+
+_TIME_FIELDS = ("start_time", "end_time")
+
+
+class RunSubmitter:
+    """
+    Buffers LangSmith runs and submits them in batches from a background thread.
+
+    Every accepted run is appended to a local spool file, and an ack record
+    is appended once its batch has been sent, so runs that were not
+    delivered (service down, process killed) are replayed on the next start.
+    submit() only queues the spool records in memory; the background thread
+    writes them right away, so callers never wait on disk. The spool is
+    rewritten with only the undelivered runs whenever the buffer empties or
+    `compact_after` runs (default `max_buffer`) were acked since the last
+    rewrite, so it stays bounded under steady traffic. When the in-memory
+    buffer is full, the oldest run of the lowest priority is dropped first.
+    """
+
+    def __init__(self, client: Any, spool_path: Optional[str] = "langsmith_spool.jsonl",
+                 max_batch: int = 50, flush_interval: float = 5.0, max_buffer: int = 1000,
+                 max_backoff: float = 300.0, compact_after: Optional[int] = None, start: bool = True):
+        self.client = client
+        self.spool_path = spool_path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_backoff = max_backoff
+        self.compact_after = compact_after or max_buffer
+        self.dropped = 0
+        self.failures = 0
+        self._buffers: Dict[int, deque] = {}
+        self._size = 0
+        self._inflight = 0  # batches taken but not yet acked or requeued
+        self._acked = 0  # runs acked in the spool since it was last rewritten
+        self._journal: List[Dict[str, Any]] = []  # spool records not yet written
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self._replay_spool()
+        if start:
+            self._thread = threading.Thread(target=self._run, name="langsmith-submitter", daemon=True)
+            self._thread.start()
+
+    def submit(self, run: Dict[str, Any], priority: int = PRIORITY_NORMAL) -> bool:
+        """Queues a run without blocking; returns False if it was dropped"""
+        run = _serializable_run(run)
+        with self._cond:
+            if self._size >= self.max_buffer and not self._evict_for(priority):
+                self.dropped += 1
+                return False
+            self._record({"op": "run", "priority": priority, "run": run})
+            self._buffers.setdefault(priority, deque()).append(run)
+            self._size += 1
+            self._cond.notify()
+        return True
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._size
+
+    def flush(self) -> int:
+        """Sends everything buffered right now; returns the number of runs delivered"""
+        self._write_journal()
+        sent = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return sent
+            if not self._send(batch):
+                return sent
+            sent += len(batch)
+
+    def shutdown(self, timeout: float = 10.0):
+        """Stops the background thread after a last flush attempt"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+        else:
+            self.flush()
+
+    def _evict_for(self, priority: int) -> bool:
+        for level in sorted(self._buffers):
+            if level > priority:
+                break
+            if self._buffers[level]:
+                victim = self._buffers[level].popleft()
+                self._size -= 1
+                self.dropped += 1
+                self._record({"op": "ack", "ids": [victim["id"]]})
+                return True
+        return False
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        batch = []
+        with self._cond:
+            for level in sorted(self._buffers, reverse=True):
+                queue = self._buffers[level]
+                while queue and len(batch) < self.max_batch:
+                    batch.append((level, queue.popleft()))
+            self._size -= len(batch)
+            if batch:
+                self._inflight += 1
+        return batch
+
+    def _requeue(self, batch):
+        with self._cond:
+            for level, run in reversed(batch):
+                self._buffers.setdefault(level, deque()).appendleft(run)
+            self._size += len(batch)
+            self._inflight -= 1
+
+    def _send(self, batch) -> bool:
+        runs = [_client_run(run) for _, run in batch]
+        with self._send_lock:
+            try:
+                if hasattr(self.client, "batch_ingest_runs"):
+                    self.client.batch_ingest_runs(create=runs)
+                else:
+                    for run in runs:
+                        self.client.create_run(**run)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"LangSmith submission failed, keeping {len(batch)} runs: {str(e)}")
+                self._requeue(batch)
+                return False
+        self.failures = 0
+        with self._cond:
+            self._record({"op": "ack", "ids": [run["id"] for _, run in batch]})
+        self._write_journal()
+        with self._cond:
+            self._inflight -= 1
+        self._compact_spool(only_if_due=True)
+        return True
+
+    def _batch_due(self) -> bool:
+        return self._size >= self.max_batch and not self.failures
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            with self._cond:
+                while not (self._stop or self._journal or self._batch_due()):
+                    remaining = next_flush - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stop
+                due = stopping or self._batch_due() or time.monotonic() >= next_flush
+            self._write_journal()
+            if due:
+                self.flush()
+                backoff = min(self.flush_interval * (2 ** self.failures), self.max_backoff)
+                next_flush = time.monotonic() + backoff
+            if stopping:
+                return
+
+    def _record(self, record: Dict[str, Any]):
+        """Queues a spool record; the caller holds _cond"""
+        if self.spool_path:
+            self._journal.append(record)
+            if record["op"] == "ack":
+                self._acked += len(record["ids"])
+
+    def _write_journal(self):
+        """Appends queued spool records to the file, in the order they were queued"""
+        if not self.spool_path:
+            return
+        with self._spool_lock:
+            with self._cond:
+                records, self._journal = self._journal, []
+            if not records:
+                return
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+    def _replay_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        pending: Dict[str, tuple] = {}
+        with open(self.spool_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from a crash
+                if record.get("op") == "run":
+                    run = _serializable_run(record["run"])
+                    pending[run["id"]] = (record.get("priority", PRIORITY_NORMAL), run)
+                elif record.get("op") == "ack":
+                    for run_id in record.get("ids", []):
+                        pending.pop(run_id, None)
+        for priority, run in pending.values():
+            self._buffers.setdefault(priority, deque()).append(run)
+        self._size = len(pending)
+        self._compact_spool()
+
+    def _compact_spool(self, only_if_due: bool = False):
+        """
+        Rewrites the spool with only the runs still buffered. Never while a
+        batch is in flight: its runs are in no buffer until acked or requeued.
+        With `only_if_due`, only once the buffer is empty or enough runs were
+        acked to make the rewrite worth it.
+        """
+        if not self.spool_path:
+            return
+        tmp_path = f"{self.spool_path}.tmp"
+        with self._spool_lock:
+            with self._cond:
+                if self._inflight or (only_if_due and self._size and self._acked < self.compact_after):
+                    return
+                records = [{"op": "run", "priority": level, "run": run}
+                           for level, queue in self._buffers.items() for run in queue]
+                # Everything still queued for the file is covered by this snapshot
+                self._journal = []
+                self._acked = 0
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.spool_path)
+
+
+def _dotted_order(start_time: Any, run_id: str) -> str:
+    """LangSmith ordering key of a root run: UTC start time, "Z", run id"""
+    if isinstance(start_time, str):
+        start_time = datetime.fromisoformat(start_time)
+    if start_time.tzinfo is not None:
+        start_time = start_time.astimezone(timezone.utc)
+    return f"{start_time:%Y%m%dT%H%M%S%f}Z{run_id}"
+
+
+def _serializable_run(run: Dict[str, Any]) -> Dict[str, Any]:
+    run = dict(run)
+    run["id"] = str(run.get("id") or uuid.uuid4())
+    run["start_time"] = run.get("start_time") or datetime.now(timezone.utc)
+    # batch_ingest_runs rejects runs without them; every run here is a root run
+    run.setdefault("trace_id", run["id"])
+    run.setdefault("dotted_order", _dotted_order(run["start_time"], run["id"]))
+    for field in _TIME_FIELDS:
+        if isinstance(run.get(field), datetime):
+            run[field] = run[field].isoformat()
+    return run
+
+
+def _client_run(run: Dict[str, Any]) -> Dict[str, Any]:
+    run = dict(run)
+    for field in _TIME_FIELDS:
+        if isinstance(run.get(field), str):
+            run[field] = datetime.fromisoformat(run[field])
+    return run
+
 
 class LangSmithTracker:
-    def __init__(self, api_key: str):
-        self.client = Client(api_key=api_key)
-        
-    def track_generation(self, prompt: str, completion: str, metadata: Dict[Any, Any]):
-        run = self.client.create_run(
-            name="content_generation",
-            inputs={"prompt": prompt},
-            outputs={"completion": completion},
-            timestamps={
-                "start_time": datetime.utcnow().isoformat(),
-                "end_time": datetime.utcnow().isoformat()
-            },
-            metadata=metadata
-        )
-        return run.id
\ No newline at end of file
+    def __init__(self, api_key: Optional[str] = None, client: Any = None,
+                 submitter: Optional[RunSubmitter] = None,
+                 spool_path: Optional[str] = "langsmith_spool.jsonl"):
+        if client is None:
+            from langsmith import Client
+            client = Client(api_key=api_key)
+        self.client = client
+        self.submitter = submitter or RunSubmitter(client, spool_path=spool_path)
+
+    def track_generation(self, prompt: str, completion: str, metadata: Dict[Any, Any],
+                         start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
+                         priority: int = PRIORITY_HIGH):
+        """Queues one generation run; callers should pass the real start and end times"""
+        end_time = end_time or datetime.now(timezone.utc)
+        run_id = str(uuid.uuid4())
+        self.submitter.submit({
+            "id": run_id,
+            "name": "content_generation",
+            "run_type": "llm",
+            "inputs": {"prompt": prompt},
+            "outputs": {"completion": completion},
+            "start_time": start_time or end_time,
+            "end_time": end_time,
+            "extra": {"metadata": metadata}
+        }, priority=priority)
+        return run_id
+
+    def export_spans(self, spans: List[Any]):
+        """Queues a batch of finished trace spans as low-priority runs"""
+        for span in spans:
+            self.submitter.submit({
+                "name": span.name,
+                "run_type": "chain",
+                "inputs": {},
+                "outputs": {},
+                "start_time": datetime.fromtimestamp(span.start_time_ns / 1e9, timezone.utc),
+                "end_time": datetime.fromtimestamp(span.end_time_ns / 1e9, timezone.utc),
+                "error": span.error,
+                "extra": {"metadata": {**span.attributes, "trace_id": span.trace_id}}
+            }, priority=PRIORITY_LOW)
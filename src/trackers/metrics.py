@@ -0,0 +1,392 @@
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = []
+    for k, v in items:
+        value = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{k}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, List[float]]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None, help: str = ""):
+        """Increments a counter"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None,
+                buckets: Tuple[float, ...] = DEFAULT_BUCKETS, help: str = ""):
+        """Records a value in a histogram (bucket counts, then sum and count)"""
+        key = _label_key(labels)
+        with self._lock:
+            bounds = self._buckets.setdefault(name, tuple(buckets))
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [0.0] * (len(bounds) + 2)
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+            if help:
+                self._help.setdefault(name, help)
+
+    def get_counter(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        """Returns the current value of a counter series"""
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def get_histogram(self, name: str, labels: Optional[Dict[str, str]] = None) -> Tuple[float, int]:
+        """Returns (sum, count) for a histogram series"""
+        with self._lock:
+            state = self._histograms.get(name, {}).get(_label_key(labels))
+            return (state[-2], int(state[-1])) if state else (0.0, 0)
+
+    def render_prometheus(self) -> str:
+        """Renders all series in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                bounds = self._buckets[name]
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, state in series.items():
+                    for i, bound in enumerate(bounds):
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(float(bound))))} {int(state[i])}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {int(state[-1])}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {state[-2]}")
+                    lines.append(f"{name}_count{_format_labels(key)} {int(state[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """A timed operation, exported in an OpenTelemetry-compatible shape"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "OK"
+        self.error: Optional[str] = None
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+            self.end_time_ns = self.start_time_ns + int(self.duration * 1e9)
+
+    def to_otel(self) -> Dict[str, Any]:
+        """Returns the span in the OTLP/JSON span layout"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns or self.start_time_ns),
+            "attributes": [_otel_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 1 if self.status == "OK" else 2, "message": self.error or ""},
+        }
+
+
+def _otel_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class BatchExporter:
+    """
+    Hands finished spans to an export function from a background thread.
+
+    `submit` never blocks: when the queue is full the span is dropped and
+    counted, so a slow or unreachable backend cannot stall generation.
+    """
+
+    def __init__(self, export_fn: Callable[[List[Span]], None], max_batch: int = 64,
+                 interval: float = 5.0, max_queue: int = 2048,
+                 registry: Optional[MetricsRegistry] = None):
+        self.export_fn = export_fn
+        self.max_batch = max_batch
+        self.interval = interval
+        self.registry = registry
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            if self.registry:
+                self.registry.inc("spans_dropped_total", help="Spans dropped because the export queue was full")
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            self._export([first] + self._drain())
+        self.flush()
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.export_fn(batch)
+        except Exception as e:
+            logger.warning(f"Span export failed: {str(e)}")
+
+    def flush(self):
+        """Exports everything that is still queued"""
+        batch = self._drain()
+        while batch:
+            self._export(batch)
+            batch = self._drain()
+
+    def shutdown(self, timeout: float = 5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+class JsonSpanFileExporter:
+    """Appends spans as OTLP/JSON `resourceSpans` lines to a local file"""
+
+    def __init__(self, path: str, service_name: str = "content-generator"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def __call__(self, spans: List[Span]):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otel_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "content-generator"},
+                    "spans": [span.to_otel() for span in spans],
+                }],
+            }]
+        }
+        line = json.dumps(payload, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class Tracer:
+    """
+    Creates spans, records their duration and forwards them to exporters.
+
+    The open span stack lives in a context variable, so concurrent asyncio
+    tasks on one event loop thread each see their own parent spans.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self._stack: contextvars.ContextVar = contextvars.ContextVar(f"span_stack_{id(self)}", default=())
+        self._exporters: List[BatchExporter] = []
+
+    def add_exporter(self, exporter: BatchExporter):
+        self._exporters.append(exporter)
+
+    def current_span(self) -> Optional[Span]:
+        stack = self._stack.get()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Times the enclosed block; nested spans share the trace id"""
+        stack = self._stack.get()
+        parent = stack[-1] if stack else None
+        span = Span(name, parent.trace_id if parent else uuid.uuid4().hex,
+                    parent.span_id if parent else None, attributes)
+        token = self._stack.set(stack + (span,))
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "ERROR"
+            span.error = str(e)
+            raise
+        finally:
+            span.end()
+            try:
+                self._stack.reset(token)
+            except ValueError:
+                # Exited from another context (e.g. a generator closed elsewhere)
+                self._stack.set(stack)
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        labels = {"span": span.name, "status": span.status}
+        self.registry.observe("span_duration_seconds", span.duration, labels,
+                              help="Duration of traced operations")
+        for exporter in self._exporters:
+            exporter.submit(span)
+
+
+registry = MetricsRegistry()
+tracer = Tracer(registry)
+
+
+def record_tokens(provider: str, model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    """Counts prompt and completion tokens reported by a provider"""
+    labels = {"provider": provider, "model": model}
+    if prompt_tokens is not None:
+        registry.inc("llm_tokens_total", prompt_tokens, {**labels, "kind": "prompt"},
+                     help="Tokens consumed by LLM calls")
+    if completion_tokens is not None:
+        registry.inc("llm_tokens_total", completion_tokens, {**labels, "kind": "completion"},
+                     help="Tokens consumed by LLM calls")
+    span = tracer.current_span()
+    if span:
+        span.set_attributes({"llm.prompt_tokens": prompt_tokens or 0,
+                             "llm.completion_tokens": completion_tokens or 0})
+
+
+def record_payload(name: str, direction: str, size: int):
+    """Records the size in bytes of a request or response payload"""
+    registry.observe("payload_bytes", size, {"span": name, "direction": direction},
+                     buckets=SIZE_BUCKETS, help="Payload sizes of outbound calls")
+    span = tracer.current_span()
+    if span:
+        span.set_attribute(f"payload.{direction}_bytes", size)
+
+
+def record_cache(cache: str, hit: bool):
+    """Counts a cache lookup as hit or miss"""
+    registry.inc("cache_requests_total", 1, {"cache": cache, "result": "hit" if hit else "miss"},
+                 help="Cache lookups by result")
+    span = tracer.current_span()
+    if span:
+        span.set_attribute(f"cache.{cache}.hit", hit)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves /metrics for Prometheus scraping; safe to call on every rerun"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
+
+
+def configure_from_env():
+    """
+    Enables exporters from environment variables:
+    METRICS_PORT (Prometheus endpoint), TRACE_EXPORT_PATH (OTLP/JSON file)
+    and LANGSMITH_API_KEY (batched LangSmith upload).
+    """
+    with _server_lock:
+        if getattr(configure_from_env, "_done", False):
+            return
+        configure_from_env._done = True
+
+    port = os.getenv("METRICS_PORT")
+    if port:
+        try:
+            start_metrics_server(int(port))
+        except (OSError, ValueError) as e:
+            # Another worker already serves this port; run without the endpoint
+            logger.warning(f"Metrics endpoint disabled on port {port}: {str(e)}")
+
+    trace_path = os.getenv("TRACE_EXPORT_PATH")
+    if trace_path:
+        tracer.add_exporter(BatchExporter(JsonSpanFileExporter(trace_path), registry=registry))
+
+    langsmith_key = os.getenv("LANGSMITH_API_KEY")
+    if langsmith_key:
+        try:
+            from trackers.langsmith_tracker import LangSmithTracker
+            tracker = LangSmithTracker(api_key=langsmith_key)
+            tracer.add_exporter(BatchExporter(tracker.export_spans, registry=registry))
+        except Exception as e:
+            logger.warning(f"LangSmith export disabled: {str(e)}")
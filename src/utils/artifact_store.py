@@ -0,0 +1,153 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import BinaryIO, Dict, Optional, Union
+
+from trackers.metrics import registry
+
+
+@dataclass(frozen=True)
+class Artifact:
+    """Lightweight handle to a stored artifact, cheap to keep in session state"""
+    id: str
+    suffix: str
+    size: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.id}{self.suffix}"
+
+    def to_dict(self) -> Dict[str, Union[str, int]]:
+        return asdict(self)
+
+
+class ArtifactStore:
+    """
+    Size-bounded, content-addressed disk cache for generated text and images.
+
+    Files are written atomically under `root` and evicted least recently used
+    first once the total size passes `max_bytes`. Reads refresh recency
+    (file mtimes, so it is shared with other processes). An evicted artifact
+    reads back as None, so callers must handle expiry.
+
+    The size is counted per directory: processes sharing `root` (app, API,
+    calendar scheduler) rescan it every `rescan_interval` seconds and evict
+    from their in-memory index in between, so writes stay O(1) and the
+    directory stays within `max_bytes` plus what other processes wrote since
+    the last rescan.
+    """
+
+    def __init__(self, root: str = "artifacts", max_bytes: int = 512 * 1024 * 1024,
+                 rescan_interval: float = 30.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._scanned_at = 0.0
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def _load_index(self):
+        # Rebuild sizes and recency order from the files of every process sharing the directory
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for file_name in files:
+                if file_name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, file_name))
+                except FileNotFoundError:
+                    continue  # evicted by another process meanwhile
+                entries.append((stat.st_mtime, file_name, stat.st_size))
+        self._index = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._total = sum(self._index.values())
+        self._scanned_at = time.monotonic()
+
+    def put(self, data: Union[bytes, bytearray, memoryview, str], suffix: str = "") -> Artifact:
+        """Stores data and returns its handle; identical data is stored once"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        artifact = Artifact(hashlib.sha256(data).hexdigest(), suffix, len(data))
+        path = self._path(artifact.name)
+        with self._lock:
+            if artifact.name in self._index and os.path.exists(path):
+                self._touch(artifact.name, path)
+                return artifact
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._total += artifact.size - self._index.pop(artifact.name, 0)
+            self._index[artifact.name] = artifact.size
+            if time.monotonic() - self._scanned_at >= self.rescan_interval:
+                self._load_index()
+            self._evict()
+        registry.inc("artifact_store_bytes_written_total", artifact.size, help="Bytes written to the artifact store")
+        return artifact
+
+    def _touch(self, name: str, path: str):
+        self._index.move_to_end(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._index) > 1:
+            name, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                os.unlink(self._path(name))
+            except FileNotFoundError:
+                pass
+            registry.inc("artifact_store_evictions_total", 1, help="Artifacts evicted from the artifact store")
+
+    def path(self, artifact: Artifact) -> Optional[str]:
+        """Returns the file path of an artifact, or None if it was evicted"""
+        path = self._path(artifact.name)
+        if not os.path.exists(path):
+            with self._lock:
+                self._total -= self._index.pop(artifact.name, 0)
+            return None
+        with self._lock:
+            if artifact.name not in self._index:
+                # Written by another process sharing the directory
+                self._index[artifact.name] = artifact.size
+                self._total += artifact.size
+            self._touch(artifact.name, path)
+        return path
+
+    def open(self, artifact: Artifact) -> Optional[BinaryIO]:
+        path = self.path(artifact)
+        if path is None:
+            return None
+        try:
+            return open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+    def read_text(self, artifact: Artifact) -> Optional[str]:
+        f = self.open(artifact)
+        if f is None:
+            return None
+        with f:
+            return f.read().decode("utf-8")
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
@@ -0,0 +1,199 @@
+"""
+Section-level generation for Blog articles.
+
+The article is split into an outline (title and headings) and the parts
+written from it: introduction, one body per section, conclusion and call to
+action. Each part declares the inputs it depends on, including single
+company profile fields, and is cached under a key of only those inputs, so
+editing the audience or one profile field regenerates only the parts that
+use it.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.prompt_manager import TOKENS_PER_WORD, BUDGET_HEADROOM, normalize_whitespace
+
+# Bump when the section instructions below change, so cached parts are not reused
+SECTION_PROMPT_VERSION = "1"
+
+
+@dataclass(frozen=True)
+class SectionSpec:
+    name: str
+    instructions: str
+    params: Tuple[str, ...]
+    profile_fields: Tuple[str, ...]
+    words: int
+    json_mode: bool = False
+
+
+OUTLINE = SectionSpec(
+    "outline",
+    "Plan a blog article about {tema}, in a {tono} tone.\n"
+    "Respond only with a JSON object {{\"title\": ..., \"headings\": [...]}}: a catchy, SEO-friendly "
+    "title of at most 120 characters and 3-4 headings for the main sections, in reading order.",
+    ("tema", "tono"), ("name", "description", "industry"), 60, json_mode=True,
+)
+INTRODUCTION = SectionSpec(
+    "introduction",
+    "Write the introduction (2-3 engaging paragraphs) of the blog article \"{title}\" about {tema}.\n"
+    "Audience: {audiencia}\nTone: {tono}\nThe article continues with these sections: {headings}.",
+    ("tema", "audiencia", "tono", "title", "headings"), ("name", "description", "tone_of_voice"), 200,
+)
+SECTION = SectionSpec(
+    "section",
+    "Write the body of the section \"{heading}\" of the blog article \"{title}\" about {tema}.\n"
+    "Audience: {audiencia}\nTone: {tono}\nThe other sections are: {headings}; do not repeat them.\n"
+    "Include 2-3 bullet points if relevant. Do not repeat the heading.",
+    ("tema", "audiencia", "tono", "title", "heading", "headings"), ("industry", "key_values", "tone_of_voice"), 180,
+)
+CONCLUSION = SectionSpec(
+    "conclusion",
+    "Write an impactful conclusion (one paragraph) for the blog article \"{title}\" about {tema}, "
+    "which covered: {headings}.\nTone: {tono}",
+    ("tema", "tono", "title", "headings"), ("key_values", "tone_of_voice"), 100,
+)
+CALL_TO_ACTION = SectionSpec(
+    "call_to_action",
+    "Write a one or two sentence call to action closing a blog article about {tema}.\n"
+    "Audience: {audiencia}\nTone: {tono}",
+    ("tema", "audiencia", "tono"), ("name", "website", "hashtags", "target_audience"), 40,
+)
+
+SECTION_PREFIX = normalize_whitespace("""
+    You are writing one part of a professional blog article.
+    Use language adapted to the specified audience.
+    Write only the requested part, in markdown, without headings or comments about the task.
+""")
+
+
+def profile_subset(profile: Optional[Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """The profile fields a section depends on ({} without a profile)"""
+    if profile is None:
+        return {}
+    return {field: getattr(profile, field) for field in fields if getattr(profile, field, None)}
+
+
+class SectionPrompt:
+    """
+    Prompt for one part of a sectioned Blog article.
+
+    Mirrors BoundPrompt (`prefix`, `max_tokens`, `format`), so generators
+    and ContentService quota handling accept it unchanged; `platform` picks
+    the Blog model profile in OllamaGenerator. `key` identifies
+    the spec, the template version, the model and every input the part
+    depends on.
+    """
+
+    platform = "Blog"
+
+    def __init__(self, spec: SectionSpec, params: Dict[str, Any], profile: Optional[Any] = None,
+                 template_version: Optional[str] = None, model: Optional[str] = None):
+        self.spec = spec
+        self.json_mode = spec.json_mode
+        self.params = {name: params[name] for name in spec.params}
+        context = profile_subset(profile, spec.profile_fields)
+        self.prefix = SECTION_PREFIX
+        if context:
+            lines = [f"- {field.replace('_', ' ').title()}: "
+                     f"{', '.join(value) if isinstance(value, list) else value}"
+                     for field, value in context.items()]
+            self.prefix = f"{SECTION_PREFIX}\n\nCompany Context:\n" + "\n".join(lines)
+        self.max_tokens = int(spec.words * TOKENS_PER_WORD * BUDGET_HEADROOM)
+        key_data = json.dumps([SECTION_PROMPT_VERSION, template_version, model, spec.name, self.params, context],
+                              sort_keys=True, ensure_ascii=False)
+        self.key = hashlib.sha1(key_data.encode("utf-8")).hexdigest()
+
+    def format(self, **params) -> str:
+        values = {name: ", ".join(value) if isinstance(value, list) else value
+                  for name, value in dict(self.params, **params).items()}
+        return f"{self.prefix}\n\n{self.spec.instructions.format(**values)}"
+
+
+def part_prompts(outline: Dict[str, Any], params: Dict[str, Any], profile: Optional[Any] = None,
+                 template_version: Optional[str] = None, model: Optional[str] = None) -> Dict[str, SectionPrompt]:
+    """Prompts for every part written from an outline, keyed by part name ("section.0", ...)"""
+    params = dict(params, title=outline["title"], headings=outline["headings"])
+    prompts = {"introduction": SectionPrompt(INTRODUCTION, params, profile, template_version, model)}
+    for index, heading in enumerate(outline["headings"]):
+        prompts[f"section.{index}"] = SectionPrompt(SECTION, dict(params, heading=heading), profile,
+                                                    template_version, model)
+    prompts["conclusion"] = SectionPrompt(CONCLUSION, params, profile, template_version, model)
+    prompts["call_to_action"] = SectionPrompt(CALL_TO_ACTION, params, profile, template_version, model)
+    return prompts
+
+
+def assemble(outline: Dict[str, Any], parts: Dict[str, str]) -> Dict[str, Any]:
+    """Builds Blog data in the structured-output schema from an outline and its written parts"""
+    return {
+        "title": outline["title"],
+        "introduction": parts["introduction"],
+        "sections": [{"heading": heading, "body": parts[f"section.{index}"]}
+                     for index, heading in enumerate(outline["headings"])],
+        "conclusion": parts["conclusion"],
+        "call_to_action": parts["call_to_action"],
+    }
+
+
+class SectionCache:
+    """
+    Generated parts keyed by SectionPrompt.key. With `shared`, parts live
+    only in that TieredCache ("blog_sections" namespace), whose local tier
+    and TTLs apply, so parts generated by one worker process are reused by
+    the others; without it, in a thread-safe LRU of `max_entries`.
+    """
+
+    NAMESPACE = "blog_sections"
+
+    def __init__(self, max_entries: int = 2048, shared: Optional[Any] = None):
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.shared is not None:
+            return self.shared.get(self.NAMESPACE, key)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any):
+        if self.shared is not None:
+            self.shared.set(self.NAMESPACE, key, value)
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def parse_outline(text: str) -> Dict[str, Any]:
+    """Reads {"title", "headings"} from a model response; raises ValueError if unusable"""
+    start, end = (text or "").find("{"), (text or "").rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("The model did not return a blog outline")
+    data = json.loads(text[start:end + 1])
+    headings = [str(heading).strip() for heading in data.get("headings") or [] if str(heading).strip()]
+    title = str(data.get("title") or "").strip()
+    if not title or len(headings) < 2:
+        raise ValueError("The blog outline needs a title and at least two headings")
+    return {"title": title, "headings": headings[:6]}
+
+
+def strip_heading(text: str) -> str:
+    """Drops a leading markdown heading the model may add despite the instructions"""
+    text = (text or "").strip()
+    if text.startswith("#"):
+        text = text.partition("\n")[2].strip()
+    return text
@@ -0,0 +1,345 @@
+"""
+Cache shared by the services of every app and API worker process.
+
+`TieredCache` puts a small in-process LRU in front of a shared backend:
+a sharded SQLite directory on the local disk (`ShardedSQLiteBackend`,
+locked across processes by SQLite itself) or any Redis-compatible server
+(`RedisBackend`). Keys live in namespaces, each with its own TTL, and
+both tiers account for the bytes they hold and evict to stay bounded.
+
+The process-wide cache comes from `shared_cache()`, configured with:
+    CACHE_URL   sqlite:///path/to/dir (default: memory only) or redis://host:6379/0
+    CACHE_MB    size of the shared tier (SQLite; Redis is bounded by its maxmemory)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from trackers.metrics import record_cache
+
+# Seconds each namespace keeps its entries; None never expires
+DEFAULT_TTLS: Dict[str, Optional[float]] = {
+    "translation": 7 * 86400,
+    "image": 3600,
+    "market_news": 900,
+    "blog_sections": 7 * 86400,
+}
+
+_BYTES = b"b"
+_JSON = b"j"
+
+
+def encode(value: Any) -> bytes:
+    """bytes are stored as is, everything else as JSON"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return _BYTES + bytes(value)
+    return _JSON + json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def decode(data: bytes) -> Any:
+    if data[:1] == _BYTES:
+        return data[1:]
+    return json.loads(data[1:].decode("utf-8"))
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable key for arbitrary JSON-serializable parts"""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU bounded by total bytes; also the first tier of TieredCache"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Optional[float], bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.time():
+                self._pop((namespace, key))
+                return None
+            self._entries.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: Optional[float] = None):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._pop((namespace, key))
+            self._entries[(namespace, key)] = (time.time() + ttl if ttl else None, value)
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                self._size -= len(self._entries.popitem(last=False)[1][1])
+
+    def _pop(self, entry_key: Tuple[str, str]):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._pop((namespace, key))
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock:
+            for entry_key in [k for k in self._entries if namespace is None or k[0] == namespace]:
+                self._pop(entry_key)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._size
+
+
+class ShardedSQLiteBackend:
+    """
+    Shared tier in a directory of SQLite files, one per shard, picked by key hash.
+
+    Spreading keys over shards keeps writers from different processes from
+    queueing on a single database lock. Each shard holds at most
+    `max_bytes / shards` bytes: expired entries go first, then the least
+    recently read ones. Reads refresh recency at most once a minute per
+    entry, to keep them from turning into writes.
+    """
+
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, root: str = "cache", shards: int = 8, max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.shards = shards
+        self.max_bytes = max_bytes
+        self._shard_budget = max_bytes // shards
+        os.makedirs(root, exist_ok=True)
+        for shard in range(shards):
+            with closing(self._connect(shard)) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS entries (
+                        namespace TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        value BLOB NOT NULL,
+                        size INTEGER NOT NULL,
+                        expires REAL,
+                        accessed REAL NOT NULL,
+                        PRIMARY KEY (namespace, key)
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def _connect(self, shard: int) -> sqlite3.Connection:
+        conn = sqlite3.connect(os.path.join(self.root, f"shard-{shard:02d}.db"), timeout=30,
+                               isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _shard(self, namespace: str, key: str) -> int:
+        digest = hashlib.blake2b(f"{namespace}\0{key}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.shards
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        now = time.time()
+        with closing(self._connect(self._shard(namespace, key))) as conn:
+            row = conn.execute("SELECT value, expires, accessed FROM entries WHERE namespace = ? AND key = ?",
+                               (namespace, key)).fetchone()
+            if row is None:
+                return None
+            value, expires, accessed = row
+            if expires is not None and expires <= now:
+                conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ? AND expires <= ?",
+                             (namespace, key, now))
+                return None
+            if now - accessed > self.TOUCH_INTERVAL:
+                conn.execute("UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?",
+                             (now, namespace, key))
+            return value
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: Optional[float] = None):
+        if len(value) > self._shard_budget:
+            return
+        now = time.time()
+        with closing(self._connect(self._shard(namespace, key))) as conn:
+            # BEGIN IMMEDIATE takes the shard's write lock up front, so the size check and
+            # the eviction see a consistent total across processes
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                             (namespace, key, value, len(value), now + ttl if ttl else None, now))
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self._shard_budget:
+                    total -= self._evict(conn, total, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, conn: sqlite3.Connection, total: int, now: float) -> int:
+        freed = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries WHERE expires <= ?", (now,)).fetchone()[0]
+        conn.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        if total - freed <= self._shard_budget:
+            return freed
+        victims = []
+        for namespace, key, size in conn.execute("SELECT namespace, key, size FROM entries ORDER BY accessed"):
+            if total - freed <= self._shard_budget:
+                break
+            victims.append((namespace, key))
+            freed += size
+        conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+        return freed
+
+    def delete(self, namespace: str, key: str):
+        with closing(self._connect(self._shard(namespace, key))) as conn:
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace: Optional[str] = None):
+        for shard in range(self.shards):
+            with closing(self._connect(shard)) as conn:
+                if namespace is None:
+                    conn.execute("DELETE FROM entries")
+                else:
+                    conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    @property
+    def total_bytes(self) -> int:
+        total = 0
+        for shard in range(self.shards):
+            with closing(self._connect(shard)) as conn:
+                total += conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        return total
+
+
+class RedisBackend:
+    """
+    Shared tier on a Redis-compatible server. `client` needs get, set(ex=),
+    delete and scan_iter, as in redis-py. TTLs map to Redis expiry; the size
+    bound is the server's maxmemory with an LRU eviction policy.
+    """
+
+    def __init__(self, client: Any, prefix: str = "content-cache"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisBackend":
+        import redis
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        return self.client.get(self._key(namespace, key))
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: Optional[float] = None):
+        self.client.set(self._key(namespace, key), value, ex=int(ttl) if ttl else None)
+
+    def delete(self, namespace: str, key: str):
+        self.client.delete(self._key(namespace, key))
+
+    def clear(self, namespace: Optional[str] = None):
+        pattern = f"{self.prefix}:{namespace}:*" if namespace else f"{self.prefix}:*"
+        keys = list(self.client.scan_iter(match=pattern))
+        if keys:
+            self.client.delete(*keys)
+
+
+class TieredCache:
+    """
+    In-process LRU in front of an optional shared backend.
+
+    Values are bytes or anything JSON-serializable. A shared hit is copied
+    into the local tier, for at most `local_ttl` seconds so entries changed
+    or deleted by other processes are picked up. `ttls` overrides
+    DEFAULT_TTLS per namespace.
+    """
+
+    def __init__(self, shared: Optional[Any] = None, local_max_bytes: int = 64 * 1024 * 1024,
+                 ttls: Optional[Dict[str, Optional[float]]] = None, default_ttl: Optional[float] = 3600.0,
+                 local_ttl: float = 60.0):
+        self.local = MemoryBackend(local_max_bytes)
+        self.shared = shared
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.local_ttl = local_ttl
+
+    def ttl(self, namespace: str) -> Optional[float]:
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def _local_ttl(self, namespace: str) -> Optional[float]:
+        ttl = self.ttl(namespace)
+        if self.shared is None:
+            return ttl
+        return min(ttl, self.local_ttl) if ttl else self.local_ttl
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        data = self.local.get(namespace, key)
+        if data is None and self.shared is not None:
+            data = self.shared.get(namespace, key)
+            if data is not None:
+                self.local.set(namespace, key, data, self._local_ttl(namespace))
+        record_cache(namespace, data is not None)
+        return decode(data) if data is not None else default
+
+    def set(self, namespace: str, key: str, value: Any):
+        data = encode(value)
+        self.local.set(namespace, key, data, self._local_ttl(namespace))
+        if self.shared is not None:
+            self.shared.set(namespace, key, data, self.ttl(namespace))
+
+    def get_or_compute(self, namespace: str, key: str, compute: Callable[[], Any]) -> Any:
+        """Cached value, or compute() stored unless it is None"""
+        value = self.get(namespace, key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(namespace, key, value)
+        return value
+
+    def delete(self, namespace: str, key: str):
+        self.local.delete(namespace, key)
+        if self.shared is not None:
+            self.shared.delete(namespace, key)
+
+    def clear(self, namespace: Optional[str] = None):
+        self.local.clear(namespace)
+        if self.shared is not None:
+            self.shared.clear(namespace)
+
+
+def cache_from_env() -> TieredCache:
+    url = os.getenv("CACHE_URL", "")
+    shared = None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        shared = RedisBackend.from_url(url)
+    elif url:
+        path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else url
+        shared = ShardedSQLiteBackend(path, shards=int(os.getenv("CACHE_SHARDS", "8")),
+                                      max_bytes=int(os.getenv("CACHE_MB", "512")) * 1024 * 1024)
+    return TieredCache(shared, local_max_bytes=int(os.getenv("CACHE_LOCAL_MB", "64")) * 1024 * 1024)
+
+
+_shared_cache: Optional[TieredCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def shared_cache() -> TieredCache:
+    """The process-wide cache, created from the environment on first use"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = cache_from_env()
+        return _shared_cache
@@ -23,9 +23,11 @@ class CompanyProfile:
             return cls(**data)
     
     def save_to_json(self, file_path: str):
-        """Guarda el perfil en un archivo JSON"""
-        with open(file_path, 'w', encoding='utf-8') as f:
+        """Guarda el perfil en un archivo JSON (escritura atómica)"""
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(self.__dict__, f, indent=4)
+        os.replace(tmp_path, file_path)
     
     def get_prompt_context(self) -> str:
         """Genera contexto para el prompt basado en el perfil"""
@@ -43,26 +45,27 @@ class CompanyProfile:
 class ProfileManager:
     """Gestor de perfiles de empresa"""
     
-    def __init__(self, profiles_dir: str = "profiles"):
+    def __init__(self, profiles_dir: str = "profiles", db_name: str = "profiles.db"):
+        from utils.profile_store import ProfileStore
+
         self.profiles_dir = profiles_dir
         os.makedirs(profiles_dir, exist_ok=True)
+        self.store = ProfileStore(os.path.join(profiles_dir, db_name))
+        # Los perfiles JSON nuevos o modificados se importan al almacén
+        self.store.import_directory(profiles_dir)
     
     def save_profile(self, profile: CompanyProfile):
         """Guarda un perfil"""
-        file_path = os.path.join(self.profiles_dir, f"{profile.name}.json")
-        profile.save_to_json(file_path)
+        self.store.put(profile)
     
     def load_profile(self, name: str) -> Optional[CompanyProfile]:
         """Carga un perfil por nombre"""
-        file_path = os.path.join(self.profiles_dir, f"{name}.json")
-        if os.path.exists(file_path):
-            return CompanyProfile.load_from_json(file_path)
-        return None
+        return self.store.get(name)
+    
+    def get_prompt_context(self, name: str) -> Optional[str]:
+        """Obtiene el contexto de prompt precalculado de un perfil"""
+        return self.store.get_prompt_context(name)
     
     def get_all_profiles(self) -> List[str]:
         """Obtiene lista de todos los perfiles disponibles"""
-        profiles = []
-        for file in os.listdir(self.profiles_dir):
-            if file.endswith('.json'):
-                profiles.append(file[:-5])  # Remove .json extension
-        return profiles
\ No newline at end of file
+        return self.store.names()
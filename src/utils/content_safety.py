@@ -1,5 +1,6 @@
 import re
 from typing import Dict, List
+from trackers.metrics import tracer
 
 class ContentSafetyValidator:
     HARMFUL_KEYWORDS = [
@@ -71,7 +72,9 @@ def safety_check_middleware(theme: str, platform: str, content: str) -> Dict:
     """
     Safety middleware for content validation
     """
-    safety_result = ContentSafetyValidator.validate_content(theme, content)
+    with tracer.span("safety.check", platform=platform, content_chars=len(content)) as span:
+        safety_result = ContentSafetyValidator.validate_content(theme, content)
+        span.set_attribute("safety.is_safe", safety_result['is_safe'])
     
     if not safety_result['is_safe']:
         risk_messages = []
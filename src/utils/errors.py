@@ -0,0 +1,26 @@
+"""
+Errors shared by the generators, the services and the API.
+
+The API answers InvalidRequestError with 400 and ProviderError with 503 if
+retrying later may help or 502 otherwise, so clients can tell their own
+mistakes from upstream outages.
+"""
+from typing import Optional
+
+
+class InvalidRequestError(ValueError):
+    """The request itself is invalid (missing parameters, unknown platform, mode or language...)"""
+
+
+class ProviderError(RuntimeError):
+    """An upstream provider (Groq, Ollama, Stability...) failed or is not available"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status_code = 503 if retryable else 502
+
+
+def retryable_status(status: Optional[int]) -> bool:
+    """Rate limits, upstream 5xx and no response at all (connection errors, timeouts)"""
+    return status is None or status == 429 or status >= 500
@@ -0,0 +1,151 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Dict, List, Optional, Tuple
+
+from utils.company_profile import CompanyProfile
+
+
+class ProfileStore:
+    """
+    Single-file SQLite store for company profiles.
+
+    Names are indexed by the primary key. Parsed profiles and their prompt
+    contexts are cached in memory and revalidated against the database file
+    mtime, so repeated reads (e.g. on every Streamlit rerun) do not touch disk.
+    Writes are atomic SQLite transactions.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._versions: Dict[str, float] = {}
+        self._names: List[str] = []
+        self._cache: Dict[str, Tuple[float, CompanyProfile, str]] = {}
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    name TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    prompt_context TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS imported_files (
+                    file TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _file_signature(self) -> Tuple[int, int]:
+        stat = os.stat(self.db_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self):
+        """Reloads the name index if the database file changed on disk"""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT name, updated_at FROM profiles ORDER BY name").fetchall()
+        self._versions = dict(rows)
+        self._names = [name for name, _ in rows]
+        self._cache = {name: entry for name, entry in self._cache.items()
+                       if self._versions.get(name) == entry[0]}
+        self._signature = signature
+
+    def _entry(self, name: str) -> Optional[Tuple[float, CompanyProfile, str]]:
+        with self._lock:
+            self._refresh()
+            entry = self._cache.get(name)
+            if entry is not None or name not in self._versions:
+                return entry
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT data, prompt_context, updated_at FROM profiles WHERE name = ?", (name,)
+                ).fetchone()
+            if row is None:
+                return None
+            entry = (row[2], CompanyProfile(**json.loads(row[0])), row[1])
+            self._cache[name] = entry
+            return entry
+
+    def names(self) -> List[str]:
+        """Returns all profile names in alphabetical order"""
+        with self._lock:
+            self._refresh()
+            return list(self._names)
+
+    def get(self, name: str) -> Optional[CompanyProfile]:
+        """Returns a copy of the parsed profile or None; callers may modify it"""
+        entry = self._entry(name)
+        return copy.deepcopy(entry[1]) if entry else None
+
+    def get_prompt_context(self, name: str) -> Optional[str]:
+        """Returns the precomputed prompt context of a profile"""
+        entry = self._entry(name)
+        return entry[2] if entry else None
+
+    def put(self, profile: CompanyProfile):
+        """Inserts or replaces a profile in a single transaction"""
+        self.put_many([profile])
+
+    def put_many(self, profiles: List[CompanyProfile]):
+        """Inserts or replaces several profiles in a single transaction"""
+        updated_at = time.time()
+        rows = [(p.name, json.dumps(p.__dict__, ensure_ascii=False), p.get_prompt_context(), updated_at)
+                for p in profiles]
+        with self._lock:
+            with closing(self._connect()) as conn, conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO profiles (name, data, prompt_context, updated_at) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+            self._signature = None
+
+    def delete(self, name: str) -> bool:
+        """Deletes a profile; returns False if it did not exist"""
+        with self._lock:
+            with closing(self._connect()) as conn, conn:
+                deleted = conn.execute("DELETE FROM profiles WHERE name = ?", (name,)).rowcount
+            self._signature = None
+            return deleted > 0
+
+    def import_directory(self, directory: str) -> int:
+        """
+        Imports JSON profiles that are new or whose file changed since it was
+        last imported; returns how many were imported. A file seen for the
+        first time whose profile is already in the store is only recorded,
+        so edits made through the store are kept until the file changes.
+        """
+        known = set(self.names())
+        with closing(self._connect()) as conn:
+            digests = dict(conn.execute("SELECT file, digest FROM imported_files").fetchall())
+        profiles, imported = [], []
+        for file in sorted(os.listdir(directory)):
+            if not file.endswith('.json'):
+                continue
+            path = os.path.join(directory, file)
+            with open(path, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+            if digests.get(file) == digest:
+                continue
+            if file in digests or file[:-5] not in known:
+                profiles.append(CompanyProfile.load_from_json(path))
+            imported.append((file, digest))
+        if profiles:
+            self.put_many(profiles)
+        if imported:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.executemany("INSERT OR REPLACE INTO imported_files (file, digest) VALUES (?, ?)", imported)
+        return len(profiles)
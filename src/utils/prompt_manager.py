@@ -1,4 +1,164 @@
-from typing import Dict, Optional
+from collections import OrderedDict
+from string import Formatter
+from typing import Dict, List, Optional
+import hashlib
+import json
+import math
+import re
+import threading
+
+from utils.errors import InvalidRequestError
+from utils.structured_output import PLATFORM_SCHEMAS, StructuredPrompt
+
+# Rough conversion factors used to turn template length hints into token budgets
+TOKENS_PER_WORD = 1.5
+CHARS_PER_TOKEN = 3.5
+BUDGET_HEADROOM = 1.2
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for budgeting before a provider reports real usage"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def token_budget(length: Dict[str, int]) -> Optional[int]:
+    """Converts a template length hint ({"words": n} or {"chars": n}) into max output tokens"""
+    if "words" in length:
+        return math.ceil(length["words"] * TOKENS_PER_WORD * BUDGET_HEADROOM)
+    if "chars" in length:
+        return math.ceil(length["chars"] / CHARS_PER_TOKEN * BUDGET_HEADROOM)
+    return None
+
+
+def normalize_whitespace(text: str) -> str:
+    """Strips indentation and trailing spaces and collapses runs of blank lines"""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+class CompiledTemplate:
+    """
+    A platform template parsed once.
+
+    The lines before the first placeholder form the static part, which goes
+    into the shared prompt prefix with the company and grounding context. The
+    rest of the template, from the task line with the first placeholder on,
+    is rendered after that prefix with its instructions in their original
+    order, so the model reads the task before the rules that refine it.
+    """
+
+    def __init__(self, platform: str, template: str, params: List[str],
+                 length: Optional[Dict[str, int]] = None):
+        self.platform = platform
+        self.params = list(params)
+        self.max_tokens = token_budget(length or {})
+        static_lines, dynamic_lines = [], []
+        fields = set()
+        for line in normalize_whitespace(template).splitlines():
+            line_fields = {name for _, name, _, _ in Formatter().parse(line) if name}
+            fields |= line_fields
+            (dynamic_lines if line_fields or dynamic_lines else static_lines).append(line)
+        unknown = fields - set(self.params)
+        if unknown:
+            raise ValueError(f"Template for {platform} uses undeclared params: {sorted(unknown)}")
+        self.static_text = normalize_whitespace("\n".join(static_lines))
+        self.dynamic_template = "\n".join(dynamic_lines)
+
+    def validate(self, params: Dict[str, str]):
+        """Raises ValueError if a required param is missing or empty"""
+        missing = [p for p in self.params if not str(params.get(p, "")).strip()]
+        if missing:
+            raise InvalidRequestError(f"Missing required parameters: {', '.join(missing)}")
+
+    def render_dynamic(self, params: Dict[str, str]) -> str:
+        self.validate(params)
+        return self.dynamic_template.format(**params)
+
+
+class BoundPrompt:
+    """
+    A compiled template bound to an optional company profile.
+
+    The rendered static prefix is fixed for the lifetime of the object and
+    `prefix_key` identifies it, so providers with prefix/KV caching can reuse it.
+    `format(**params)` mirrors `str.format`, so generators accept it in place
+    of a raw template string.
+    """
+
+    def __init__(self, compiled: CompiledTemplate, prefix: str):
+        self.compiled = compiled
+        self.prefix = prefix
+        self.prefix_key = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+
+    @property
+    def params(self) -> List[str]:
+        return self.compiled.params
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        return self.compiled.max_tokens
+
+    def format(self, **params) -> str:
+        return "\n\n".join(part for part in (self.prefix, self.compiled.render_dynamic(params)) if part)
+
+
+VARIANT_MARKER = "=== VARIANT {index}: {tone} ==="
+_VARIANT_RE = re.compile(r"^[ \t]*=+[ \t]*VARIANT[ \t]+(\d+)\b.*$", re.IGNORECASE | re.MULTILINE)
+
+
+class VariantPrompt:
+    """
+    A BoundPrompt asking for one variant per tone in a single completion.
+
+    The profile prefix is sent once for all variants and the token budget
+    grows with the number of variants. `parse()` splits the response back
+    into one text per tone, using the marker lines requested in the prompt.
+    """
+
+    def __init__(self, bound: BoundPrompt, tones: List[str]):
+        if not tones:
+            raise InvalidRequestError("At least one tone is required")
+        self.bound = bound
+        self.tones = list(tones)
+        self.prefix = bound.prefix
+        variant_key = f"{bound.prefix_key}:variants:{'|'.join(self.tones)}"
+        self.prefix_key = hashlib.sha1(variant_key.encode("utf-8")).hexdigest()
+
+    @property
+    def compiled(self) -> CompiledTemplate:
+        return self.bound.compiled
+
+    @property
+    def params(self) -> List[str]:
+        return self.bound.params
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        max_tokens = self.bound.max_tokens
+        return max_tokens * len(self.tones) if max_tokens else None
+
+    def format(self, **params) -> str:
+        params = dict(params, tono="one per variant, as listed below")
+        markers = "\n".join(VARIANT_MARKER.format(index=i, tone=tone) for i, tone in enumerate(self.tones, 1))
+        return (f"{self.bound.format(**params)}\n\n"
+                f"Write {len(self.tones)} independent variants of this content, each in its own tone. "
+                f"Start each variant with its marker line exactly as shown, in this order, "
+                f"and write nothing outside the variants:\n{markers}")
+
+    def parse(self, text: str) -> List[Optional[str]]:
+        """Returns one text per tone, None for variants missing from the response"""
+        variants: List[Optional[str]] = [None] * len(self.tones)
+        matches = list(_VARIANT_RE.finditer(text or ""))
+        if not matches and len(self.tones) == 1:
+            return [text.strip() or None] if text else [None]
+        for i, match in enumerate(matches):
+            index = int(match.group(1)) - 1
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            body = text[match.end():end].strip()
+            if 0 <= index < len(variants) and body and variants[index] is None:
+                variants[index] = body
+        return variants
+
 
 class PromptManager:
     """Manages prompt templates for different platforms"""
@@ -23,7 +183,9 @@ class PromptManager:
                 - Approximate length: 800-1000 words
                 - Include 2-3 bullet points where relevant
                 """,
-                "params": ["tema", "audiencia", "tono"]
+                "params": ["tema", "audiencia", "tono"],
+                # Upper bound of the requested 800-1000 words
+                "length": {"words": 1000}
             },
             
             "Twitter": {
@@ -42,7 +204,9 @@ class PromptManager:
                 - Include appropriate emojis
                 - Maintain a coherent and progressive thread
                 """,
-                "params": ["tema", "audiencia", "tono"]
+                "params": ["tema", "audiencia", "tono"],
+                # Main tweet, 4-5 development tweets and a final one, 280 chars each
+                "length": {"chars": 7 * 280}
             },
             
             "LinkedIn": {
@@ -62,7 +226,9 @@ class PromptManager:
                 - Strategically use professional emojis
                 - Add 3-5 relevant hashtags at the end
                 """,
-                "params": ["tema", "audiencia", "tono"]
+                "params": ["tema", "audiencia", "tono"],
+                # LinkedIn post character limit
+                "length": {"chars": 3000}
             },
             
             "Instagram": {
@@ -82,14 +248,90 @@ class PromptManager:
                 - 8-10 strategic hashtags
                 - Conversational and authentic tone
                 """,
-                "params": ["tema", "audiencia", "tono"]
+                "params": ["tema", "audiencia", "tono"],
+                # Instagram caption character limit
+                "length": {"chars": 2200}
             }
         }
     
+        for template_data in self.templates.values():
+            template_data["template"] = normalize_whitespace(template_data["template"])
+        self._compiled: Dict[str, CompiledTemplate] = {}
+        self._prefixes: "OrderedDict[tuple, BoundPrompt]" = OrderedDict()
+        self.max_cached_prefixes = 256
+        self._lock = threading.Lock()
+    
     def get_template(self, platform: str) -> Optional[Dict]:
         """Gets template for a specific platform"""
         return self.templates.get(platform)
     
+    def get_token_budget(self, platform: str) -> Optional[int]:
+        """Returns the max output tokens for a platform, derived from its length hint"""
+        compiled = self.get_compiled(platform)
+        return compiled.max_tokens if compiled else None
+    
+    def template_version(self, platform: str) -> Optional[str]:
+        """Hash of a platform's template and length hint; changes whenever either is edited"""
+        template_data = self.templates.get(platform)
+        if template_data is None:
+            return None
+        data = json.dumps([template_data["template"], template_data.get("length")], sort_keys=True)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+    
     def get_all_platforms(self) -> list:
         """Returns list of all available platforms"""
-        return list(self.templates.keys())
\ No newline at end of file
+        return list(self.templates.keys())
+    
+    def get_compiled(self, platform: str) -> Optional[CompiledTemplate]:
+        """Gets the compiled template for a platform (compiled on first use)"""
+        compiled = self._compiled.get(platform)
+        if compiled is None and platform in self.templates:
+            template_data = self.templates[platform]
+            compiled = CompiledTemplate(platform, template_data["template"], template_data["params"],
+                                        template_data.get("length"))
+            self._compiled[platform] = compiled
+        return compiled
+    
+    def compile(self, platform: str, profile_context: Optional[str] = None,
+                grounding: Optional[str] = None) -> Optional[BoundPrompt]:
+        """
+        Returns the template for a platform bound to a company context and an
+        optional grounding block (such as the market news context).
+        The rendered static prefix is cached per (platform, profile context, grounding).
+        """
+        compiled = self.get_compiled(platform)
+        if compiled is None:
+            return None
+        key = (platform, profile_context, grounding)
+        with self._lock:
+            bound = self._prefixes.get(key)
+            if bound is not None:
+                self._prefixes.move_to_end(key)
+                return bound
+        blocks = [compiled.static_text]
+        if profile_context:
+            context = normalize_whitespace(profile_context)
+            if not context.startswith("Company Context:"):
+                context = f"Company Context:\n{context}"
+            blocks.append(context)
+        if grounding:
+            blocks.append(normalize_whitespace(grounding))
+        bound = BoundPrompt(compiled, "\n\n".join(block for block in blocks if block))
+        with self._lock:
+            self._prefixes[key] = bound
+            if len(self._prefixes) > self.max_cached_prefixes:
+                self._prefixes.popitem(last=False)
+        return bound
+    
+    def compile_variants(self, platform: str, tones: List[str], profile_context: Optional[str] = None,
+                         grounding: Optional[str] = None) -> Optional[VariantPrompt]:
+        """Returns a prompt asking for one variant per tone in a single call"""
+        bound = self.compile(platform, profile_context, grounding)
+        return VariantPrompt(bound, tones) if bound is not None else None
+    
+    def compile_structured(self, platform: str, profile_context: Optional[str] = None,
+                           grounding: Optional[str] = None) -> Optional[StructuredPrompt]:
+        """Returns a prompt asking for the platform's JSON schema, or None if it has none"""
+        bound = self.compile(platform, profile_context, grounding)
+        schema = PLATFORM_SCHEMAS.get(platform)
+        return StructuredPrompt(bound, schema) if bound is not None and schema else None
@@ -0,0 +1,169 @@
+import sqlite3
+import time
+import uuid
+from contextlib import closing, contextmanager
+from typing import Dict, Iterator, Optional
+
+from trackers.metrics import registry
+
+# USD per million tokens (prompt, completion)
+MODEL_PRICING = {
+    "mixtral-8x7b-32768": (0.24, 0.24),
+    "llama2-70b-4096": (0.70, 0.80),
+    "gemma-7b-it": (0.07, 0.07),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Returns the cost in USD of a call, 0.0 for unpriced (e.g. local) models"""
+    prompt_price, completion_price = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class QuotaExceededError(Exception):
+    """Raised when a tenant has no token budget left in the current window"""
+
+
+class Reservation:
+    """Tokens held for an in-flight request until its real usage is known"""
+
+    def __init__(self, tenant: str, tokens: int):
+        self.tenant = tenant
+        self.tokens = tokens
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def record(self, prompt_tokens: int, completion_tokens: int, model: Optional[str] = None):
+        """Sets the usage reported by the provider"""
+        self.prompt_tokens = prompt_tokens or 0
+        self.completion_tokens = completion_tokens or 0
+        self.cost = estimate_cost(model, self.prompt_tokens, self.completion_tokens) if model else 0.0
+
+
+class QuotaStore:
+    """
+    Per-tenant (company profile) token quotas over a sliding time window.
+
+    Usage and in-flight reservations are persisted in SQLite, so the quota
+    is shared by every process (app and API workers). Each request reserves
+    its token budget up front inside a write transaction, so concurrent
+    requests from one heavy tenant cannot overshoot the quota together.
+    Reservations left behind by a killed process stop counting after
+    `reservation_ttl` seconds.
+
+    Requests without a company profile all share the "default" tenant.
+    """
+
+    def __init__(self, db_path: str = "quotas.db", window_seconds: int = 24 * 3600,
+                 default_limit: int = 200_000, limits: Optional[Dict[str, int]] = None,
+                 reservation_ttl: int = 900):
+        self.db_path = db_path
+        self.window_seconds = window_seconds
+        self.default_limit = default_limit
+        self.limits = dict(limits or {})
+        self.reservation_ttl = reservation_ttl
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage (
+                    tenant TEXT NOT NULL,
+                    ts REAL NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    cost REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS usage_tenant_ts ON usage (tenant, ts)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reservations (
+                    id TEXT PRIMARY KEY,
+                    tenant TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+
+    def _committed(self, conn: sqlite3.Connection, tenant: str) -> int:
+        """Tokens used in the window plus tokens held by live reservations"""
+        now = time.time()
+        row = conn.execute("""
+            SELECT
+                (SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM usage
+                 WHERE tenant = ? AND ts >= ?) +
+                (SELECT COALESCE(SUM(tokens), 0) FROM reservations WHERE tenant = ? AND expires_at > ?)
+        """, (tenant, now - self.window_seconds, tenant, now)).fetchone()
+        return row[0]
+
+    def get_limit(self, tenant: str) -> int:
+        return self.limits.get(tenant, self.default_limit)
+
+    def used(self, tenant: str) -> int:
+        """Tokens recorded for a tenant within the current window"""
+        since = time.time() - self.window_seconds
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM usage WHERE tenant = ? AND ts >= ?",
+                (tenant, since)
+            ).fetchone()
+        return row[0]
+
+    def remaining(self, tenant: str) -> int:
+        with closing(self._connect()) as conn:
+            return self.get_limit(tenant) - self._committed(conn, tenant)
+
+    def record(self, tenant: str, prompt_tokens: int, completion_tokens: int, cost: float = 0.0,
+               reservation_id: Optional[str] = None):
+        """Stores the usage of a finished call, releasing its reservation in the same transaction"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if prompt_tokens or completion_tokens:
+                    conn.execute(
+                        "INSERT INTO usage (tenant, ts, prompt_tokens, completion_tokens, cost) VALUES (?, ?, ?, ?, ?)",
+                        (tenant, time.time(), prompt_tokens, completion_tokens, cost)
+                    )
+                if reservation_id:
+                    conn.execute("DELETE FROM reservations WHERE id = ?", (reservation_id,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if cost:
+            registry.inc("llm_cost_usd_total", cost, {"tenant": tenant}, help="Estimated LLM spend")
+
+    @contextmanager
+    def reserve(self, tenant: str, tokens: int) -> Iterator[Reservation]:
+        """
+        Holds `tokens` for the duration of a call and records the real usage afterwards.
+        Raises QuotaExceededError if the tenant cannot afford the reservation.
+        """
+        reservation_id = uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                conn.execute("DELETE FROM reservations WHERE expires_at <= ?", (now,))
+                accepted = self._committed(conn, tenant) + tokens <= self.get_limit(tenant)
+                if accepted:
+                    conn.execute(
+                        "INSERT INTO reservations (id, tenant, tokens, expires_at) VALUES (?, ?, ?, ?)",
+                        (reservation_id, tenant, tokens, now + self.reservation_ttl)
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if not accepted:
+            registry.inc("quota_rejections_total", 1, {"tenant": tenant},
+                         help="Requests rejected by the token quota")
+            raise QuotaExceededError(f"Token quota exceeded for '{tenant}'")
+        reservation = Reservation(tenant, tokens)
+        try:
+            yield reservation
+        finally:
+            self.record(tenant, reservation.prompt_tokens, reservation.completion_tokens, reservation.cost,
+                        reservation_id=reservation_id)
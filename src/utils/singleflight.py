@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from trackers.metrics import registry
+
+
+def flight_key(*parts: Any) -> str:
+    """Builds a key from request parts, collapsing whitespace in strings"""
+    normalized = [" ".join(part.split()) if isinstance(part, str) else repr(part) for part in parts]
+    return hashlib.sha256("\x1f".join(normalized).encode("utf-8")).hexdigest()
+
+
+def _record(group: str, coalesced: bool):
+    registry.inc("singleflight_calls_total", 1, {"group": group, "role": "coalesced" if coalesced else "leader"},
+                 help="Calls through single-flight groups; coalesced calls shared another call's result")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """
+    Shares one execution among concurrent callers with the same key (threads).
+
+    The first caller runs the function; callers arriving while it runs wait
+    and receive the same result or exception. Nothing is cached afterwards.
+    """
+
+    def __init__(self, group: str):
+        self.group = group
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """Returns (result, shared) where `shared` is True for coalesced callers"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        _record(self.group, not leader)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """Same as SingleFlight for coroutines running on one event loop"""
+
+    def __init__(self, group: str):
+        self.group = group
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Tuple[Any, bool]:
+        """Returns (result, shared); a cancelled caller does not cancel the shared call"""
+        task = self._tasks.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._tasks.pop(key) if self._tasks.get(key) is done else None)
+        _record(self.group, shared)
+        return await asyncio.shield(task), shared
@@ -0,0 +1,314 @@
+"""
+Structured (JSON) output for platform posts.
+
+Each platform has a small JSON schema. The model is asked for a JSON object
+(in JSON mode where the backend supports it) and the response is parsed
+incrementally: every top-level field is validated as soon as it is complete,
+so a failing field is known before the stream ends and only that field,
+or the failing item of a list, needs to be regenerated.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+PLATFORM_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "Blog": {
+        "type": "object",
+        "required": ["title", "introduction", "sections", "conclusion", "call_to_action"],
+        "properties": {
+            "title": {"type": "string", "maxLength": 120},
+            "introduction": {"type": "string"},
+            "sections": {
+                "type": "array", "minItems": 2, "maxItems": 6,
+                "items": {
+                    "type": "object",
+                    "required": ["heading", "body"],
+                    "properties": {"heading": {"type": "string"}, "body": {"type": "string"}}
+                }
+            },
+            "conclusion": {"type": "string"},
+            "call_to_action": {"type": "string"}
+        }
+    },
+    "Twitter": {
+        "type": "object",
+        "required": ["tweets"],
+        "properties": {
+            "tweets": {"type": "array", "minItems": 2, "maxItems": 10,
+                       "items": {"type": "string", "maxLength": 280}}
+        }
+    },
+    "LinkedIn": {
+        "type": "object",
+        "required": ["body", "hashtags"],
+        "properties": {
+            "body": {"type": "string", "maxLength": 3000},
+            "hashtags": {"type": "array", "minItems": 1, "maxItems": 5,
+                         "items": {"type": "string", "pattern": "^#\\w+$"}}
+        }
+    },
+    "Instagram": {
+        "type": "object",
+        "required": ["body", "hashtags"],
+        "properties": {
+            "body": {"type": "string", "maxLength": 2200},
+            "hashtags": {"type": "array", "minItems": 1, "maxItems": 30,
+                         "items": {"type": "string", "pattern": "^#\\w+$"}}
+        }
+    }
+}
+
+_TYPES = {"object": dict, "array": list, "string": str}
+
+
+class FieldError(NamedTuple):
+    path: Tuple[Any, ...]
+    message: str
+
+    def __str__(self) -> str:
+        return f"{format_path(self.path)}: {self.message}"
+
+
+def format_path(path: Tuple[Any, ...]) -> str:
+    text = ""
+    for part in path:
+        text += f"[{part}]" if isinstance(part, int) else (f".{part}" if text else str(part))
+    return text or "<root>"
+
+
+def validate(schema: Dict[str, Any], value: Any, path: Tuple[Any, ...] = ()) -> List[FieldError]:
+    """Validates a value against the schema subset used by PLATFORM_SCHEMAS"""
+    expected = _TYPES.get(schema.get("type"))
+    if expected is not None and not isinstance(value, expected):
+        return [FieldError(path, f"expected {schema['type']}")]
+    errors = []
+    if isinstance(value, str):
+        if not value.strip():
+            errors.append(FieldError(path, "must not be empty"))
+        if "maxLength" in schema and len(value) > schema["maxLength"]:
+            errors.append(FieldError(path, f"{len(value)} characters, maximum is {schema['maxLength']}"))
+        if "pattern" in schema and not re.match(schema["pattern"], value):
+            errors.append(FieldError(path, f"must match {schema['pattern']}"))
+    elif isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append(FieldError(path, f"{len(value)} items, minimum is {schema['minItems']}"))
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append(FieldError(path, f"{len(value)} items, maximum is {schema['maxItems']}"))
+        for i, item in enumerate(value):
+            errors.extend(validate(schema.get("items", {}), item, path + (i,)))
+    elif isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(FieldError(path + (name,), "missing"))
+        for name, subschema in schema.get("properties", {}).items():
+            if name in value:
+                errors.extend(validate(subschema, value[name], path + (name,)))
+    return errors
+
+
+def subschema(schema: Dict[str, Any], path: Tuple[Any, ...]) -> Dict[str, Any]:
+    for part in path:
+        schema = schema.get("items", {}) if isinstance(part, int) else schema.get("properties", {}).get(part, {})
+    return schema
+
+
+def set_path(data: Dict[str, Any], path: Tuple[Any, ...], value: Any):
+    target = data
+    for part in path[:-1]:
+        target = target[part]
+    target[path[-1]] = value
+
+
+def repair_path(error: FieldError) -> Tuple[Any, ...]:
+    """The unit regenerated for an error: a top-level field, or one item of a top-level list"""
+    if len(error.path) >= 2 and isinstance(error.path[1], int):
+        return error.path[:2]
+    return error.path[:1]
+
+
+def normalize(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Cheap local fixes applied before asking the model to repair anything"""
+    hashtags = data.get("hashtags")
+    if isinstance(hashtags, list):
+        data["hashtags"] = [f"#{tag.strip().lstrip('#')}" if isinstance(tag, str) else tag for tag in hashtags]
+    return data
+
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON object as it streams in.
+
+    `feed()` returns the top-level fields completed by the chunk; each one is
+    validated against its schema right away and its errors kept in `errors`.
+    Text before the opening brace (such as a markdown fence) is ignored.
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema = schema
+        self.fields: Dict[str, Any] = {}
+        self.errors: Dict[str, List[FieldError]] = {}
+        self.complete = False
+        self._buffer = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self.complete:
+            pos, char = self._pos, buffer[self._pos]
+            self._pos += 1
+            if self._start is None:
+                if char == "{":
+                    self._start, self._depth = pos, 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        self._key = json.loads(buffer[self._key_start:pos + 1])
+                continue
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start is None:
+                    self._key_start = pos
+            elif char == ":" and self._depth == 1:
+                self._value_start = pos + 1
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_field(buffer[self._value_start:pos], completed)
+                    self.complete = True
+            elif char == "," and self._depth == 1:
+                self._complete_field(buffer[self._value_start:pos], completed)
+        return completed
+
+    def _complete_field(self, text: Optional[str], completed: List[Tuple[str, Any]]):
+        key, self._key, self._value_start = self._key, None, None
+        if key is None or text is None:
+            return
+        try:
+            value = json.loads(text)
+        except ValueError:
+            self.errors[key] = [FieldError((key,), "invalid JSON value")]
+            return
+        self.fields[key] = value
+        field_schema = self.schema.get("properties", {}).get(key)
+        if field_schema is not None:
+            errors = validate(field_schema, value, (key,))
+            if errors:
+                self.errors[key] = errors
+        completed.append((key, value))
+
+    def close(self) -> Dict[str, Any]:
+        """Returns the parsed object; raises ValueError if no JSON object was found"""
+        if self._start is None:
+            raise ValueError("Response does not contain a JSON object")
+        # A truncated response keeps the fields that did complete; the rest show up as missing
+        return dict(self.fields)
+
+
+class StructuredPrompt:
+    """
+    A BoundPrompt asking for the platform's JSON schema instead of markdown.
+    Generators check `json_mode` to enable their native JSON output.
+    """
+
+    json_mode = True
+
+    def __init__(self, bound: Any, schema: Dict[str, Any]):
+        self.bound = bound
+        self.schema = schema
+        self.prefix = bound.prefix
+        self.prefix_key = hashlib.sha1(f"{bound.prefix_key}:json".encode("utf-8")).hexdigest()
+
+    @property
+    def compiled(self):
+        return self.bound.compiled
+
+    @property
+    def params(self) -> List[str]:
+        return self.bound.params
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        return self.bound.max_tokens
+
+    def format(self, **params) -> str:
+        return (f"{self.bound.format(**params)}\n\n"
+                f"Respond only with a JSON object matching this JSON schema, with no markdown:\n"
+                f"{json.dumps(self.schema, ensure_ascii=False)}")
+
+
+class RepairPrompt:
+    """Prompt regenerating a single field (or list item) of a structured post"""
+
+    json_mode = True
+
+    def __init__(self, platform: str, schema: Dict[str, Any], data: Dict[str, Any],
+                 path: Tuple[Any, ...], errors: List[FieldError], max_tokens: Optional[int] = None):
+        self.platform = platform
+        self.max_tokens = max_tokens
+        current = data
+        try:
+            for part in path:
+                current = current[part]
+        except (KeyError, IndexError, TypeError):
+            current = None
+        self.text = (
+            f"This {platform} post was generated as JSON:\n{json.dumps(data, ensure_ascii=False)}\n\n"
+            f"The field {format_path(path)} is invalid: {'; '.join(e.message for e in errors)}.\n"
+            f"Current value: {json.dumps(current, ensure_ascii=False)}\n"
+            f"Rewrite only that field, keeping its meaning and style. Respond only with a JSON object "
+            f'{{"value": ...}} where the value matches this JSON schema:\n'
+            f"{json.dumps(subschema(schema, path), ensure_ascii=False)}"
+        )
+        # The whole prompt is static, so quota reservations count all of it
+        self.prefix = self.text
+
+    def format(self, **params) -> str:
+        return self.text
+
+
+def render_markdown(platform: str, data: Dict[str, Any]) -> str:
+    """
+    Renders a structured post back into the markdown shown and downloaded by the app.
+
+    The data may be partial or still invalid (e.g. after failed repairs), so
+    values are coerced to text and malformed sections are skipped.
+    """
+    def text(value: Any) -> str:
+        return "" if value is None else str(value)
+
+    def items(value: Any) -> List[Any]:
+        return value if isinstance(value, list) else []
+
+    if not isinstance(data, dict):
+        return text(data)
+    if platform == "Blog":
+        parts = [f"# {text(data.get('title'))}", text(data.get("introduction"))]
+        for section in items(data.get("sections")):
+            if isinstance(section, dict):
+                parts.append(f"## {text(section.get('heading'))}\n\n{text(section.get('body'))}")
+        parts += [text(data.get("conclusion")), f"**{text(data.get('call_to_action'))}**"]
+        return "\n\n".join(part for part in parts if part.strip("#* \n"))
+    if platform == "Twitter":
+        tweets = [text(tweet) for tweet in items(data.get("tweets")) if tweet is not None]
+        return "\n\n".join(f"{i}/{len(tweets)} {tweet}" for i, tweet in enumerate(tweets, 1))
+    body = text(data.get("body"))
+    hashtags = " ".join(text(tag) for tag in items(data.get("hashtags")) if tag is not None)
+    return f"{body}\n\n{hashtags}" if hashtags else body
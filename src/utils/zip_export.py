@@ -0,0 +1,214 @@
+"""
+Streaming ZIP export for generated content and images.
+
+Entries are written straight from on-disk files or from in-memory buffers
+through memoryviews, so an archive never needs a second full copy of its
+payloads. Already-compressed formats are stored as-is; text is deflated.
+Sizes and CRCs go in data descriptors, so the archive is produced in one
+pass and can be streamed while it is being built.
+"""
+import base64
+import os
+import struct
+import time
+import zlib
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+CHUNK_SIZE = 1024 * 1024
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".zip", ".gz")
+
+_ZIP_STORED = 0
+_ZIP_DEFLATED = 8
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_ZIP32_LIMIT = 0xFFFFFFFF
+_ZIP16_LIMIT = 0xFFFF
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _dos_datetime(timestamp: float):
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+class _Entry:
+    def __init__(self, name: str, source: Callable[[], Iterable[Buffer]], compress: bool, mtime: float):
+        self.name = name.encode("utf-8")
+        self.source = source
+        self.method = _ZIP_DEFLATED if compress else _ZIP_STORED
+        self.mtime = mtime
+        self.crc = 0
+        self.compressed_size = 0
+        self.size = 0
+        self.offset = 0
+
+
+def _memory_chunks(data: Buffer) -> Callable[[], Iterator[memoryview]]:
+    view = memoryview(data).cast("B")
+
+    def chunks():
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield view[start:start + CHUNK_SIZE]
+    return chunks
+
+
+def _file_chunks(path: str) -> Callable[[], Iterator[bytes]]:
+    def chunks():
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+    return chunks
+
+
+class ZipStream:
+    """
+    ZIP archive built incrementally from files and buffers.
+
+    Entries are only read while the archive is iterated, so adding many
+    large artifacts is cheap; iterate once, or use write_to().
+    """
+
+    def __init__(self, compress_level: int = 6):
+        self.compress_level = compress_level
+        self._entries: List[_Entry] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _should_compress(name: str, compress: Optional[bool]) -> bool:
+        if compress is not None:
+            return compress
+        return not name.lower().endswith(STORED_EXTENSIONS)
+
+    def add_buffer(self, name: str, data: Union[Buffer, str], compress: Optional[bool] = None):
+        """Adds an entry from bytes, bytearray or memoryview without copying it"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._entries.append(_Entry(name, _memory_chunks(data), self._should_compress(name, compress), time.time()))
+
+    def add_deferred(self, name: str, producer: Callable[[], Buffer], compress: Optional[bool] = None):
+        """Adds an entry whose buffer is produced when written and released right after"""
+        self._entries.append(_Entry(name, lambda: _memory_chunks(producer())(),
+                                    self._should_compress(name, compress), time.time()))
+
+    def add_file(self, name: str, path: str, compress: Optional[bool] = None):
+        """Adds an entry read from disk in chunks while the archive is written"""
+        self._entries.append(_Entry(name, _file_chunks(path), self._should_compress(name, compress),
+                                    os.path.getmtime(path)))
+
+    def _local_header(self, entry: _Entry) -> bytes:
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        return struct.pack("<4s2B4HL2L2H", b"PK\x03\x04", 20, 0, _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8,
+                           entry.method, dos_time, dos_date, 0, 0, 0, len(entry.name), 0) + entry.name
+
+    def _central_header(self, entry: _Entry) -> bytes:
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        extra = b""
+        offset = entry.offset
+        if offset >= _ZIP32_LIMIT:
+            extra = struct.pack("<2HQ", 1, 8, offset)
+            offset = _ZIP32_LIMIT
+        version = 45 if extra else 20
+        return struct.pack("<4s4B4HL2L5H2L", b"PK\x01\x02", version, 3, version, 0,
+                           _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8, entry.method, dos_time, dos_date,
+                           entry.crc, entry.compressed_size, entry.size, len(entry.name), len(extra),
+                           0, 0, 0, 0o100644 << 16, offset) + entry.name + extra
+
+    def _entry_data(self, entry: _Entry) -> Iterator[Buffer]:
+        compressor = None
+        if entry.method == _ZIP_DEFLATED:
+            compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+        for chunk in entry.source():
+            entry.crc = zlib.crc32(chunk, entry.crc)
+            entry.size += len(chunk)
+            if compressor is None:
+                entry.compressed_size += len(chunk)
+                yield chunk
+                continue
+            compressed = compressor.compress(chunk)
+            if compressed:
+                entry.compressed_size += len(compressed)
+                yield compressed
+        if compressor is not None:
+            compressed = compressor.flush()
+            entry.compressed_size += len(compressed)
+            yield compressed
+        if entry.size >= _ZIP32_LIMIT or entry.compressed_size >= _ZIP32_LIMIT:
+            raise ValueError(f"Entry too large for a ZIP archive: {entry.name.decode('utf-8')}")
+
+    def __iter__(self) -> Iterator[Buffer]:
+        position = 0
+        for entry in self._entries:
+            entry.offset = position
+            entry.crc = entry.size = entry.compressed_size = 0
+            header = self._local_header(entry)
+            position += len(header)
+            yield header
+            for chunk in self._entry_data(entry):
+                position += len(chunk)
+                yield chunk
+            descriptor = struct.pack("<4s3L", b"PK\x07\x08", entry.crc, entry.compressed_size, entry.size)
+            position += len(descriptor)
+            yield descriptor
+
+        directory_offset = position
+        for entry in self._entries:
+            header = self._central_header(entry)
+            position += len(header)
+            yield header
+        directory_size = position - directory_offset
+
+        count = len(self._entries)
+        if count >= _ZIP16_LIMIT or directory_offset >= _ZIP32_LIMIT or directory_size >= _ZIP32_LIMIT:
+            # Zip64 end records for archives with many entries or over 4 GiB
+            yield struct.pack("<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0, count, count,
+                              directory_size, directory_offset)
+            yield struct.pack("<4sLQL", b"PK\x06\x07", 0, position, 1)
+            yield struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, _ZIP16_LIMIT, _ZIP16_LIMIT,
+                              _ZIP32_LIMIT, _ZIP32_LIMIT, 0)
+        else:
+            yield struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, count, count,
+                              directory_size, directory_offset, 0)
+
+    def write_to(self, fileobj: BinaryIO) -> int:
+        """Writes the archive to a binary file object and returns its size"""
+        written = 0
+        for chunk in self:
+            fileobj.write(chunk)
+            written += len(chunk)
+        return written
+
+
+def add_result(archive: ZipStream, platform: str, result: Dict[str, Any], folder: str = ""):
+    """
+    Adds a generation result (content and optional image, or tone variants) to an archive.
+    The image is decoded from base64 only when its entry is written.
+    """
+    name = platform.lower()
+    prefix = f"{folder}/" if folder else ""
+    if "variants" in result:
+        for variant in result["variants"]:
+            if variant.get("content"):
+                archive.add_buffer(f"{prefix}content_{name}_{variant['tone'].lower()}.txt", variant["content"])
+        return
+    archive.add_buffer(f"{prefix}content_{name}.txt", result.get("content") or "")
+    image = result.get("image_base64")
+    if image:
+        archive.add_deferred(f"{prefix}image_{name}.png", lambda: base64.b64decode(image))
+
+
+def export_jobs(jobs: Iterable[Any]) -> ZipStream:
+    """Archives finished jobs, one folder per job, for streaming or write_to()"""
+    archive = ZipStream()
+    for job in jobs:
+        if not job.result:
+            continue
+        platform = job.params.get("platform", job.kind)
+        add_result(archive, platform, job.result, folder=f"{platform.lower()}_{job.id[:8]}")
+    return archive